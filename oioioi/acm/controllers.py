@@ -15,7 +15,7 @@ from oioioi.programs.controllers import ProgrammingContestController
 from oioioi.rankings.controllers import DefaultRankingController, \
         CONTEST_RANKING_KEY
 from oioioi.contests.models import SubmissionReport, Submission, \
-        ProblemInstance, UserResultForProblem
+        ProblemInstance, UserResultForProblem, pre_queryset_update
 from oioioi.acm.score import BinaryScore, format_time, ACMScore
 from oioioi.contests.utils import is_contest_admin, is_contest_observer, \
         rounds_times
@@ -27,6 +27,14 @@ from oioioi.participants.utils import is_participant
 IGNORED_STATUSES = ['CE', 'SE', '?']
 
 
+def _ignore_submissions(queryset):
+    """Marks the submissions (sent after an accepted one) as ignored."""
+    values = {'status': 'IGN', 'score': None}
+    pre_queryset_update.send(sender=Submission, queryset=queryset,
+                             values=values)
+    queryset.update(**values)
+
+
 class ACMContestController(ProgrammingContestController):
     description = _("ACM style contest")
     create_forum = False
@@ -56,6 +64,11 @@ class ACMContestController(ProgrammingContestController):
         super(ACMContestController, self). \
                 fill_evaluation_environ(environ, submission)
 
+        # Skipped tests have no outputs, so generating them is not aborted
+        if settings.EARLY_ABORT_EVALUATION \
+                and not environ.get('save_outputs'):
+            environ.setdefault('early_abort', 'submission')
+
     def update_report_statuses(self, submission, queryset):
         self._activate_newest_report(submission, queryset,
             kind=['FULL', 'FAILURE'])
@@ -79,23 +92,32 @@ class ACMContestController(ProgrammingContestController):
                 submission.status = '?'
         submission.save()
 
-    def get_submission_relative_time(self, submission):
-        # FIXME: SIO-1387 RoundTimes shouldn't require request
-        # Workaround by mock Request object
-        class DummyRequest(object):
-            def __init__(self, contest, user):
-                self.contest = contest
-                self.user = user or AnonymousUser()
-
-        rtimes = rounds_times(DummyRequest(self.contest, submission.user or
-                                           AnonymousUser()))
-        round_start = rtimes[submission.problem_instance.round].get_start()
+    def get_submission_relative_time(self, submission, round_start=None):
+        """Returns the number of seconds from the start of the round to
+           the submission.
+
+           ``round_start`` may be passed if it is already known, e.g. when
+           computing many results at once.
+        """
+        if round_start is None:
+            # FIXME: SIO-1387 RoundTimes shouldn't require request
+            # Workaround by mock Request object
+            class DummyRequest(object):
+                def __init__(self, contest, user):
+                    self.contest = contest
+                    self.user = user or AnonymousUser()
+
+            rtimes = rounds_times(DummyRequest(self.contest, submission.user
+                                               or AnonymousUser()))
+            round_start = \
+                    rtimes[submission.problem_instance.round].get_start()
         submission_time = submission.date - round_start
         # Python2.6 does not support submission_time.total_seconds()
         seconds = submission_time.days * 24 * 3600 + submission_time.seconds
         return max(0, seconds)
 
-    def _fill_user_result_for_problem(self, result, pi_submissions):
+    def _fill_user_result_for_problem(self, result, pi_submissions,
+                                      round_start=None):
         if pi_submissions:
             for penalties_count, submission in enumerate(pi_submissions, 1):
                 if submission.status == 'IGN':
@@ -112,7 +134,8 @@ class ACMContestController(ProgrammingContestController):
             score = ACMScore(
                 problems_solved=solved,
                 penalties_count=(penalties_count - solved),
-                time_passed=self.get_submission_relative_time(submission)
+                time_passed=self.get_submission_relative_time(submission,
+                                                              round_start)
             )
             result.score = score
             result.status = submission.status
@@ -138,11 +161,55 @@ class ACMContestController(ProgrammingContestController):
 
             if last_submission.status == 'OK':
                 # FIXME: May not ignore submissions with admin-hacked same-date
-                submissions.filter(date__gt=last_submission.date) \
-                        .update(status='IGN', score=None)
+                to_ignore = submissions.filter(date__gt=last_submission.date)
+                _ignore_submissions(to_ignore)
         else:
             result.submission_report = None
 
+    def update_many_user_results_for_problem(self, problem_instance,
+                                             results):
+        """Computes the results of all the users in a single pass over
+           the submissions to the problem instance, ordered by user and date.
+        """
+        round_start = problem_instance.round.start_date
+        submissions = Submission.objects \
+                .filter(problem_instance=problem_instance,
+                    user__in=[result.user_id for result in results],
+                    kind='NORMAL') \
+                .exclude(status__in=IGNORED_STATUSES) \
+                .order_by('user', 'date')
+        by_user = dict((user_id, list(user_submissions))
+                       for user_id, user_submissions in itertools.groupby(
+                           submissions, attrgetter('user_id')))
+
+        last_submissions = {}
+        to_ignore = []
+        for result in results:
+            user_submissions = by_user.get(result.user_id, [])
+            for submission in user_submissions:
+                submission.problem_instance = problem_instance
+            last_submission = self._fill_user_result_for_problem(
+                    result, user_submissions, round_start)
+            if last_submission:
+                last_submissions[result] = last_submission
+                if last_submission.status == 'OK':
+                    # FIXME: May not ignore submissions with admin-hacked
+                    # same-date
+                    to_ignore.extend(s.id for s in user_submissions
+                                     if s.date > last_submission.date)
+            else:
+                result.submission_report = None
+
+        reports = dict((report.submission_id, report) for report in
+                       SubmissionReport.objects.filter(
+                           submission__in=last_submissions.values(),
+                           status='ACTIVE', kind='FULL'))
+        for result, last_submission in last_submissions.iteritems():
+            result.submission_report = reports[last_submission.id]
+
+        if to_ignore:
+            _ignore_submissions(Submission.objects.filter(id__in=to_ignore))
+
     def results_visible(self, request, submission):
         return False
 
@@ -225,6 +292,10 @@ class ACMRankingController(DefaultRankingController):
     def can_search_for_users(self):
         return False
 
+    def _can_update_incrementally(self, key):
+        # The results may come from before the freeze, see serialize_ranking
+        return False
+
     def _render_ranking_page(self, key, data, page):
         request = self._fake_request(page)
         data['is_admin'] = self.is_admin_key(key)
@@ -258,7 +329,7 @@ class ACMRankingController(DefaultRankingController):
                 .filter(problem_instance__in=pis, user__in=users,
                      kind='NORMAL', date__lt=freeze_time) \
                 .exclude(status__in=IGNORED_STATUSES) \
-                .select_related('user', 'problem_instance') \
+                .select_related('user', 'problem_instance__round') \
                 .order_by('user', 'problem_instance', 'date')
         results = []
         for user, user_submissions in \
@@ -267,7 +338,7 @@ class ACMRankingController(DefaultRankingController):
                     attrgetter('problem_instance')):
                 result = _FakeUserResultForProblem(user, pi)
                 controller._fill_user_result_for_problem(result,
-                    user_pi_submissions)
+                    list(user_pi_submissions), pi.round.start_date)
                 results.append(result)
         return results
 
@@ -1,10 +1,14 @@
 from datetime import datetime
 
+from django.contrib.auth.models import User
 from django.core.urlresolvers import reverse
+from django.test.utils import override_settings
 from django.utils.timezone import utc
 
 from oioioi.base.tests import TestCase, fake_timezone_now
-from oioioi.contests.models import Contest
+from oioioi.contests.models import Contest, ProblemInstance, \
+        UserResultForProblem
+from oioioi.programs.models import ProgramSubmission
 
 # The following tests use full-contest fixture, which may be changed this way:
 # 1. Create new database, do migrate
@@ -110,7 +114,8 @@ class TestACMRanking(TestCase):
         with fake_timezone_now(datetime(2013, 12, 15, 0, 40, tzinfo=utc)):
             response = self.client.get(csv_url)
             self.assertEqual(response.status_code, 200)
-            self.assertEqual(response.content.count('\n'), 4)
+            content = ''.join(response.streaming_content)
+            self.assertEqual(content.count('\n'), 4)
 
             response = self.client.get(url)
             self.assertEqual(response.content.count('data-result_url'), 8)
@@ -133,3 +138,48 @@ class TestACMRanking(TestCase):
     def test_safe_exec_mode(self):
         contest = Contest.objects.get()
         self.assertEqual(contest.controller.get_safe_exec_mode(), 'cpu')
+
+    def test_update_many_user_results(self):
+        contest = Contest.objects.get()
+        users = list(User.objects.all())
+        problem_instances = list(ProblemInstance.objects.all())
+
+        def results():
+            return sorted((r.user_id, r.problem_instance_id,
+                           r.score.serialize() if r.score is not None
+                           else None, r.status, r.submission_report_id)
+                          for r in UserResultForProblem.objects.all())
+
+        for user in users:
+            for pi in problem_instances:
+                contest.controller.update_user_results(user, pi)
+        expected = results()
+        self.assertTrue(any(score for _u, _pi, score, _st, _sr in expected))
+
+        UserResultForProblem.objects.all().delete()
+        contest.controller.update_many_user_results(users, problem_instances)
+        self.assertEqual(results(), expected)
+
+
+class TestACMEarlyAbort(TestCase):
+    fixtures = ['acm_test_full_contest']
+
+    def _fill_environ(self, kind):
+        submission = ProgramSubmission.objects.filter(kind='NORMAL')[0]
+        submission.kind = kind
+        submission.save()
+        environ = {'extra_args': {}}
+        Contest.objects.get().controller \
+                .fill_evaluation_environ(environ, submission)
+        return environ
+
+    @override_settings(EARLY_ABORT_EVALUATION=True)
+    def test_early_abort(self):
+        self.assertEqual(self._fill_environ('NORMAL')['early_abort'],
+                         'submission')
+
+    @override_settings(EARLY_ABORT_EVALUATION=True)
+    def test_user_outs_not_aborted(self):
+        environ = self._fill_environ('USER_OUTS')
+        self.assertTrue(environ['save_outputs'])
+        self.assertNotIn('early_abort', environ)
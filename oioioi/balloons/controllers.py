@@ -3,57 +3,100 @@ from django.db import transaction
 from django.db.models import Q
 
 from oioioi.acm.controllers import ACMContestController
-from oioioi.balloons.models import BalloonDelivery
+from oioioi.balloons.models import BalloonDelivery, FirstSolverState
 from oioioi.contests.models import Submission
 
 
 class BalloonsDeliveryACMControllerMixin(object):
+    """Creates balloon delivery requests for accepted submissions.
+
+       The progress of determining the first solver of every problem
+       instance is kept in :class:`~oioioi.balloons.models.FirstSolverState`,
+       so judging a submission does not require scanning all submissions
+       to the problem.
+    """
+
     def submission_judged(self, submission, rejudged=False):
         super(BalloonsDeliveryACMControllerMixin, self) \
                 .submission_judged(submission, rejudged)
         self._create_balloon_delivery(submission)
 
+    def _balloon_participants(self):
+        return self.registration_controller() \
+                .filter_participants(User.objects.all())
+
+    def _balloon_submissions(self, problem_instance):
+        return Submission.objects.filter(problem_instance=problem_instance,
+                kind='NORMAL', user__in=self._balloon_participants())
+
+    def _is_accepted_for_balloon(self, submission):
+        return submission.status == 'OK' and submission.kind == 'NORMAL' \
+                and self.registration_controller().filter_participants(
+                        User.objects.filter(id=submission.user_id)).exists()
+
+    def _earliest_accepted_submission(self, problem_instance):
+        return self._balloon_submissions(problem_instance) \
+                .filter(status='OK').order_by('date', 'id').first()
+
+    def _is_waiting_for_earlier(self, submission):
+        earlier = Q(date__lt=submission.date) | \
+                Q(date=submission.date, id__lt=submission.id)
+        return self._balloon_submissions(submission.problem_instance) \
+                .filter(earlier, status__in=['?', 'SE']).exists()
+
+    def _create_first_deliveries(self, first_submission):
+        """Creates requests for the first solver and all users who solved
+           the problem while it was being determined.
+        """
+        problem_instance = first_submission.problem_instance
+        BalloonDelivery.objects.get_or_create(user=first_submission.user,
+                problem_instance=problem_instance,
+                defaults={'first_accepted_solution': True})
+        solvers = self._balloon_submissions(problem_instance) \
+                .filter(status='OK') \
+                .exclude(user=first_submission.user_id) \
+                .order_by('date', 'id') \
+                .values_list('user', flat=True)
+        seen = set()
+        for user_id in solvers:
+            if user_id not in seen:
+                seen.add(user_id)
+                BalloonDelivery.objects.get_or_create(user_id=user_id,
+                        problem_instance=problem_instance)
+
     @transaction.atomic
     def _create_balloon_delivery(self, submission):
-        this_problem_instance = \
-            Q(problem_instance=submission.problem_instance)
         if submission.user is None:
             return
-        if BalloonDelivery.objects.filter(this_problem_instance).exists():
-            # First solver has been determined, just create a request if OK.
-            user_qs = User.objects.filter(id=submission.user.id)
-            participant_qs = submission.problem_instance.contest.controller \
-                    .registration_controller().filter_participants(user_qs)
-            if submission.status == 'OK' and submission.kind == 'NORMAL' \
-                    and participant_qs.exists():
-                BalloonDelivery.objects.get_or_create(
-                    user=submission.user,
-                    problem_instance=submission.problem_instance
-                )
-        else:
-            # First solver has not been determined yet.
-            # It may be necessary to wait for some submissions to be judged.
-            accepted_or_unjudged = \
-                    Q(status='OK') | Q(status='?') | Q(status='SE')
-            not_ignored = Q(kind='NORMAL')
-            user_is_participant = Q(user__participant__contest=
-                                    submission.problem_instance.contest_id)
-            submissions = Submission.objects \
-                .filter(accepted_or_unjudged & this_problem_instance
-                        & not_ignored & user_is_participant) \
-                .order_by('date')
-
-            first_not_found = True
-            for submission in submissions:
-                if submission.status in ('?', 'SE'):
-                    if first_not_found:
-                        # We are waiting for this submission to be judged.
-                        break
-                else:
-                    BalloonDelivery.objects.get_or_create(
-                        user=submission.user,
-                        problem_instance=submission.problem_instance,
-                        first_accepted_solution=first_not_found
-                    )
-                    first_not_found = False
+        problem_instance = submission.problem_instance
+        # Locking the state serializes judging of submissions to the problem
+        state, created = FirstSolverState.objects.select_for_update() \
+                .get_or_create(problem_instance=problem_instance)
+        if created:
+            state.first_accepted_submission = \
+                    self._earliest_accepted_submission(problem_instance)
+
+        accepted = self._is_accepted_for_balloon(submission)
+        if state.is_determined:
+            if accepted:
+                BalloonDelivery.objects.get_or_create(user=submission.user,
+                        problem_instance=problem_instance)
+            return
+
+        # First solver has not been determined yet.
+        # It may be necessary to wait for some submissions to be judged.
+        first = state.first_accepted_submission
+        if accepted:
+            if first is None or (submission.date, submission.id) < \
+                    (first.date, first.id):
+                first = submission
+        elif first is not None and first.id == submission.id:
+            # The submission has been rejudged and is no longer accepted
+            first = self._earliest_accepted_submission(problem_instance)
+        state.first_accepted_submission = first
+
+        if first is not None and not self._is_waiting_for_earlier(first):
+            state.is_determined = True
+            self._create_first_deliveries(first)
+        state.save()
 ACMContestController.mix_in(BalloonsDeliveryACMControllerMixin)
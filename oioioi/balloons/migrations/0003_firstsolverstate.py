@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+import django.db.models.deletion
+
+
+def mark_determined_first_solvers(apps, _schema_editor):
+    BalloonDelivery = apps.get_model('balloons', 'BalloonDelivery')
+    FirstSolverState = apps.get_model('balloons', 'FirstSolverState')
+
+    # Deliveries are created only after the first solver is known
+    pi_ids = BalloonDelivery.objects \
+            .values_list('problem_instance_id', flat=True).distinct()
+    FirstSolverState.objects.bulk_create(
+            FirstSolverState(problem_instance_id=pi_id, is_determined=True)
+            for pi_id in pi_ids)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contests', '0007_auto_20161214_1411'),
+        ('balloons', '0002_auto_20141219_1346'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FirstSolverState',
+            fields=[
+                ('problem_instance', models.OneToOneField(related_name='balloons_first_solver', primary_key=True, serialize=False, to='contests.ProblemInstance')),
+                ('is_determined', models.BooleanField(default=False)),
+                ('first_accepted_submission', models.ForeignKey(on_delete=django.db.models.deletion.SET_NULL, to='contests.Submission', null=True)),
+            ],
+        ),
+        migrations.RunPython(mark_determined_first_solvers,
+                             migrations.RunPython.noop),
+    ]
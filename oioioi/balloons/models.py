@@ -2,7 +2,7 @@ from django.db import models
 from django.utils.translation import ugettext_lazy as _
 from django.contrib.auth.models import User
 
-from oioioi.contests.models import ProblemInstance, Contest
+from oioioi.contests.models import ProblemInstance, Contest, Submission
 from oioioi.base.utils import generate_key
 from oioioi.base.utils.color import ColorField
 from oioioi.base.utils.deps import check_django_app_dependencies
@@ -65,6 +65,22 @@ class BalloonDelivery(models.Model):
         }
 
 
+class FirstSolverState(models.Model):
+    """Progress of determining the first solver of a problem instance.
+
+       Until the first solver is known, ``first_accepted_submission``
+       is the earliest accepted submission judged so far. It becomes
+       the first accepted solution once no earlier submission waits for
+       being judged.
+    """
+    problem_instance = models.OneToOneField(ProblemInstance,
+                                   related_name='balloons_first_solver',
+                                   primary_key=True)
+    first_accepted_submission = models.ForeignKey(Submission, null=True,
+                                                  on_delete=models.SET_NULL)
+    is_determined = models.BooleanField(default=False)
+
+
 class BalloonsDeliveryAccessData(models.Model):
     contest = models.OneToOneField(Contest, verbose_name=_("contest"))
     access_key = models.CharField(max_length=16, verbose_name=_("access key"))
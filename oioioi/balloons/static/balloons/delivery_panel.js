@@ -113,7 +113,7 @@ $(function() {
                 }
                 setTimeout(function() {
                     fetchNewDeliveryRequests(fetch_url);
-                }, fetchInterval);
+                }, data.more ? 0 : fetchInterval);
             },
             error: function(jqXHR) {
                 showRequestError(jqXHR.status);
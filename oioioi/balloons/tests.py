@@ -136,10 +136,45 @@ class TestBalloons(TestCase):
         balloon_delivery = BalloonDelivery.objects.get(id=2)
         self._check_delivery(balloon_delivery, user)
 
+    def test_waiting_for_first_solver(self):
+        self.contest.controller_name = \
+            'oioioi.acm.controllers.ACMContestController'
+        self.contest.save()
+        controller = Contest.objects.get().controller
+        users = [User.objects.get(username=username) for username in
+                 ('test_user', 'test_user2', 'test_user3')]
+        for user in users:
+            Participant.objects.create(user=user, contest=self.contest)
+        submissions = [Submission.objects.create(problem_instance=self.pi,
+                user=user, date=datetime(2012, 8, 1, 0, i, tzinfo=utc))
+                for i, user in enumerate(users)]
+
+        def judge(submission, status):
+            submission.status = status
+            submission.save()
+            controller._create_balloon_delivery(submission)
+
+        # The first submission is still being judged
+        judge(submissions[2], 'OK')
+        judge(submissions[1], 'OK')
+        self.assertEqual(BalloonDelivery.objects.count(), 0)
+
+        judge(submissions[0], 'WA')
+        deliveries = BalloonDelivery.objects.all()
+        self.assertEqual(len(deliveries), 2)
+        self._check_delivery(deliveries[0], users[1], True)
+        self._check_delivery(deliveries[1], users[2])
+
+        Submission.objects.create(problem_instance=self.pi, user=users[0])
+        judge(Submission.objects.latest('id'), 'OK')
+        self.assertEqual(BalloonDelivery.objects.count(), 3)
+        self._check_delivery(BalloonDelivery.objects.latest('id'), users[0])
+
     def _check_balloon_requests(self, response, expected_number, all_number):
         response_data = json.loads(response.content)
         self.assertEqual(len(response_data['new_requests']), expected_number)
         self.assertEqual(response_data['new_last_id'], all_number)
+        self.assertFalse(response_data['more'])
         for attr in ['id', 'team', 'problem_name', 'color', 'first_accepted']:
             for balloon_request in response_data['new_requests']:
                 self.assertTrue(attr in balloon_request)
@@ -11,13 +11,18 @@ from django.views.decorators.http import require_POST
 
 from oioioi.base.permissions import enforce_condition, make_request_condition
 from oioioi.base.utils import jsonify
-from oioioi.contests.models import UserResultForProblem, Contest
+from oioioi.contests.models import UserResultForProblem, Contest, \
+    ProblemInstance
 from oioioi.contests.utils import can_enter_contest, contest_exists, \
     is_contest_admin
 from oioioi.balloons.models import BalloonsDisplay, BalloonDelivery, \
     BalloonsDeliveryAccessData, ProblemBalloonsConfig
 
 
+# Maximal number of requests returned by get_new_balloon_requests_view
+NEW_REQUESTS_LIMIT = 10
+
+
 @make_request_condition
 def has_balloons_cookie(request):
     try:
@@ -124,19 +129,30 @@ def balloons_delivery_panel_view(request):
 @jsonify
 @enforce_condition(has_balloons_cookie, login_redirect=False)
 def get_new_balloon_requests_view(request):
+    """Returns the requests created after the one with id ``last_id``.
+
+       The id of the last returned request is the cursor for the next call
+       and ``more`` tells whether there are further requests to fetch
+       right away.
+    """
     try:
         last_id = int(request.GET['last_id'])
     except KeyError:
         raise Http404
-    new_requests = BalloonDelivery.objects.filter(
+    pi_ids = list(ProblemInstance.objects.filter(contest=request.contest)
+                  .values_list('id', flat=True))
+    new_requests = list(BalloonDelivery.objects.filter(
         id__gt=last_id,
-        problem_instance__contest_id=request.contest.id,
+        problem_instance_id__in=pi_ids,
         delivered=False
-    ).select_related('user', 'problem_instance__balloons_config')[:10]
-    response = {'new_last_id': last_id, 'new_requests': []}
+    ).order_by('id').select_related('user',
+            'problem_instance__balloons_config')[:NEW_REQUESTS_LIMIT + 1])
+    more = len(new_requests) > NEW_REQUESTS_LIMIT
+    new_requests = new_requests[:NEW_REQUESTS_LIMIT]
+    response = {'new_last_id': last_id, 'new_requests': [], 'more': more}
     if not new_requests:
         return response
-    response['new_last_id'] = max(r.id for r in new_requests)
+    response['new_last_id'] = new_requests[-1].id
     for delivery in new_requests:
         try:
             balloon_config = delivery.problem_instance.balloons_config
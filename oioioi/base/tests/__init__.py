@@ -37,6 +37,12 @@ class _AssertNumQueriesLessThanContext(CaptureQueriesContext):
 
 class TestCase(DjangoTestCase):
 
+    def _pre_setup(self):
+        # Cached data could refer to objects created by earlier tests,
+        # which have been rolled back.
+        cache.clear()
+        super(TestCase, self)._pre_setup()
+
     # Based on: https://github.com/revsys/django-test-plus/blob/master/test_plus/test.py#L236
     def assertNumQueriesLessThan(self, num, *args, **kwargs):
         func = kwargs.pop('func', None)
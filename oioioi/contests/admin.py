@@ -1,4 +1,5 @@
 from functools import partial
+from operator import attrgetter
 import urllib
 
 from django.conf.urls import patterns
@@ -24,7 +25,8 @@ from oioioi.contests.menu import contest_admin_menu_registry, \
 from oioioi.contests.models import Contest, Round, ProblemInstance, \
         Submission, ContestAttachment, RoundTimeExtension, ContestPermission, \
         submission_kinds, ContestLink, SubmissionReport
-from oioioi.contests.utils import is_contest_admin, is_contest_observer
+from oioioi.contests.utils import is_contest_admin, is_contest_observer, \
+        rejudge_submissions
 from oioioi.contests.current_contest import set_cc_id
 from oioioi.programs.models import Test, TestReport
 from oioioi.problems.models import ProblemSite, ProblemPackage
@@ -479,11 +481,10 @@ class SubmissionAdmin(admin.ModelAdmin):
                 break
 
         if all_reports_exist or rejudge_type == 'FULL':
-            for sub in submissions.values():
-                sub.problem_instance.controller.judge(sub,
-                                 is_rejudge=True,
-                                 extra_args={'tests_to_judge': tests,
-                                             'rejudge_type': rejudge_type})
+            rejudge_submissions(sorted(submissions.values(),
+                                       key=attrgetter('id')),
+                                extra_args={'tests_to_judge': tests,
+                                            'rejudge_type': rejudge_type})
 
             counter = len(submissions)
             self.message_user(
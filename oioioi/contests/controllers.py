@@ -1,9 +1,11 @@
+from collections import defaultdict
 from datetime import timedelta
 import json
 import logging
 import pprint
 
 from django.db import transaction
+from django.db.models import Case, When, Value
 from django.template import RequestContext
 from django.template.loader import render_to_string
 from django.core.exceptions import PermissionDenied, ObjectDoesNotExist
@@ -20,7 +22,7 @@ from oioioi.base.utils import RegisteredSubclassesBase, ObjectWithMixins, \
 from oioioi.contests.models import Submission, Round, UserResultForRound, \
         UserResultForProblem, FailureReport, SubmissionReport, \
         UserResultForContest, submission_kinds, ProblemStatementConfig, \
-        RoundTimeExtension
+        RoundTimeExtension, pre_bulk_save, bulk_saved
 from oioioi.contests.scores import ScoreValue
 from oioioi.contests.models import Contest
 from oioioi.contests.utils import visible_problem_instances, rounds_times, \
@@ -223,6 +225,51 @@ class PublicContestRegistrationController(RegistrationController):
         return [q for q in queryset if q in authors]
 
 
+# Number of rows written by a single query by _bulk_update
+BULK_UPDATE_CHUNK_SIZE = 500
+
+
+def _get_or_create_results(model, user_ids, field, values):
+    """Returns results of the given users for all the values of ``field``
+       (e.g. problem instance ids), locked for update. Missing results are
+       created.
+    """
+    filters = {'user__in': user_ids, field + '__in': values}
+    existing = set(model.objects.select_for_update().filter(**filters)
+                   .values_list('user', field))
+    missing = [model(user_id=user_id, **{field + '_id': value})
+               for user_id in user_ids for value in values
+               if (user_id, value) not in existing]
+    if missing:
+        model.objects.bulk_create(missing)
+        bulk_saved.send(sender=model, instances=missing)
+    return list(model.objects.select_for_update().filter(**filters))
+
+
+def _bulk_update(model, instances, fields):
+    """Saves values of ``fields`` of the instances using a query per chunk
+       of them.
+    """
+    if instances:
+        pre_bulk_save.send(sender=model, instances=instances)
+    fields = [model._meta.get_field(name) for name in fields]
+    for start in xrange(0, len(instances), BULK_UPDATE_CHUNK_SIZE):
+        chunk = instances[start:start + BULK_UPDATE_CHUNK_SIZE]
+        model.objects.filter(pk__in=[instance.pk for instance in chunk]) \
+                .update(**dict((field.attname, Case(*[When(pk=instance.pk,
+                    then=Value(getattr(instance, field.attname),
+                               output_field=field)) for instance in chunk],
+                    output_field=field)) for field in fields))
+    if instances:
+        bulk_saved.send(sender=model, instances=instances)
+
+
+def _result_values(result, attnames):
+    values = [getattr(result, attname) for attname in attnames]
+    return tuple(value.serialize() if isinstance(value, ScoreValue)
+                 else value for value in values)
+
+
 class ContestControllerContext(object):
     def __init__(self, contest, timestamp, is_admin):
         self.contest = contest
@@ -514,6 +561,12 @@ class ContestController(RegisteredSubclassesBase, ObjectWithMixins):
         submission.problem_instance.problem.controller \
             .judge(submission, extra_args, is_rejudge)
 
+    def judge_many(self, submissions, extra_args=None, is_rejudge=False):
+        """Judges many submissions to the same problem instance."""
+        if submissions:
+            submissions[0].problem_instance.problem.controller \
+                .judge_many(submissions, extra_args, is_rejudge)
+
     def fill_evaluation_environ(self, environ, submission):
         pass
 
@@ -578,6 +631,21 @@ class ContestController(RegisteredSubclassesBase, ObjectWithMixins):
         problem = result.problem_instance.problem
         problem.controller.update_user_result_for_problem(result)
 
+    def update_many_user_results_for_problem(self, problem_instance,
+                                             results):
+        """Updates many
+           :class:`~oioioi.contests.models.UserResultForProblem` instances
+           of different users for the same problem instance.
+
+           Controllers may override it to compute the results for all
+           the users at once. The default implementation calls
+           :meth:`update_user_result_for_problem` for every result.
+
+           Saving the ``results`` is a responsibility of the caller.
+        """
+        for result in results:
+            self.update_user_result_for_problem(result)
+
     def _sum_scores(self, scores):
         scores = [s for s in scores if s is not None]
         return scores and sum(scores[1:], scores[0]) or None
@@ -651,6 +719,126 @@ class ContestController(RegisteredSubclassesBase, ObjectWithMixins):
             self.update_user_result_for_contest(result)
             result.save()
 
+    def _overrides(self, method_name):
+        return getattr(type(self), method_name).__func__ is not \
+                getattr(ContestController, method_name).__func__
+
+    def _update_results(self, model, results, update, fields):
+        """Calls ``update`` with the list of ``results`` and saves
+           the changed ones.
+        """
+        attnames = [model._meta.get_field(field).attname for field in fields]
+        old_values = dict((result.pk, _result_values(result, attnames))
+                          for result in results)
+        update(results)
+        _bulk_update(model, [result for result in results
+                             if _result_values(result, attnames)
+                                != old_values[result.pk]],
+                     fields)
+
+    def _sum_scores_by_user(self, results):
+        """Returns a dict mapping pairs ``(user_id, group)`` to sums of
+           the scores (serialized) from the ``results`` triples
+           ``(user_id, group, score)``.
+        """
+        scores = defaultdict(list)
+        for user_id, key, score in results:
+            scores[user_id, key].append(score)
+        return dict((key, self._sum_scores(map(ScoreValue.deserialize,
+                                                 key_scores)))
+                    for key, key_scores in scores.iteritems())
+
+    def update_many_user_results(self, users, problem_instances):
+        """Updates results of many users for many problem instances of
+           the contest, e.g. after a rejudge.
+
+           It is equivalent to calling :meth:`update_user_results` for every
+           pair of a user and a problem instance, but the results for rounds
+           and the contest are computed once for every user, using aggregated
+           queries, and all the results are written with bulk updates
+           (see :data:`~oioioi.contests.models.bulk_saved`).
+
+           Results for problems are computed by
+           :meth:`update_many_user_results_for_problem`. Results for rounds
+           and the contest are computed one by one, if
+           :meth:`update_user_result_for_round` or
+           :meth:`update_user_result_for_contest` is overridden.
+        """
+        users = dict((user.id, user) for user in users)
+        problem_instances = dict((pi.id, pi) for pi in problem_instances)
+        if not users or not problem_instances:
+            return
+        user_ids = list(users)
+        round_ids = list(set(pi.round_id
+                             for pi in problem_instances.itervalues()))
+
+        # The transactions are separated for the same reasons as in
+        # update_user_results.
+
+        # First: UserResultForProblem
+        def update_problem_results(results):
+            by_problem_instance = defaultdict(list)
+            for result in results:
+                result.user = users[result.user_id]
+                result.problem_instance = \
+                        problem_instances[result.problem_instance_id]
+                by_problem_instance[result.problem_instance].append(result)
+            for pi, pi_results in by_problem_instance.iteritems():
+                self.update_many_user_results_for_problem(pi, pi_results)
+
+        with transaction.atomic():
+            results = _get_or_create_results(UserResultForProblem, user_ids,
+                    'problem_instance', list(problem_instances))
+            self._update_results(UserResultForProblem, results,
+                    update_problem_results,
+                    ['score', 'status', 'submission_report'])
+
+        # Second: UserResultForRound
+        if self._overrides('update_user_result_for_round'):
+            def update_round_result(result):
+                result.user = users[result.user_id]
+                self.update_user_result_for_round(result)
+        else:
+            round_scores = self._sum_scores_by_user(
+                    UserResultForProblem.objects
+                    .filter(user__in=user_ids,
+                            problem_instance__round__in=round_ids)
+                    .values_list('user', 'problem_instance__round', 'score'))
+
+            def update_round_result(result):
+                result.score = round_scores.get(
+                        (result.user_id, result.round_id))
+
+        with transaction.atomic():
+            results = _get_or_create_results(UserResultForRound, user_ids,
+                    'round', round_ids)
+            self._update_results(UserResultForRound, results,
+                    lambda results: map(update_round_result, results),
+                    ['score'])
+
+        # Third: UserResultForContest
+        if self._overrides('update_user_result_for_contest'):
+            def update_contest_result(result):
+                result.user = users[result.user_id]
+                self.update_user_result_for_contest(result)
+        else:
+            contest_scores = self._sum_scores_by_user(
+                    UserResultForRound.objects
+                    .filter(user__in=user_ids, round__contest=self.contest,
+                            round__is_trial=False)
+                    .values_list('user', 'round__contest', 'score'))
+
+            def update_contest_result(result):
+                result.score = contest_scores.get(
+                        (result.user_id, result.contest_id))
+
+        with transaction.atomic():
+            results = _get_or_create_results(UserResultForContest, user_ids,
+                    'contest', [self.contest.id])
+            self._update_results(UserResultForContest, results,
+                    lambda results: map(update_contest_result, results),
+                    ['score'])
+
     def filter_my_visible_submissions(self, request, queryset):
         """Returns the submissions which the user should see in the
            "My submissions" view.
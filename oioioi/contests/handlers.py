@@ -4,11 +4,16 @@ import traceback
 import pprint
 import socket
 import time
+from collections import defaultdict
 from smtplib import SMTPException
+from celery.task import task
+from django.conf import settings
+from django.core.cache import cache
+from django.contrib.auth.models import User
 from django.core.mail import mail_admins
 from django.db import transaction
 from oioioi.contests.models import Contest, ProblemInstance, Submission, \
-        SubmissionReport, FailureReport
+        SubmissionReport, FailureReport, PendingUserResult
 
 logger = logging.getLogger(__name__)
 
@@ -64,11 +69,73 @@ def update_user_results(env, **kwargs):
             assert 'round_id' not in env
             assert 'contest_id' not in env
 
+    if contest is not None and \
+            env.get('extra_args', {}).get('update_results_in_bulk'):
+        defer_user_results_update(user, problem_instance)
+        return env
+
     problem_instance.controller.update_user_results(user, problem_instance)
 
     return env
 
 
+_PENDING_RESULTS_SCHEDULED_KEY = 'contests/pending_user_results_scheduled'
+
+
+def defer_user_results_update(user, problem_instance):
+    """Marks the result of the user for the contest problem instance
+       as pending. Pending results are updated in bulk by
+       :func:`update_pending_user_results`, run at most
+       ``settings.PENDING_USER_RESULTS_DELAY`` seconds later.
+    """
+    PendingUserResult.objects.get_or_create(user=user,
+                                            problem_instance=problem_instance)
+    delay = settings.PENDING_USER_RESULTS_DELAY
+    # The key is removed when the scheduled update starts, so any result
+    # marked as pending is either seen by it or schedules another one.
+    if cache.add(_PENDING_RESULTS_SCHEDULED_KEY, True, delay):
+        update_pending_user_results.apply_async(countdown=delay)
+
+
+@task(ignore_result=True)
+def update_pending_user_results():
+    """Updates all the pending results (see
+       :func:`defer_user_results_update`) with
+       :meth:`~oioioi.contests.controllers.ContestController.update_many_user_results`,
+       called once for every problem instance.
+    """
+    cache.delete(_PENDING_RESULTS_SCHEDULED_KEY)
+    # The rows are deleted before updating the results, so that results
+    # changed in the meantime are marked as pending again.
+    with transaction.atomic():
+        pending = list(PendingUserResult.objects.select_for_update()
+                       .values_list('id', 'user_id', 'problem_instance_id'))
+        PendingUserResult.objects.filter(
+                id__in=[pending_id for pending_id, _u, _pi in pending]) \
+                .delete()
+
+    user_ids = defaultdict(set)
+    for _id, user_id, pi_id in pending:
+        user_ids[pi_id].add(user_id)
+    problem_instances = ProblemInstance.objects \
+            .select_related('contest').in_bulk(list(user_ids))
+    users = User.objects.in_bulk(list(set(user_id for _id, user_id, _pi
+                                          in pending)))
+    for pi_id, pi_user_ids in user_ids.iteritems():
+        pi = problem_instances.get(pi_id)
+        if pi is None or pi.contest is None:
+            continue
+        try:
+            pi.contest.controller.update_many_user_results(
+                    [users[user_id] for user_id in pi_user_ids
+                     if user_id in users], [pi])
+        except Exception:
+            for user_id in pi_user_ids:
+                PendingUserResult.objects.get_or_create(user_id=user_id,
+                                                        problem_instance=pi)
+            raise
+
+
 @transaction.atomic
 def call_submission_judged(env, **kwargs):
     submission = Submission.objects.get(id=env['submission_id'])
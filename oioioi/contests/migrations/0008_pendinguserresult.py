@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+from django.conf import settings
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('contests', '0007_auto_20161214_1411'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PendingUserResult',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('problem_instance', models.ForeignKey(to='contests.ProblemInstance')),
+                ('user', models.ForeignKey(to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='pendinguserresult',
+            unique_together=set([('user', 'problem_instance')]),
+        ),
+    ]
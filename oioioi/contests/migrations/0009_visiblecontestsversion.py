@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+import uuid
+
+from django.db import migrations, models
+
+
+def create_version(apps, _schema_editor):
+    VisibleContestsVersion = apps.get_model('contests',
+                                            'VisibleContestsVersion')
+    VisibleContestsVersion.objects.create(id=1, token=uuid.uuid4().hex)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contests', '0008_pendinguserresult'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VisibleContestsVersion',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('token', models.CharField(max_length=32)),
+            ],
+        ),
+        migrations.RunPython(create_version, migrations.RunPython.noop),
+    ]
@@ -1,13 +1,14 @@
 import itertools
 import os.path
+import uuid
 
 from django.conf import settings
 from django.contrib.auth.models import User
 from django.core.exceptions import ValidationError
 from django.db import models
 from django.db.models import Max
-from django.db.models.signals import pre_save, post_save
-from django.dispatch import receiver
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver, Signal
 from django.utils import timezone
 from django.utils.module_loading import import_string
 from django.utils.text import get_valid_filename
@@ -409,6 +410,23 @@ class FailureReport(models.Model):
     json_environ = models.TextField()
 
 
+#: Sent before existing instances of a model are updated in bulk (e.g. by
+#: :meth:`~oioioi.contests.controllers.ContestController.update_many_user_results`),
+#: which doesn't send ``pre_save``. The ``instances`` argument is a list of
+#: the instances with the new values set, but not saved yet.
+pre_bulk_save = Signal(providing_args=['instances'])
+
+#: Sent after instances of a model are created or updated in bulk (e.g. by
+#: :meth:`~oioioi.contests.controllers.ContestController.update_many_user_results`),
+#: which doesn't send ``post_save``. The ``instances`` argument is a list of
+#: the saved instances.
+bulk_saved = Signal(providing_args=['instances'])
+
+#: Sent before ``queryset.update(**values)`` is run on a queryset of
+#: the model, which doesn't send any signals for the updated instances.
+pre_queryset_update = Signal(providing_args=['queryset', 'values'])
+
+
 class UserResultForProblem(models.Model):
     """User result (score) for the problem.
 
@@ -453,6 +471,18 @@ class UserResultForContest(models.Model):
         unique_together = ('user', 'contest')
 
 
+class PendingUserResult(models.Model):
+    """A result of a user for a problem instance, which has to be updated
+       after a rejudge, together with other pending results (see
+       :func:`~oioioi.contests.handlers.update_pending_user_results`).
+    """
+    user = models.ForeignKey(User)
+    problem_instance = models.ForeignKey(ProblemInstance)
+
+    class Meta(object):
+        unique_together = ('user', 'problem_instance')
+
+
 class RoundTimeExtension(models.Model):
     """Represents the time the round has been extended by for a certain user.
 
@@ -491,6 +521,46 @@ class ContestPermission(models.Model):
         return u'%s/%s: %s' % (self.contest, self.permission, self.user)
 
 
+class VisibleContestsVersion(models.Model):
+    """A random token, which is changed together with the data determining
+       the contests visible to users. It is used in cache keys by
+       :func:`oioioi.contests.utils.visible_contests`.
+
+       The token is kept in the database, so that it changes only when the
+       transaction changing the data is committed. A new random token is used
+       every time, so that entries cached by a transaction which is rolled
+       back are never used.
+    """
+    token = models.CharField(max_length=32)
+
+
+def visible_contests_version():
+    """Returns the version of the data which determines the contests visible
+       to users (see :class:`VisibleContestsVersion`).
+    """
+    return VisibleContestsVersion.objects.filter(id=1) \
+            .values_list('token', flat=True).first() or ''
+
+
+def invalidate_visible_contests():
+    """Invalidates cached sets of contests visible to users.
+
+       It should be called when data used by
+       :meth:`~oioioi.contests.controllers.RegistrationController.filter_visible_contests`
+       or contests' registration controllers are changed.
+    """
+    VisibleContestsVersion.objects.update_or_create(id=1,
+            defaults={'token': uuid.uuid4().hex})
+
+
+@receiver(post_save, sender=Contest)
+@receiver(post_delete, sender=Contest)
+@receiver(post_save, sender=ContestPermission)
+@receiver(post_delete, sender=ContestPermission)
+def _invalidate_visible_contests(sender, **kwargs):
+    invalidate_visible_contests()
+
+
 class ContestView(models.Model):
     user = models.ForeignKey(User)
     contest = models.ForeignKey(Contest)
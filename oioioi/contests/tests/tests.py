@@ -2,6 +2,8 @@
 from datetime import datetime
 from functools import partial
 from django.core import mail
+from django.core.cache import cache
+from django.db import transaction
 from collections import defaultdict
 
 from django.test import RequestFactory
@@ -14,6 +16,7 @@ from django.core.files.base import ContentFile
 from django.utils.timezone import utc, LocalTimezone
 from django.contrib.auth.models import User, AnonymousUser
 from django.contrib.admin.utils import quote
+from mock import patch
 from nose.tools import nottest
 
 from oioioi.base.tests import TestCase, check_not_accessible, fake_time, \
@@ -21,13 +24,17 @@ from oioioi.base.tests import TestCase, check_not_accessible, fake_time, \
 from oioioi.contests.models import Contest, Round, ProblemInstance, \
         UserResultForContest, Submission, ContestAttachment, \
         RoundTimeExtension, ContestPermission, UserResultForProblem, \
-        ContestView, ContestLink, ProblemStatementConfig
+        ContestView, ContestLink, ProblemStatementConfig, \
+        UserResultForRound, PendingUserResult
+from oioioi.contests import handlers
+from oioioi.contests.handlers import update_user_results, \
+        update_pending_user_results
 from oioioi.contests.scores import IntegerScore
 from oioioi.contests.date_registration import date_registry
 from oioioi.contests.utils import is_contest_admin, is_contest_observer, \
         can_enter_contest, rounds_times, can_see_personal_data, \
         administered_contests, all_public_results_visible, \
-        all_non_trial_public_results_visible
+        all_non_trial_public_results_visible, visible_contests
 from oioioi.contests.current_contest import ContestMode
 from oioioi.contests.tests import SubmitFileMixin
 from oioioi.filetracker.tests import TestStreamingMixin
@@ -1877,6 +1884,134 @@ class TestAdministeredContests(TestCase):
         self.assertEquals(len(administered), 2)
 
 
+class TestUpdateManyUserResults(TestCase):
+    fixtures = ['test_users', 'test_contest', 'test_full_package',
+            'test_problem_instance', 'test_submission']
+
+    def _results(self):
+        def values(model, field):
+            return sorted((r.user_id, getattr(r, field + '_id'),
+                           r.score.serialize() if r.score is not None
+                           else None)
+                          for r in model.objects.all())
+        return [values(UserResultForProblem, 'problem_instance'),
+                values(UserResultForRound, 'round'),
+                values(UserResultForContest, 'contest')]
+
+    def _clear_results(self):
+        for model in (UserResultForProblem, UserResultForRound,
+                      UserResultForContest):
+            model.objects.all().delete()
+
+    def test_update_many_user_results(self):
+        contest = Contest.objects.get()
+        users = list(User.objects.all())
+        problem_instances = list(ProblemInstance.objects.all())
+
+        self._clear_results()
+        for user in users:
+            for pi in problem_instances:
+                contest.controller.update_user_results(user, pi)
+        expected = self._results()
+        self.assertTrue(any(score for _u, _x, score in expected[2]))
+
+        self._clear_results()
+        contest.controller.update_many_user_results(users,
+                                                    problem_instances)
+        self.assertEqual(self._results(), expected)
+
+        # Recomputing up to date results changes nothing
+        contest.controller.update_many_user_results(users,
+                                                    problem_instances)
+        self.assertEqual(self._results(), expected)
+
+    def test_rejudge_updates_results_in_bulk(self):
+        contest = Contest.objects.get()
+        env = {'submission_id': 1, 'problem_instance_id': 1, 'round_id': 1,
+               'contest_id': contest.id,
+               'extra_args': {'update_results_in_bulk': True}}
+        self._clear_results()
+        update_user_results(dict(env, extra_args={}))
+        expected = self._results()
+
+        self._clear_results()
+        # Pretend that an update of pending results is already scheduled
+        cache.set(handlers._PENDING_RESULTS_SCHEDULED_KEY, True)
+        try:
+            update_user_results(dict(env))
+            update_user_results(dict(env))
+        finally:
+            cache.delete(handlers._PENDING_RESULTS_SCHEDULED_KEY)
+        self.assertEqual(PendingUserResult.objects.count(), 1)
+        self.assertEqual(self._results(), [[], [], []])
+
+        controller_class = contest.controller.__class__
+        with patch.object(controller_class, 'update_many_user_results',
+                autospec=True,
+                side_effect=controller_class.update_many_user_results) \
+                as update_many:
+            update_pending_user_results()
+        self.assertEqual(update_many.call_count, 1)
+        self.assertEqual(PendingUserResult.objects.count(), 0)
+        self.assertEqual(self._results(), expected)
+
+        # With no update scheduled, one is run right away by the eager
+        # celery used in tests
+        self._clear_results()
+        update_user_results(dict(env))
+        self.assertEqual(PendingUserResult.objects.count(), 0)
+        self.assertEqual(self._results(), expected)
+
+
+class TestVisibleContests(TestCase):
+    fixtures = ['test_two_empty_contests', 'test_users']
+
+    def _request(self, user):
+        request = RequestFactory().request()
+        request.user = user
+        return request
+
+    def test_visible_contests_cache(self):
+        user = User.objects.get(username='test_user')
+        invisible_contest = Contest(id='invisible', name='Invisible Contest',
+            controller_name='oioioi.contests.tests.PrivateContestController')
+        invisible_contest.save()
+
+        visible = visible_contests(self._request(user))
+        self.assertEqual(set(c.id for c in visible), set(['c1', 'c2']))
+
+        # Cached sets of ids are used by subsequent requests, only the
+        # version and the contests are loaded
+        with self.assertNumQueries(2):
+            visible = visible_contests(self._request(user))
+        self.assertEqual(len(visible), 2)
+
+        ContestPermission(user=user, contest=invisible_contest,
+                permission='contests.contest_admin').save()
+        user = User.objects.get(username='test_user')
+        visible = visible_contests(self._request(user))
+        self.assertEqual(set(c.id for c in visible),
+                         set(['c1', 'c2', 'invisible']))
+
+        invisible_contest.delete()
+        visible = visible_contests(self._request(user))
+        self.assertEqual(set(c.id for c in visible), set(['c1', 'c2']))
+
+        anonymous = visible_contests(self._request(AnonymousUser()))
+        self.assertEqual(set(c.id for c in anonymous), set(['c1', 'c2']))
+
+    def test_rolled_back_changes_not_cached(self):
+        user = User.objects.get(username='test_user')
+        visible_contests(self._request(user))
+        with transaction.atomic():
+            Contest.objects.get(id='c2').delete()
+            visible = visible_contests(self._request(user))
+            self.assertEqual(set(c.id for c in visible), set(['c1']))
+            transaction.set_rollback(True)
+        visible = visible_contests(self._request(user))
+        self.assertEqual(set(c.id for c in visible), set(['c1', 'c2']))
+
+
 @override_settings(CONTEST_MODE=ContestMode.neutral)
 class TestSubmissionAdminWithoutContest(TestCase, SubmitFileMixin):
     fixtures = ['test_extra_contests', 'test_users', 'test_full_package',
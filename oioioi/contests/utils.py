@@ -1,9 +1,12 @@
+from django.conf import settings
+from django.core.cache import cache
 from django.core.exceptions import PermissionDenied
 from django.shortcuts import get_object_or_404
 from django.http import HttpRequest
+from django.utils.module_loading import import_string
 from oioioi.base.permissions import make_request_condition
 from oioioi.contests.models import Contest, Round, ProblemInstance, \
-        Submission, RoundTimeExtension
+        Submission, RoundTimeExtension, visible_contests_version
 from oioioi.base.utils import request_cached
 from datetime import timedelta
 from collections import defaultdict
@@ -191,15 +194,41 @@ def visible_rounds(request):
 
 
 def aggregate_statuses(statuses):
-    """Returns first unsuccessful status or 'OK' if all are successful"""
+    """Returns first unsuccessful status or 'OK' if all are successful.
+
+       The ``SKIP`` status of tests not run after an earlier failure
+       is returned only if there are no other failures.
+    """
 
     failures = [s for s in statuses if s != 'OK']
+    failures.sort(key=lambda s: s == 'SKIP')
     if failures:
         return failures[0]
     else:
         return 'OK'
 
 
+def rejudge_submissions(submissions, extra_args=None):
+    """Rejudges the given submissions.
+
+       The submissions are passed to the controllers grouped by problem
+       instances (see
+       :meth:`~oioioi.problems.controllers.ProblemController.judge_many`),
+       so that the data shared by submissions to the same problem instance
+       is loaded only once. The results of the users are updated in bulk
+       after the rejudge (see
+       :func:`~oioioi.contests.handlers.update_pending_user_results`).
+    """
+    extra_args = dict(extra_args or {}, update_results_in_bulk=True)
+    by_problem_instance = defaultdict(list)
+    for submission in submissions:
+        by_problem_instance[submission.problem_instance_id] \
+                .append(submission)
+    for pi_submissions in by_problem_instance.itervalues():
+        pi_submissions[0].problem_instance.controller.judge_many(
+                pi_submissions, extra_args, is_rejudge=True)
+
+
 def contests_by_registration_controller():
     """Returns a mapping from RegistrationController class to contest ids.
 
@@ -208,16 +237,34 @@ def contests_by_registration_controller():
        RegistrationController subclasses to operate on contest querysets
        and filter many of them at once.
 
+       The mapping is cached and invalidated together with visible contests
+       (see :func:`~oioioi.contests.models.invalidate_visible_contests`).
+
        :rtype: :class:`~collections.defaultdict` containing `set` objects
     """
+    cache_key = 'contests/registration_controllers/%s' \
+            % visible_contests_version()
+    # Classes with mixins are created dynamically, so dotted names of
+    # the classes without mixins are cached.
+    rc_names = cache.get(cache_key)
+    if rc_names is None:
+        rc_names = defaultdict(set)
+        for contest in Contest.objects.all():
+            rc_class = contest.controller.registration_controller() \
+                    .__class__.__unmixed_class__
+            rc_names['%s.%s' % (rc_class.__module__, rc_class.__name__)] \
+                    .add(contest.id)
+        rc_names = dict(rc_names)
+        cache.set(cache_key, rc_names,
+                  settings.VISIBLE_CONTESTS_CACHE_TIMEOUT)
+
     rcontrollers = defaultdict(set)
-    for contest in Contest.objects.all():
-        rc = contest.controller.registration_controller()
-        rcontrollers[rc.__class__].add(contest.id)
+    for rc_name, contest_ids in rc_names.iteritems():
+        rcontrollers[import_string(rc_name)._get_mx_class()] |= contest_ids
     return rcontrollers
 
-@request_cached
-def visible_contests(request):
+
+def _visible_contest_ids(request):
     visible = set()
     rc_mapping = contests_by_registration_controller()
     for rcontroller, contest_ids in rc_mapping.iteritems():
@@ -226,11 +273,31 @@ def visible_contests(request):
         # query, however it turns out, that it results in so big and complex
         # WHERE clauses that Postgres doesn't even attempt to optimize it
         # (which means ~100x longer execution times).
-        filtered = set(rcontroller.filter_visible_contests(request, contests))
-        visible = visible | filtered
+        filtered = rcontroller.filter_visible_contests(request, contests)
+        visible |= set(contest.id for contest in filtered)
     return visible
 
 
+@request_cached
+def visible_contests(request):
+    """Returns the set of contests the user can enter.
+
+       Ids of the contests are cached for each user and invalidated when
+       contests, permissions or registrations are changed (see
+       :func:`~oioioi.contests.models.invalidate_visible_contests`).
+    """
+    user = request.user
+    cache_key = 'contests/visible_contests/%s/%s/%d/%d' % (
+            visible_contests_version(), user.id, user.is_superuser,
+            user.is_active)
+    contest_ids = cache.get(cache_key)
+    if contest_ids is None:
+        contest_ids = _visible_contest_ids(request)
+        cache.set(cache_key, contest_ids,
+                  settings.VISIBLE_CONTESTS_CACHE_TIMEOUT)
+    return set(Contest.objects.filter(id__in=contest_ids))
+
+
 @request_cached
 def administered_contests(request):
     """Returns a list of contests for which the logged
@@ -33,7 +33,8 @@ from oioioi.contests.processors import recent_contests
 from oioioi.contests.utils import visible_contests, can_enter_contest, \
         can_see_personal_data, is_contest_admin, has_any_submittable_problem, \
         visible_rounds, visible_problem_instances, contest_exists, \
-        is_contest_observer, get_submission_or_error, can_admin_contest
+        is_contest_observer, get_submission_or_error, can_admin_contest, \
+        rejudge_submissions
 from oioioi.filetracker.utils import stream_file
 from oioioi.problems.models import ProblemStatement, ProblemAttachment
 from oioioi.problems.utils import query_statement, query_zip, \
@@ -128,34 +129,37 @@ def problem_statement_view(request, problem_instance):
     return stream_file(statement.content, statement.download_name)
 
 
+def _get_zip_statement(request, problem_instance, statement_id):
+    controller = request.contest.controller
+    pi = get_object_or_404(ProblemInstance, round__contest=request.contest,
+            short_name=problem_instance)
+    statement = get_object_or_404(ProblemStatement.objects
+        .select_related('problem'), problem__probleminstance=pi,
+        id=statement_id)
+
+    if not controller.can_see_problem(request, pi) or \
+            not controller.can_see_statement(request, pi):
+        raise PermissionDenied
+
+    return statement
+
+
 @enforce_condition(contest_exists & can_enter_contest)
 def problem_statement_zip_index_view(request, problem_instance,
         statement_id):
-
-    response = problem_statement_zip_view(request,
-            problem_instance, statement_id, 'index.html')
-
-    problem_statement = get_object_or_404(ProblemStatement, id=statement_id)
+    statement = _get_zip_statement(request, problem_instance, statement_id)
+    response = query_zip(statement, 'index.html')
 
     return TemplateResponse(request, 'contests/html_statement.html',
             {'content': mark_safe(response.content),
-             'problem_name': problem_statement.problem.name})
+             'problem_name': statement.problem.name})
 
 
 @enforce_condition(contest_exists & can_enter_contest)
 def problem_statement_zip_view(request, problem_instance,
         statement_id, path):
-    controller = request.contest.controller
-    pi = get_object_or_404(ProblemInstance, round__contest=request.contest,
-            short_name=problem_instance)
-    statement = get_object_or_404(ProblemStatement,
-        problem__probleminstance=pi, id=statement_id)
-
-    if not controller.can_see_problem(request, pi) or \
-            not controller.can_see_statement(request, pi):
-        raise PermissionDenied
-
-    return query_zip(statement, path)
+    statement = _get_zip_statement(request, problem_instance, statement_id)
+    return query_zip(statement, path, request)
 
 
 @menu_registry.register_decorator(_("Submit"), lambda request:
@@ -383,9 +387,8 @@ def rejudge_all_submissions_for_problem_view(request, problem_instance_id):
                                          id=problem_instance_id)
     count = problem_instance.submission_set.count()
     if request.POST:
-        for submission in problem_instance.submission_set.all():
-            problem_instance.controller.judge(submission, request.GET.dict(),
-                                              is_rejudge=True)
+        rejudge_submissions(problem_instance.submission_set.all(),
+                            request.GET.dict())
         messages.info(request,
                       ungettext_lazy("%(count)d rejudge request received.",
                       "%(count)d rejudge requests reveived.",
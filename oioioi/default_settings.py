@@ -13,7 +13,7 @@ djcelery.setup_loader()
 import oioioi
 from oioioi.contests.current_contest import ContestMode
 
-INSTALLATION_CONFIG_VERSION = 10
+INSTALLATION_CONFIG_VERSION = 11
 
 DEBUG = False
 TEMPLATE_DEBUG = DEBUG
@@ -93,6 +93,19 @@ PROBLEMSET_LINK_VISIBLE = True
 
 PROBLEM_TAGS_VISIBLE = False
 
+# Search results in the problemset are cached for that long. They are
+# invalidated anyway, when problems or their tags are changed.
+PROBLEMSET_SEARCH_CACHE_TIMEOUT = 600  # seconds
+
+# Results of model solutions shown to problem admins are cached for that
+# long. They are invalidated anyway, when the solutions are rejudged.
+MODEL_SOLUTIONS_CACHE_TIMEOUT = 24 * 60 * 60  # seconds
+
+# HTML statements (ZIP archives) are extracted into this directory, once
+# for every version of a statement file. It may be cleaned at any time.
+STATEMENT_ZIP_CACHE_DIR = os.path.join(tempfile.gettempdir(),
+                                       'oioioi-statements')
+
 EVERYBODY_CAN_ADD_TO_PROBLEMSET = False
 
 TEMPLATE_CONTEXT_PROCESSORS = (
@@ -223,6 +236,12 @@ NOSE_ARGS = (
 )
 
 SIOWORKERS_BACKEND = 'oioioi.sioworkers.backends.CeleryBackend'
+
+# Number of processes used by LocalBackend to run independent jobs
+# (e.g. tests of a single submission) in parallel. With 1, all jobs are run
+# one after another in the evaluating process.
+SIOWORKERS_LOCAL_CONCURRENCY = 1
+
 FILETRACKER_CLIENT_FACTORY = 'oioioi.filetracker.client.media_root_factory'
 DEFAULT_FILE_STORAGE = 'oioioi.filetracker.storage.FiletrackerStorage'
 
@@ -272,6 +291,10 @@ USE_UNSAFE_CHECKER = True
 # execution (in a sandboxed environment, if USE_UNSAFE_EXEC is set to False).
 USE_SINOLPACK_MAKEFILES = True
 
+# Number of test files uploaded to Filetracker at the same time, when
+# a sinolpack package is processed.
+SINOLPACK_UPLOAD_CONCURRENCY = 8
+
 # Scorers below are used for judging submissions without contests,
 # eg. submitting to problems from problemset.
 DEFAULT_TEST_SCORER = \
@@ -281,6 +304,15 @@ DEFAULT_GROUP_SCORER = \
 DEFAULT_SCORE_AGGREGATOR = \
     'oioioi.programs.utils.sum_score_aggregator'
 
+# Whether the tests should be run in waves, so that tests which cannot change
+# the result are not run at all (but reported as skipped). It's used for ACM
+# contests (after a failed test) and for groups scored with
+# min_group_scorer (after a failed test in the group).
+EARLY_ABORT_EVALUATION = False
+# Number of tests of a group run in the first wave. Next waves are
+# twice as big as the previous ones.
+EARLY_ABORT_FIRST_WAVE_SIZE = 2
+
 # Upper bounds for tests' time [ms] and memory [KiB] limits.
 MAX_TEST_TIME_LIMIT_PER_PROBLEM = 1000 * 60 * 60 * 30
 MAX_MEMORY_LIMIT_FOR_TEST = 256 * 1024
@@ -362,17 +394,42 @@ CELERY_IMPORTS += [
     'oioioi.evalmgr',
     'oioioi.problems.unpackmgr',
     'oioioi.prizes.models',
+    'oioioi.oireports.models',
+    'oioioi.sioworkers.backends',
+    'oioioi.contests.handlers',
 ]
 
 CELERY_ROUTES.update({
     'oioioi.evalmgr.evalmgr_job': dict(queue='evalmgr'),
     'oioioi.problems.unpackmgr.unpackmgr_job': dict(queue='unpackmgr'),
     'oioioi.prizes.models.prizesmgr_job': dict(queue='prizesmgr'),
+    'oioioi.oireports.models.reportsmgr_job': dict(queue='reportsmgr'),
+    # Resuming the evaluation after the sioworkers jobs are done
+    'oioioi.sioworkers.backends.celery_jobs_finished':
+        dict(queue='evalmgr'),
+    'oioioi.sioworkers.backends.celery_jobs_failed': dict(queue='evalmgr'),
+    'oioioi.contests.handlers.update_pending_user_results':
+        dict(queue='evalmgr'),
 })
+CELERY_ROUTES = ('oioioi.sioworkers.routers.ChordUnlockRouter',
+                 CELERY_ROUTES)
 
 # Number of concurrently evaluated submissions
 EVALMGR_CONCURRENCY = 1
 
+# Evaluation phases taking longer than that many seconds are logged
+# as warnings (by the ``oioioi.evalmgr.timing`` logger)
+EVALMGR_SLOW_PHASE_THRESHOLD = 10
+
+# Results of users affected by a rejudge are updated in bulk, at most that
+# many seconds after the evaluation of a rejudged submission is finished
+PENDING_USER_RESULTS_DELAY = 5
+
+# Lengths (in seconds) of the periods, for which statistics of the
+# evaluation queue (throughput, average waiting time) are reported
+# by the submitsqueue module
+SUBMITSQUEUE_STATS_WINDOWS = [60, 300, 900]
+
 # Number of concurrently processed problem packages
 UNPACKMGR_CONCURRENCY = 1
 
@@ -423,11 +480,32 @@ CACHES = {
     }
 }
 
+# Sets of contests visible to users (and the registration controllers
+# of contests) are cached for that long. They are invalidated anyway, when
+# contests, permissions or participants are changed.
+VISIBLE_CONTESTS_CACHE_TIMEOUT = 600  # seconds
+
 # Ranking
 RANKINGSD_POLLING_INTERVAL = 0.5  # seconds
+# Number of rankingsd worker processes
+RANKINGSD_CONCURRENCY = 1
+# Maximum number of rankings of a single contest recalculated at the same
+# time, so that a big contest doesn't starve the other ones (0 - no limit)
+RANKINGSD_MAX_WORKERS_PER_CONTEST = 1
+# Rankings viewed during that period are recalculated before the other ones
+RANKING_VIEW_PRIORITY_PERIOD = 300  # seconds
+# A recalculation running longer than that is considered abandoned
+# (e.g. its worker has been killed) and the ranking may be claimed again
+RANKING_RECALC_TIMEOUT = 3600  # seconds
 RANKING_COOLDOWN_FACTOR = 2  # seconds
 RANKING_MIN_COOLDOWN = 5  # seconds
 RANKING_MAX_COOLDOWN = 100  # seconds
+# Rankings with results of at most that many users changed since the last
+# recalculation are patched instead of being rebuilt from scratch.
+RANKING_MAX_INCREMENTAL_USERS = 100
+# Rendered ranking pages are cached for that long. They are invalidated
+# anyway, when the ranking is recalculated.
+RANKING_PAGE_CACHE_TIMEOUT = 3600  # seconds
 
 # Notifications configuration (client)
 # This one is for JavaScript socket.io client.
@@ -478,3 +556,16 @@ MAINTENANCE_MODE_IGNORE_URLS = [
 # Domain to use for serving IP to hostname mappings
 # using ./manage.py ipauth-dnsserver
 IPAUTH_DNSSERVER_DOMAIN = None
+
+# Submissions archive export (exportszu)
+# Number of source files downloaded from Filetracker at the same time
+EXPORTSZU_DOWNLOAD_CONCURRENCY = 8
+
+# Printing reports (oireports)
+# Number of source files downloaded from Filetracker at the same time
+OIREPORTS_DOWNLOAD_CONCURRENCY = 8
+# Number of users in a single PDF file of a report. Reports of more users
+# are split into a few PDF files, which are downloaded as a ZIP archive.
+OIREPORTS_PDF_CHUNK_SIZE = 200
+# Number of pdflatex processes run at the same time for a single report
+OIREPORTS_PDF_CONCURRENCY = 2
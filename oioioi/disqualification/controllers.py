@@ -240,14 +240,26 @@ class WithDisqualificationRankingControllerMixin(object):
             return data
         return self._annotate_disqualified(key, data)
 
+    def update_serialized_ranking(self, key, data, user_ids):
+        data = super(WithDisqualificationRankingControllerMixin, self) \
+            .update_serialized_ranking(key, data, user_ids)
+        if data is None or not self._show_disqualified(key):
+            return data
+        self._annotate_disqualified_rows([row for row in data['rows']
+                                          if row['user'].id in user_ids])
+        return data
+
     def _annotate_disqualified(self, key, data):
-        users_ids = [row['user'].id for row in data['rows']]
+        self._annotate_disqualified_rows(data['rows'])
+        return data
+
+    def _annotate_disqualified_rows(self, rows):
+        users_ids = [row['user'].id for row in rows]
         not_disqualified = self.contest.controller \
             .exclude_disqualified_users(User.objects.filter(id__in=users_ids))
 
-        for row in data['rows']:
+        for row in rows:
             row['disqualified'] = row['user'] not in not_disqualified
-        return data
 
     def _ignore_in_ranking_places(self, data_row):
         prev = super(WithDisqualificationRankingControllerMixin, self) \
@@ -2,8 +2,10 @@ import copy
 import sys
 import logging
 import pprint
+import time
 import traceback
 
+from django.conf import settings
 from django.utils.module_loading import import_string
 
 from celery.task import task
@@ -14,8 +16,12 @@ from oioioi.sioworkers.jobs import send_async_jobs
 
 
 logger = logging.getLogger(__name__)
+timing_logger = logging.getLogger(__name__ + '.timing')
 loaded_controllers = False
 
+# Handlers resolved by _get_handler, kept for the lifetime of the process
+_handlers_cache = {}
+
 
 def _placeholder(environ, **kwargs):
     return environ
@@ -81,6 +87,30 @@ def replace_recipe_entry(environ, name, new_entry):
     recipe[index] = new_entry
 
 
+def _get_handler(handler_name):
+    """Returns the handler function with the given dotted path.
+
+       The import is done only once per process, as the same handlers are
+       used by every job.
+    """
+    handler_func = _handlers_cache.get(handler_name)
+    if handler_func is None:
+        handler_func = import_string(handler_name)
+        _handlers_cache[handler_name] = handler_func
+    return handler_func
+
+
+def _log_phase_time(env, phase_name, handler_name, elapsed):
+    args = {'phase': phase_name, 'handler': handler_name,
+            'job_id': env.get('job_id'), 'elapsed': elapsed}
+    if elapsed >= settings.EVALMGR_SLOW_PHASE_THRESHOLD:
+        timing_logger.warning("Phase %(phase)s (%(handler)s) of job "
+                "%(job_id)s took %(elapsed).3fs", args)
+    else:
+        timing_logger.debug("Phase %(phase)s (%(handler)s) of job "
+                "%(job_id)s took %(elapsed).3fs", args)
+
+
 def _run_phase(env, phase, extra_kwargs=None):
     phaseName = phase[0]
     handlerName = phase[1]
@@ -93,12 +123,14 @@ def _run_phase(env, phase, extra_kwargs=None):
         kwargs = phase[2].copy()
     if extra_kwargs:
         kwargs.update(extra_kwargs)
-    handler_func = import_string(handlerName)
+    handler_func = _get_handler(handlerName)
+    start = time.time()
     env = handler_func(env, **kwargs)
     if env is None:
         raise RuntimeError('Evaluation handler "%s" (%s) '
             'forgot to return the environment.' % (phaseName,
             handlerName))
+    _log_phase_time(env, phaseName, handlerName, time.time() - start)
     return env
 
 
@@ -166,6 +198,9 @@ def evalmgr_job(env):
         the logs and ignored.
 
         Returns environment (a processed copy of given environment).
+
+        Time spent in every phase is reported to the
+        ``oioioi.evalmgr.timing`` logger.
     """
 
     # pylint: disable=global-statement,broad-except
@@ -176,7 +211,11 @@ def evalmgr_job(env):
         load_modules('controllers')
         loaded_controllers = True
 
-    env = copy.deepcopy(env)
+    # A job received from the broker works on its own, freshly deserialized
+    # environment, so the (costly for big environments) copy is made only
+    # if the caller may still hold a reference to it.
+    if evalmgr_job.request.called_directly or evalmgr_job.request.is_eager:
+        env = copy.deepcopy(env)
     env['job_id'] = evalmgr_job.request.id
 
     try:
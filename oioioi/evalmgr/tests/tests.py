@@ -1,7 +1,7 @@
 from django.utils import unittest
 from django.test.utils import override_settings
 from django.test import SimpleTestCase
-from oioioi.evalmgr import evalmgr_job
+from oioioi.evalmgr import evalmgr_job, _handlers_cache
 from oioioi.sioworkers.jobs import run_sioworkers_job
 from oioioi.filetracker.client import get_client
 
@@ -56,6 +56,25 @@ class TestLocalJobs(unittest.TestCase):
         env = evalmgr_job.delay(env).get()
         self.assertEqual('Hedgehog hunted.', env['output'])
 
+    def test_environment_not_modified(self):
+        env = dict(recipe=hunting, area='forest')
+        result = evalmgr_job.delay(env).get()
+        self.assertEqual('Hedgehog hunted.', result['output'])
+        self.assertEqual(dict(recipe=hunting, area='forest'), env)
+
+    def test_handlers_cache(self):
+        handler_name = 'oioioi.evalmgr.tests.tests.not_importable_handler'
+        _handlers_cache[handler_name] = prepare_handler
+        try:
+            env = dict(recipe=[('Prepare guns', handler_name)] + hunting[1:],
+                       area='forest')
+            env = evalmgr_job.delay(env).get()
+            self.assertEqual('Hedgehog hunted.', env['output'])
+        finally:
+            del _handlers_cache[handler_name]
+        self.assertIn('oioioi.evalmgr.tests.tests.hunting_handler',
+                      _handlers_cache)
+
     def test_multiple_jobs(self):
         city_result = evalmgr_job.delay(dict(recipe=hunting, area='city'))
         forest_result = evalmgr_job.delay(dict(recipe=hunting, area='forest'))
@@ -49,5 +49,15 @@ class Command(BaseCommand):
 
         collector = SubmissionsWithUserDataCollector(contest, round=round,
             only_final=not options.get('all'))
+        verbosity = int(options.get('verbosity', 1))
+
+        def progress(done, total):
+            if verbosity >= 1:
+                self.stdout.write("\rExported %d/%d submissions"
+                                  % (done, total), ending='')
+                if done == total:
+                    self.stdout.write('')
+                self.stdout.flush()
+
         with open(out_file, 'w') as f:
-            build_submissions_archive(f, collector)
+            build_submissions_archive(f, collector, progress)
@@ -5,6 +5,7 @@ import shutil
 import StringIO
 
 from django.core.management import call_command
+from django.test.utils import override_settings
 
 from oioioi.base.tests import TestCase
 from oioioi.contests.models import Contest, Round
@@ -106,6 +107,22 @@ class TestExportCommand(TestCase):
         finally:
             shutil.rmtree(tmpdir)
 
+    @override_settings(EXPORTSZU_DOWNLOAD_CONCURRENCY=1)
+    def test_export_progress(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            archive_path = os.path.join(tmpdir, 'archive.tgz')
+            out = StringIO.StringIO()
+            call_command('export_submissions', 'c', archive_path, all=True,
+                         stdout=out)
+            self.assertIn("Exported 2/2 submissions", out.getvalue())
+            archive = tarfile.open(archive_path, 'r:gz')
+            files = [member.name for member in archive.getmembers()]
+            self.assertEqual(files, ["c", "c/INDEX", "c/1:test_user:zad1.cpp",
+                                     "c/2:test_user:zad1.cpp"])
+        finally:
+            shutil.rmtree(tmpdir)
+
 
 class TestExportSubmissionsView(TestCase):
     fixtures = ['test_users', 'test_contest', 'test_full_package',
@@ -1,17 +1,23 @@
 import csv
-import os
 import shutil
+import StringIO
 import tarfile
 import tempfile
+import threading
+import time
+from multiprocessing.pool import ThreadPool
 
+from django.conf import settings
 from django.db.models import Q
-from django.utils.encoding import force_text
-from django.core.exceptions import ObjectDoesNotExist
+from django.utils.encoding import force_bytes, force_text
 
 from oioioi.programs.models import ProgramSubmission
-from oioioi.participants.models import Participant
 from oioioi.filetracker.utils import django_to_filetracker_path
-from oioioi.filetracker.client import get_client
+from oioioi.filetracker.client import create_client
+
+
+# Sources larger than that are spooled to disk while being downloaded
+SOURCE_SPOOL_MAX_SIZE = 1024 * 1024
 
 
 class SubmissionData(object):
@@ -43,7 +49,8 @@ class SubmissionsWithUserDataCollector(object):
         self.contest = contest
         self.round = round
         self.only_final = only_final
-        self.filetracker = get_client()
+        # Sources are downloaded by many threads, each using its own client
+        self._local = threading.local()
 
     def get_contest_id(self):
         return self.contest.id
@@ -64,8 +71,10 @@ class SubmissionsWithUserDataCollector(object):
                     submissionreport__userresultforproblem__isnull=False)
 
         submissions_list = []
-        psubmissions = ProgramSubmission.objects.filter(q_expressions) \
-                .select_related()
+        psubmissions = list(ProgramSubmission.objects.filter(q_expressions)
+                .select_related('user', 'problem_instance'))
+        registrations = self._get_registrations(
+                set(s.user_id for s in psubmissions))
 
         for s in psubmissions:
             data = SubmissionData()
@@ -82,10 +91,8 @@ class SubmissionsWithUserDataCollector(object):
 
             # here we try to get some optional data, it just may not be there
             # and it's ok
-            try:
-                registration = Participant.objects.select_related() \
-                    .get(contest_id=self.contest.id, user=s.user) \
-                    .registration_model
+            registration = registrations.get(s.user_id)
+            if registration is not None:
                 try:
                     data.city = registration.city
                 except AttributeError:
@@ -95,56 +102,162 @@ class SubmissionsWithUserDataCollector(object):
                     data.school_city = registration.school.city
                 except AttributeError:
                     pass
-            except (Participant.DoesNotExist, ObjectDoesNotExist):
-                pass
 
             submissions_list.append(data)
         return submissions_list
 
-    def get_submission_source(self, out_file_path, source):
+    def _get_registrations(self, user_ids):
+        """Returns a dictionary mapping ids of the given users to their
+           registration models in the contest, fetched in one query.
+        """
+        rcontroller = self.contest.controller.registration_controller()
+        get_model_class = getattr(rcontroller, 'get_model_class', None)
+        model_class = get_model_class() if get_model_class else None
+        if model_class is None or not user_ids:
+            return {}
+
+        related = ['participant']
+        if any(f.name == 'school' for f in model_class._meta.fields):
+            related.append('school')
+        registrations = model_class.objects \
+                .filter(participant__contest=self.contest,
+                        participant__user_id__in=user_ids) \
+                .select_related(*related)
+        return dict((r.participant.user_id, r) for r in registrations)
+
+    def open_submission_source(self, source):
+        """Downloads the source file and returns it as a file-like object
+           positioned at its beginning, along with its size.
+        """
+        client = getattr(self._local, 'filetracker', None)
+        if client is None:
+            client = self._local.filetracker = create_client()
         ft_file = django_to_filetracker_path(source)
-        self.filetracker.get_file(ft_file, out_file_path, add_to_cache=False)
+        reader, _version = client.get_stream(ft_file)
+        out = tempfile.SpooledTemporaryFile(max_size=SOURCE_SPOOL_MAX_SIZE)
+        try:
+            shutil.copyfileobj(reader, out)
+        finally:
+            reader.close()
+        size = out.tell()
+        out.seek(0)
+        return out, size
+
+
+class _ChunkBuffer(object):
+    """A write-only file-like object collecting written data until it is
+       taken with :meth:`pop`.
+    """
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(data)
+
+    def pop(self):
+        data = ''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def _build_index(submission_list):
+    index = StringIO.StringIO()
+    index_csv = csv.writer(index)
+    header = ['submission_id', 'user_id', 'username', 'first_name',
+        'last_name', 'city', 'school', 'school_city',
+        'problem_short_name', 'score']
+    index_csv.writerow(header)
+    for s in submission_list:
+        index_entry = [s.submission_id, s.user_id, s.username,
+            s.first_name, s.last_name, s.city, s.school, s.school_city,
+            s.problem_short_name, s.score]
+
+        def encode(obj):
+            if obj is None:
+                return 'NULL'
+            else:
+                return force_text(obj).encode('utf8')
+
+        index_csv.writerow([encode(col) for col in index_entry])
+    return index.getvalue()
+
 
+def _make_tarinfo(name, size, mtime, type=tarfile.REGTYPE, mode=0600):
+    info = tarfile.TarInfo(force_bytes(name))
+    info.size = size
+    info.mtime = mtime
+    info.type = type
+    info.mode = mode
+    return info
 
-def build_submissions_archive(out_file, submission_collector):
+
+def iter_submissions_archive(submission_collector, progress=None):
+    """
+    Returns an iterator over chunks of the submissions archive, in szubrawcy
+    format, built from data provided by submission_collector.
+
+    The submissions are collected before this function returns. Their
+    sources are downloaded from Filetracker by a pool of
+    ``settings.EXPORTSZU_DOWNLOAD_CONCURRENCY`` threads and written to the
+    archive in order, without storing the whole archive anywhere.
+
+    If given, ``progress(done, total)`` is called after each source file
+    is written to the archive.
+    """
+    submission_list = submission_collector.collect_list()
+    contest_id = submission_collector.get_contest_id()
+    concurrency = max(1, settings.EXPORTSZU_DOWNLOAD_CONCURRENCY)
+
+    def download(s):
+        return submission_collector.open_submission_source(s.source_file)
+
+    def generate():
+        mtime = time.time()
+        buf = _ChunkBuffer()
+        tar = tarfile.open(fileobj=buf, mode='w|gz')
+        pool = ThreadPool(concurrency)
+        try:
+            tar.addfile(_make_tarinfo(contest_id, 0, mtime,
+                                      type=tarfile.DIRTYPE, mode=0700))
+            index = _build_index(submission_list)
+            tar.addfile(_make_tarinfo(contest_id + '/INDEX', len(index),
+                                      mtime), StringIO.StringIO(index))
+            yield buf.pop()
+
+            total = len(submission_list)
+            # Only a bounded number of downloaded sources is kept at once
+            batch_size = concurrency * 4
+            for start in xrange(0, total, batch_size):
+                batch = submission_list[start:start + batch_size]
+                for i, (s, (source, size)) in enumerate(
+                        zip(batch, pool.map(download, batch))):
+                    filename = '%s:%s:%s.%s' % (
+                            s.submission_id, s.username, s.problem_short_name,
+                            s.solution_language)
+                    with source:
+                        tar.addfile(_make_tarinfo(
+                                contest_id + '/' + filename, size, mtime),
+                                source)
+                    if progress is not None:
+                        progress(start + i + 1, total)
+                yield buf.pop()
+
+            tar.close()
+            yield buf.pop()
+        finally:
+            pool.terminate()
+
+    return generate()
+
+
+def build_submissions_archive(out_file, submission_collector, progress=None):
     """
     Builds submissions archive, in szubrawcy format, in out_file from data
     provided by submission_collector. Argument out_file should be a file-like
     object.
+
+    See :func:`iter_submissions_archive` for the meaning of ``progress``.
     """
-    submission_list = submission_collector.collect_list()
-    tmpdir = tempfile.mkdtemp()
-    try:
-        contest_id = submission_collector.get_contest_id()
-        files_dir = os.path.join(tmpdir, contest_id)
-        os.mkdir(files_dir, 0700)
-        with open(os.path.join(files_dir, 'INDEX'), 'w') as f:
-            index_csv = csv.writer(f)
-            header = ['submission_id', 'user_id', 'username', 'first_name',
-                'last_name', 'city', 'school', 'school_city',
-                'problem_short_name', 'score']
-            index_csv.writerow(header)
-            for s in submission_list:
-                index_entry = [s.submission_id, s.user_id, s.username,
-                    s.first_name, s.last_name, s.city, s.school, s.school_city,
-                    s.problem_short_name, s.score]
-
-                def encode(obj):
-                    if obj is None:
-                        return 'NULL'
-                    else:
-                        return force_text(obj).encode('utf8')
-
-                index_csv.writerow([encode(col) for col in index_entry])
-
-        for s in submission_list:
-            filename = '%s:%s:%s.%s' % (
-                    s.submission_id, s.username, s.problem_short_name,
-                    s.solution_language)
-            dest = os.path.join(files_dir, filename)
-            submission_collector.get_submission_source(dest, s.source_file)
-
-        with tarfile.open(fileobj=out_file, mode='w:gz') as tar:
-            tar.add(files_dir, arcname=contest_id)
-    finally:
-        shutil.rmtree(tmpdir)
+    for chunk in iter_submissions_archive(submission_collector, progress):
+        out_file.write(chunk)
@@ -1,14 +1,19 @@
-import tempfile
-import os
+import logging
 
 from django.template.response import TemplateResponse
-from django.http import FileResponse
+from django.http import StreamingHttpResponse
 
 from oioioi.contests.utils import contest_exists, is_contest_admin
 from oioioi.base.permissions import enforce_condition
 from oioioi.exportszu.forms import ExportSubmissionsForm
 from oioioi.exportszu.utils import SubmissionsWithUserDataCollector, \
-        build_submissions_archive
+        iter_submissions_archive
+
+
+logger = logging.getLogger(__name__)
+
+# How often (in exported submissions) the export progress is logged
+PROGRESS_LOG_INTERVAL = 100
 
 
 @enforce_condition(contest_exists & is_contest_admin)
@@ -20,18 +25,20 @@ def export_submissions_view(request):
             only_final = form.cleaned_data['only_final']
             collector = SubmissionsWithUserDataCollector(request.contest,
                 round=round, only_final=only_final)
-            # TemporaryFile promises removal of the file when it is closed.
-            # Note that we cannot use with, because we want to keep it beyond
-            # this function call.
-            tmp_file = tempfile.TemporaryFile()
-            build_submissions_archive(tmp_file, collector)
-            # We send a large file with django. Usually it isn't a good idea,
-            # but letting the web server do it leads to problems with when to
-            # delete this file and from where.
-            tmp_file.seek(0, os.SEEK_SET)  # go to the beginning of the file
-            response = FileResponse(tmp_file)
+            contest_id = request.contest.id
+
+            def progress(done, total):
+                if done % PROGRESS_LOG_INTERVAL == 0 or done == total:
+                    logger.info("Exporting submissions of %s: %d/%d",
+                                contest_id, done, total)
+
+            # The archive is sent while it is being built, so that neither
+            # the whole archive nor the sources are kept on the disk.
+            response = StreamingHttpResponse(
+                    iter_submissions_archive(collector, progress),
+                    content_type='application/x-gzip')
             response['Content-Disposition'] = ('attachment; filename="%s.tgz"'
-                % request.contest.id)
+                % contest_id)
             return response
     else:
         form = ExportSubmissionsForm(request)
@@ -10,16 +10,12 @@ import filetracker
 import filetracker.dummy
 
 
-@memoized
-def get_client():
-    """Constructs a Filetracker client.
-
-       Needs a ``FILETRACKER_CLIENT_FACTORY`` entry in ``settings.py``, which
-       should contain a :term:`dotted name` of a function which returns a
-       :class:`filetracker.Client` instance. A good candidate is
-       :func:`~oioioi.filetracker.client.media_root_factory`.
+def create_client():
+    """Constructs a new Filetracker client, using the
+       ``FILETRACKER_CLIENT_FACTORY`` (see :func:`get_client`).
 
-       The constructed client is cached.
+       Unlike :func:`get_client`, it returns a new client on every call,
+       e.g. for threads, which should not share a client.
     """
     factory = settings.FILETRACKER_CLIENT_FACTORY
     if isinstance(factory, basestring):
@@ -32,6 +28,21 @@ def get_client():
         raise ImproperlyConfigured('The factory pointed by '
                 'FILETRACKER_CLIENT_FACTORY returned non-filetracker.Client: '
                 '%r' % (client,))
+    return client
+
+
+@memoized
+def get_client():
+    """Constructs a Filetracker client.
+
+       Needs a ``FILETRACKER_CLIENT_FACTORY`` entry in ``settings.py``, which
+       should contain a :term:`dotted name` of a function which returns a
+       :class:`filetracker.Client` instance. A good candidate is
+       :func:`~oioioi.filetracker.client.media_root_factory`.
+
+       The constructed client is cached.
+    """
+    client = create_client()
 
     # Needed for oioioi.sioworkers.backends.LocalBackend so that both Django
     # and sioworkers use the same Filetracker client
@@ -51,3 +62,16 @@ def media_root_factory():
     """A filetracker factory which sets up local client in
        ``settings.MEDIA_ROOT`` folder."""
     return filetracker.Client(cache_dir=settings.MEDIA_ROOT, remote_store=None)
+
+
+_dummy_store = None
+
+
+def dummy_factory():
+    """A filetracker factory for tests, which sets up clients keeping files
+       in memory. All the clients share one store, like clients of a single
+       Filetracker server."""
+    global _dummy_store
+    if _dummy_store is None:
+        _dummy_store = filetracker.dummy.DummyDataStore()
+    return filetracker.Client(local_store=_dummy_store, remote_store=None)
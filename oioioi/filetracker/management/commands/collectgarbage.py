@@ -1,13 +1,79 @@
 import datetime
+import heapq
 import itertools
 import optparse
+import os
+import stat
+import tempfile
+import time
 
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Q
 from django.db.models.loading import cache
+from django.template.defaultfilters import filesizeformat
+from django.utils.encoding import force_bytes
 from django.utils.translation import ugettext as _, ungettext
 
 from oioioi.filetracker.client import get_client
-from filetracker import split_name
+from oioioi.filetracker.utils import is_content_addressed
+from filetracker import split_name, versioned_name
+
+
+# Number of rows fetched at once, when looking for files referenced from
+# the database. It also bounds the number of paths sorted in memory.
+NEEDED_FILES_CHUNK_SIZE = 10000
+
+# Number of names checked in one query by Command._find_referenced
+REFERENCE_CHECK_CHUNK_SIZE = 100
+
+
+def _iter_file_field_values(model, file_fields):
+    """Yields values of the given file fields of all model instances,
+       fetching rows in chunks ordered by the primary key.
+    """
+    last_pk = None
+    while True:
+        qs = model.objects.order_by('pk')
+        if last_pk is not None:
+            qs = qs.filter(pk__gt=last_pk)
+        rows = list(qs.values_list('pk', *file_fields)
+                    [:NEEDED_FILES_CHUNK_SIZE])
+        if not rows:
+            return
+        for row in rows:
+            for value in row[1:]:
+                if value:
+                    yield value
+        last_pk = rows[-1][0]
+
+
+def _iter_sorted_run(run):
+    run.seek(0)
+    for line in run:
+        yield line.rstrip('\n')
+
+
+def _iter_store_dir(root, prefix=''):
+    """Yields ``(name, version, size)`` of files in the directory tree,
+       in lexicographic order of their names.
+    """
+    entries = []
+    for basename in os.listdir(os.path.join(root, prefix)):
+        name = prefix + basename
+        file_stat = os.lstat(os.path.join(root, name))
+        if stat.S_ISDIR(file_stat.st_mode):
+            # The contents of a directory follow other names having it as
+            # a prefix, so it is sorted as if it ended with a slash.
+            entries.append((name + '/', None))
+        else:
+            entries.append((name, file_stat))
+    entries.sort()
+    for name, file_stat in entries:
+        if file_stat is None:
+            for entry in _iter_store_dir(root, name):
+                yield entry
+        else:
+            yield name, int(file_stat.st_mtime), file_stat.st_size
 
 
 class Command(BaseCommand):
@@ -22,11 +88,27 @@ class Command(BaseCommand):
                              dest='pretend', default=False,
                              help=_("If set, the orphaned files will only be "
                                     "displayed, not deleted.")),
+        optparse.make_option('-b', '--batch-size', action='store',
+                             type='int', dest='batch_size', default=1000,
+                             help=_("Number of files deleted between saving "
+                                    "checkpoints. Default value is 1000."),
+                             metavar=_("SIZE")),
+        optparse.make_option('-r', '--rate', action='store', type='float',
+                             dest='rate', default=0,
+                             help=_("Delete at most RATE files per second. "
+                                    "By default there is no limit."),
+                             metavar=_("RATE")),
+        optparse.make_option('-c', '--checkpoint', action='store',
+                             dest='checkpoint', default=None,
+                             help=_("A file in which the progress is saved "
+                                    "after each batch. If it exists, "
+                                    "the interrupted run is resumed. It is "
+                                    "removed when the run is finished."),
+                             metavar=_("FILE")),
     )
     option_list = BaseCommand.option_list + base_options
 
-    def _get_needed_files(self):
-        result = []
+    def _get_file_models(self):
         for app in cache.get_apps():
             model_list = cache.get_models(app)
             for model in model_list:
@@ -34,47 +116,185 @@ class Command(BaseCommand):
                                if field.get_internal_type() == 'FileField']
 
                 if len(file_fields) > 0:
-                    files = model.objects.all().values_list(*file_fields)
-                    result.extend([split_name(file)[0] for file in itertools.
-                                  chain.from_iterable(files) if file])
-        return result
+                    yield model, file_fields
+
+    def _iter_needed_files(self):
+        """Yields paths (without versions and leading slashes) of all files
+           referenced from the database, in lexicographic order and possibly
+           with duplicates.
+
+           The paths are sorted externally: each chunk of them is sorted in
+           memory and written to a temporary file, and the files are merged.
+        """
+        runs = []
+
+        def save_run(paths):
+            run = tempfile.TemporaryFile()
+            for path in sorted(set(paths)):
+                run.write(path + '\n')
+            runs.append(run)
+
+        paths = []
+        for model, file_fields in self._get_file_models():
+            for value in _iter_file_field_values(model, file_fields):
+                paths.append(force_bytes(split_name(value)[0].lstrip('/')))
+                if len(paths) >= NEEDED_FILES_CHUNK_SIZE:
+                    save_run(paths)
+                    paths = []
+        save_run(paths)
+
+        try:
+            for path in heapq.merge(*[_iter_sorted_run(run) for run in runs]):
+                yield path
+        finally:
+            for run in runs:
+                run.close()
+
+    def _iter_store_files(self, client):
+        """Yields ``(name, version, size)`` of all files in the local store,
+           in lexicographic order of names (without leading slashes).
+        """
+        store = client.local_store
+        if store is None:
+            return
+        if hasattr(store, 'dir'):
+            if os.path.isdir(store.dir):
+                for entry in _iter_store_dir(store.dir):
+                    yield entry
+            return
+        entries = []
+        for entry in store.list_files():
+            name, version = split_name(entry.name)
+            entries.append((force_bytes(name.lstrip('/')), version,
+                            entry.size))
+        for entry in sorted(entries):
+            yield entry
+
+    def _iter_orphaned_files(self, client, stats, after=None):
+        """Merges the sorted lists of stored and referenced files, yielding
+           entries of the stored files which are not referenced.
+
+           Numbers of scanned and orphaned files are counted in ``stats``.
+        """
+        needed = self._iter_needed_files()
+        needed_path = next(needed, None)
+        for name, version, size in self._iter_store_files(client):
+            if after is not None and name <= after:
+                continue
+            stats['scanned'] += 1
+            while needed_path is not None and needed_path < name:
+                needed_path = next(needed, None)
+            if needed_path == name:
+                continue
+            stats['orphaned'] += 1
+            yield name, version, size
+
+    def _find_referenced(self, names):
+        """Returns the subset of the given names (without versions and
+           leading slashes) referenced from the database now.
+        """
+        referenced = set()
+        for start in xrange(0, len(names), REFERENCE_CHECK_CHUNK_SIZE):
+            chunk = names[start:start + REFERENCE_CHECK_CHUNK_SIZE]
+            for model, file_fields in self._get_file_models():
+                for field in file_fields:
+                    q = Q(**{field + '__in': chunk})
+                    for name in chunk:
+                        q |= Q(**{field + '__startswith': name + '@'})
+                    for value in model.objects.filter(q) \
+                            .values_list(field, flat=True):
+                        referenced.add(force_bytes(
+                                split_name(value)[0].lstrip('/')))
+        return referenced
+
+    def _read_checkpoint(self, filename):
+        if filename is None or not os.path.exists(filename):
+            return None
+        with open(filename) as f:
+            return f.read() or None
+
+    def _write_checkpoint(self, filename, name):
+        if filename is None:
+            return
+        tmp_filename = filename + '.tmp'
+        with open(tmp_filename, 'w') as f:
+            f.write(name)
+        os.rename(tmp_filename, filename)
 
     def handle(self, *args, **options):
-        needed_files = self._get_needed_files()
-        all_files = get_client().list_local_files()
-        max_date_to_delete = datetime.datetime.now() - datetime. \
-            timedelta(days=options['days'])
+        verbosity = int(options['verbosity'])
+        pretend = options['pretend']
+        batch_size = options['batch_size']
+        rate = options['rate']
+        checkpoint = options['checkpoint']
+        if batch_size <= 0:
+            raise CommandError(_("Batch size must be positive."))
+
+        client = get_client()
+        max_version_to_delete = time.mktime((datetime.datetime.now()
+                - datetime.timedelta(days=options['days'])).timetuple())
+
+        resume_after = self._read_checkpoint(checkpoint)
+        if resume_after is not None and verbosity > 0:
+            print _("Resuming after %s") % resume_after
+
+        stats = {'scanned': 0, 'orphaned': 0}
+        orphans = self._iter_orphaned_files(client, stats, resume_after)
+        to_delete = ((name, version, size)
+                     for name, version, size in orphans
+                     if version < max_version_to_delete)
+
+        files_count = 0
+        files_size = 0
+        if pretend and verbosity > 1:
+            print _("The following files are scheduled for deletion:")
+        while True:
+            batch = list(itertools.islice(to_delete, batch_size))
+            if not batch:
+                break
+            started = time.time()
+            last_name = batch[-1][0]
+            # Content-addressed files may be shared by new references
+            # (e.g. from a package uploaded again), created after
+            # the referenced files were listed, so they are checked again.
+            referenced = self._find_referenced([name for name, _version,
+                    _size in batch if is_content_addressed(name)])
+            batch = [entry for entry in batch if entry[0] not in referenced]
+            for name, version, size in batch:
+                if verbosity > 1:
+                    print " ", name
+                if not pretend:
+                    client.delete_file(versioned_name('/' + name, version))
+            files_count += len(batch)
+            files_size += sum(size for _name, _version, size in batch)
+            if pretend:
+                continue
+            self._write_checkpoint(checkpoint, last_name)
+            if rate > 0:
+                time.sleep(max(0, len(batch) / rate
+                                  - (time.time() - started)))
 
-        diff = set([f[0] for f in all_files]) - set(needed_files)
-        to_delete = [f[0] for f in all_files if f[0] in diff and datetime.
-                     datetime.fromtimestamp(f[1]) < max_date_to_delete]
+        if checkpoint is not None and not pretend \
+                and os.path.exists(checkpoint):
+            os.remove(checkpoint)
 
-        files_count = len(to_delete)
-        if files_count == 0 and int(options['verbosity']) > 0:
+        if verbosity == 0:
+            return
+        if pretend:
+            print ungettext("%(scanned)d file scanned, %(orphaned)d orphaned.",
+                            "%(scanned)d files scanned, %(orphaned)d "
+                            "orphaned.", stats['scanned']) % stats
+        if files_count == 0:
             print _("No files to delete.")
-        elif options['pretend']:
-            if int(options['verbosity']) > 1:
-                print ungettext("The following %d file is scheduled for "
-                                "deletion:",
-                                "The following %d files are scheduled for "
-                                "deletion:",
-                                files_count) % files_count
-                for file in to_delete:
-                    print " ", file
-            elif int(options['verbosity']) == 1:
-                print ungettext("%d file scheduled for deletion.",
-                                "%d files scheduled for deletion.",
-                                files_count) % files_count
+        elif pretend:
+            print ungettext("%(count)d file scheduled for deletion, "
+                            "%(size)s to reclaim.",
+                            "%(count)d files scheduled for deletion, "
+                            "%(size)s to reclaim.",
+                            files_count) % {'count': files_count,
+                                            'size': filesizeformat(files_size)}
         else:
-            if int(options['verbosity']) > 1:
-                print ungettext("Deleting the following %d file:",
-                                "Deleting the following %d files:",
-                                files_count) % files_count
-            if int(options['verbosity']) == 1:
-                print ungettext("Deleting %d file",
-                                "Deleting %d files",
-                                files_count) % files_count
-            for file in to_delete:
-                if int(options['verbosity']) > 1:
-                    print " ", file
-                get_client().delete_file('/' + file)
+            print ungettext("Deleted %(count)d file, %(size)s reclaimed.",
+                            "Deleted %(count)d files, %(size)s reclaimed.",
+                            files_count) % {'count': files_count,
+                                            'size': filesizeformat(files_size)}
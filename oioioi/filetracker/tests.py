@@ -5,18 +5,24 @@ from django.core.urlresolvers import reverse
 from django.core.files.base import ContentFile
 from django.db.models.fields.files import FieldFile, FileField
 from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.test.utils import override_settings
 
 from oioioi.base.tests import TestCase
 from oioioi.filetracker.models import TestFileModel
 from oioioi.filetracker.storage import FiletrackerStorage
 from oioioi.filetracker.utils import django_to_filetracker_path, \
-        filetracker_to_django_file, make_content_disposition_header
+        filetracker_to_django_file, make_content_disposition_header, \
+        save_content_addressed
 import filetracker
 import filetracker.dummy
+from filetracker import split_name
 
 import tempfile
 import shutil
 import datetime
+import os
+import time
 
 
 class TestFileField(TestCase):
@@ -162,6 +168,67 @@ class TestFileFixtures(TestCase):
 
 
 class TestFileUtils(unittest.TestCase):
+    def test_save_content_addressed(self):
+        dir = tempfile.mkdtemp()
+        try:
+            client = filetracker.Client(cache_dir=dir, remote_store=None)
+            storage = FiletrackerStorage(client=client)
+            for name, content in [('a.in', 'same'), ('b.in', 'same'),
+                                  ('c.in', 'other')]:
+                with open(os.path.join(dir, name), 'w') as f:
+                    f.write(content)
+            a = save_content_addressed(os.path.join(dir, 'a.in'), 'x.in',
+                                       storage=storage)
+            self.assertTrue(a.startswith('blobs/'))
+            self.assertTrue(a.endswith('/x.in'))
+            self.assertEqual(storage.open(a, 'rb').read(), 'same')
+            b = save_content_addressed(os.path.join(dir, 'b.in'), 'x.in',
+                                       storage=storage)
+            self.assertEqual(a.versioned_name, b.versioned_name)
+            c = save_content_addressed(os.path.join(dir, 'c.in'), 'x.in',
+                                       storage=storage)
+            self.assertNotEqual(a, c)
+            self.assertEqual(storage.open(c, 'rb').read(), 'other')
+        finally:
+            shutil.rmtree(dir)
+
+    def test_refresh_reused_content_addressed(self):
+        dir = tempfile.mkdtemp()
+        try:
+            client = filetracker.Client(cache_dir=dir, remote_store=None)
+            storage = FiletrackerStorage(client=client)
+            path = os.path.join(dir, 'a.in')
+            with open(path, 'w') as f:
+                f.write('same')
+            a = save_content_addressed(path, storage=storage)
+            old = time.time() - 10 * 24 * 3600
+            os.utime(os.path.join(dir, 'files', a), (old, old))
+            b = save_content_addressed(path, storage=storage)
+            self.assertEqual(unicode(a), unicode(b))
+            self.assertGreater(split_name(b.versioned_name)[1], old + 60)
+            self.assertEqual(storage.open(b, 'rb').read(), 'same')
+        finally:
+            shutil.rmtree(dir)
+
+    def test_content_addressed_store_errors_propagate(self):
+        class BrokenStore(filetracker.dummy.DummyDataStore):
+            def exists(self, name):
+                raise IOError("filetracker is down")
+
+        dir = tempfile.mkdtemp()
+        try:
+            client = filetracker.Client(local_store=BrokenStore(),
+                                        remote_store=None)
+            storage = FiletrackerStorage(client=client)
+            path = os.path.join(dir, 'a.in')
+            with open(path, 'w') as f:
+                f.write('same')
+            with self.assertRaises(IOError):
+                save_content_addressed(path, storage=storage)
+            self.assertEqual(client.local_store.data, {})
+        finally:
+            shutil.rmtree(dir)
+
     def test_content_disposition(self):
         value = make_content_disposition_header('inline', u'EURO rates.txt')
         self.assertIn('inline', value)
@@ -175,3 +242,72 @@ class TestFileUtils(unittest.TestCase):
         self.assertEqual(value.lower(),
                 'attachment; filename="rates.txt"; '
                 'filename*=utf-8\'\'%e2%82%ac%20rates.txt')
+
+
+class TestCollectGarbage(TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.client = filetracker.Client(cache_dir=self.dir, remote_store=None)
+        old = time.time() - 10 * 24 * 3600
+        for name, mtime in [('tests/needed.txt', old),
+                            ('tests/orphan.txt', old),
+                            ('tests/recent.txt', None),
+                            ('other/a.txt', old)]:
+            self.client.put_file('/' + name, self._make_file(name))
+            if mtime is not None:
+                os.utime(self._path(name), (mtime, mtime))
+        TestFileModel.objects.create(file_field='tests/needed.txt@123')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def _path(self, name):
+        return os.path.join(self.dir, 'files', name)
+
+    def _make_file(self, name):
+        filename = os.path.join(self.dir, os.path.basename(name))
+        with open(filename, 'w') as f:
+            f.write(name)
+        return filename
+
+    def _existing(self):
+        return [name for name in ['other/a.txt', 'tests/needed.txt',
+                                  'tests/orphan.txt', 'tests/recent.txt']
+                if os.path.exists(self._path(name))]
+
+    def _collect(self, **options):
+        with override_settings(FILETRACKER_CLIENT_FACTORY=lambda:
+                               self.client):
+            call_command('collectgarbage', days=1, verbosity=0, **options)
+
+    def test_pretend(self):
+        self._collect(pretend=True)
+        self.assertEqual(len(self._existing()), 4)
+
+    def test_delete(self):
+        self._collect(batch_size=1)
+        self.assertEqual(self._existing(),
+                         ['tests/needed.txt', 'tests/recent.txt'])
+
+    def test_shared_content_addressed_file(self):
+        shared = save_content_addressed(
+                self._make_file('tests/shared.txt'), storage=
+                FiletrackerStorage(client=self.client))
+        TestFileModel.objects.create(file_field=shared.versioned_name)
+        TestFileModel.objects.create(file_field=shared.versioned_name)
+        TestFileModel.objects.filter(id=TestFileModel.objects
+                                     .latest('id').id).delete()
+        old = time.time() - 10 * 24 * 3600
+        os.utime(self._path(shared), (old, old))
+        self._collect()
+        self.assertTrue(os.path.exists(self._path(shared)))
+
+    def test_resume(self):
+        checkpoint = os.path.join(self.dir, 'checkpoint')
+        with open(checkpoint, 'w') as f:
+            f.write('tests/needed.txt')
+        self._collect(checkpoint=checkpoint)
+        self.assertEqual(self._existing(),
+                         ['other/a.txt', 'tests/needed.txt',
+                          'tests/recent.txt'])
+        self.assertFalse(os.path.exists(checkpoint))
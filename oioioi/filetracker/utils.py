@@ -1,13 +1,28 @@
+import hashlib
 import mimetypes
+import os.path
+import time
 import urllib
 
 from django.core.servers.basehttp import FileWrapper
 from django.core.files.storage import default_storage
 from django.core.files import File
 from django.http import StreamingHttpResponse
+from django.utils.text import get_valid_filename
 
 from oioioi.filetracker.filename import FiletrackerFilename
 
+from filetracker import versioned_name
+
+
+# Directory in which files are stored under names derived from their
+# content, see save_content_addressed
+CONTENT_ADDRESSED_DIR = 'blobs'
+
+# Stored files older than that (in seconds) are stored again when reused,
+# see save_content_addressed
+CONTENT_ADDRESSED_REFRESH_AGE = 24 * 3600
+
 
 class FileInFiletracker(File):
     """A stub :class:`django.core.files.File` subclass for assigning existing
@@ -64,6 +79,64 @@ def filetracker_to_django_file(filetracker_path, storage=None):
             FiletrackerFilename(filetracker_path[prefix_len + 1:]))
 
 
+def file_digest(path):
+    """Returns the SHA-1 hex digest of the content of a local file."""
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(65536), ''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def save_content_addressed(path, name=None, storage=None):
+    """Stores a local file under a name derived from the hash of its
+       content and returns the name, which may be assigned to
+       a :class:`~django.db.models.FileField`.
+
+       If a file with the same content (and basename) is already stored,
+       nothing is uploaded and the stored file is shared. Its version stays
+       the same, so workers may still use their cached copies, unless it
+       is older than ``CONTENT_ADDRESSED_REFRESH_AGE``. Such a file may be
+       orphaned, so it is stored again under a new version (and the local
+       file is touched for that), to be protected from ``collectgarbage``
+       by its age until the new reference is committed.
+
+       The basename of the stored file is taken from ``name``, or from
+       ``path`` if ``name`` is not given.
+    """
+    if storage is None:
+        storage = default_storage
+    digest = file_digest(path)
+    name = '%s/%s/%s/%s' % (CONTENT_ADDRESSED_DIR, digest[:2], digest,
+            get_valid_filename(os.path.basename(name or path)))
+
+    client = getattr(storage, 'client', None)
+    if client is None:
+        if storage.exists(name):
+            return name
+        with open(path, 'rb') as f:
+            return storage.save(name, File(f))
+
+    ft_path = storage._make_filetracker_path(name)
+    # Like client.file_version, trust the remote store if there is one.
+    # Its exists() tells a missing file apart from other failures.
+    store = client.remote_store or client.local_store
+    if store.exists(ft_path):
+        version = client.file_version(ft_path)
+        if version >= time.time() - CONTENT_ADDRESSED_REFRESH_AGE:
+            return FiletrackerFilename(versioned_name(name, version))
+        os.utime(path, None)
+    return FiletrackerFilename(storage._cut_prefix(
+            client.put_file(ft_path, path)))
+
+
+def is_content_addressed(name):
+    """Checks if the file name (relative to the storage) was returned by
+       :func:`save_content_addressed`.
+    """
+    return name.lstrip('/').startswith(CONTENT_ADDRESSED_DIR + '/')
+
+
 def make_content_disposition_header(disposition, filename):
     """Returns a Content-Disposition header field per RFC 6266.
 
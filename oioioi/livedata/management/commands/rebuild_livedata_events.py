@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Max
+from django.utils.translation import ugettext as _
+
+from oioioi.contests.models import Contest, SubmissionReport
+from oioioi.livedata.models import LivedataEvent
+
+
+class Command(BaseCommand):
+    args = _("<contest_id>")
+    help = _("Rebuilds the log of livedata events of the given contest, "
+             "e.g. after the freeze time of its rounds was changed.")
+
+    @transaction.atomic
+    def handle(self, *args, **options):
+        if len(args) != 1:
+            raise CommandError(_("Expected one argument"))
+        try:
+            contest = Contest.objects.get(id=args[0])
+        except Contest.DoesNotExist:
+            raise CommandError(_("Contest %s does not exist") % args[0])
+
+        # Clients use ids of the events as cursors, so the new events are
+        # appended to the log before the old ones are deleted, to get
+        # greater ids.
+        old_events = LivedataEvent.objects.filter(round__contest=contest)
+        last_old_id = old_events.aggregate(Max('id'))['id__max']
+        reports = SubmissionReport.objects \
+            .filter(submission__problem_instance__contest=contest) \
+            .select_related('submission__problem_instance__round') \
+            .prefetch_related('scorereport_set') \
+            .order_by('creation_date', 'id')
+        count = 0
+        for report in reports:
+            score_report = report.score_report
+            if score_report is None:
+                continue
+            if LivedataEvent.create_for_report(report, score_report.status):
+                count += 1
+        if last_old_id is not None:
+            old_events.filter(id__lte=last_old_id).delete()
+        self.stdout.write(_("Created %d events.\n") % count)
@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+from django.conf import settings
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('contests', '0007_auto_20161214_1411'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LivedataEvent',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('submission_date', models.DateTimeField(verbose_name='submission date')),
+                ('judging_date', models.DateTimeField(verbose_name='judging date')),
+                ('result', models.CharField(max_length=64, verbose_name='result')),
+                ('public_result', models.CharField(max_length=64, verbose_name='public result')),
+                ('problem_instance', models.ForeignKey(verbose_name='problem instance', to='contests.ProblemInstance')),
+                ('round', models.ForeignKey(verbose_name='round', to='contests.Round')),
+                ('submission_report', models.ForeignKey(verbose_name='submission report', to='contests.SubmissionReport')),
+                ('user', models.ForeignKey(verbose_name='user', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'livedata event',
+                'verbose_name_plural': 'livedata events',
+            },
+        ),
+        migrations.AlterIndexTogether(
+            name='livedataevent',
+            index_together=set([('round', 'id')]),
+        ),
+    ]
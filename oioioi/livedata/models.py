@@ -1,3 +1,74 @@
+from django.contrib.auth.models import User
+from django.db import models
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from django.utils.translation import ugettext_lazy as _
+
 from oioioi.base.utils.deps import check_django_app_dependencies
+from oioioi.contests.models import Round, ProblemInstance, \
+        SubmissionReport, ScoreReport
 
 check_django_app_dependencies(__name__, ['oioioi.participants'])
+
+
+RESULT_FOR_FROZEN_SUBMISSION = 'FROZEN'
+
+
+class LivedataEvent(models.Model):
+    """An entry in the append-only log of judged submissions, served by
+       :func:`~oioioi.livedata.views.livedata_events_view`.
+
+       Ids of the events are used as cursors by the clients. The results
+       of submissions sent after the freeze time of the round are hidden
+       (in ``public_result``) when the event is written.
+    """
+    round = models.ForeignKey(Round, verbose_name=_("round"))
+    submission_report = models.ForeignKey(SubmissionReport,
+            verbose_name=_("submission report"))
+    user = models.ForeignKey(User, verbose_name=_("user"))
+    problem_instance = models.ForeignKey(ProblemInstance,
+            verbose_name=_("problem instance"))
+    submission_date = models.DateTimeField(verbose_name=_("submission date"))
+    judging_date = models.DateTimeField(verbose_name=_("judging date"))
+    result = models.CharField(max_length=64, verbose_name=_("result"))
+    public_result = models.CharField(max_length=64,
+            verbose_name=_("public result"))
+
+    class Meta(object):
+        verbose_name = _("livedata event")
+        verbose_name_plural = _("livedata events")
+        index_together = [('round', 'id')]
+
+    @classmethod
+    def create_for_report(cls, submission_report, status):
+        """Appends the event for the given report to the log, unless
+           the submission is not a contest submission of a user.
+        """
+        submission = submission_report.submission
+        problem_instance = submission.problem_instance
+        if submission.user_id is None or problem_instance.round_id is None:
+            return None
+        round = problem_instance.round
+        get_freeze_time = getattr(round.contest.controller,
+                                  'get_round_freeze_time', None)
+        freeze_time = get_freeze_time(round) if get_freeze_time else None
+        if freeze_time is None or submission.date < freeze_time:
+            public_result = status
+        else:
+            public_result = RESULT_FOR_FROZEN_SUBMISSION
+        return cls.objects.create(
+                round=round,
+                submission_report=submission_report,
+                user_id=submission.user_id,
+                problem_instance=problem_instance,
+                submission_date=submission.date,
+                judging_date=submission_report.creation_date,
+                result=status or '',
+                public_result=public_result or '')
+
+
+@receiver(post_save, sender=ScoreReport)
+def _append_livedata_event(sender, instance, created, raw, **kwargs):
+    if created and not raw:
+        LivedataEvent.create_for_report(instance.submission_report,
+                                        instance.status)
@@ -1,9 +1,27 @@
+import json
+from datetime import datetime
+
 from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.urlresolvers import reverse
+from django.utils.timezone import utc
+
 from oioioi.base.tests import TestCase
+from oioioi.contests.models import Contest, Submission, SubmissionReport, \
+        ScoreReport
+from oioioi.livedata.models import LivedataEvent
 from oioioi.livedata.utils import get_display_name
+from oioioi.participants.models import Participant
+from oioioi.programs.controllers import ProgrammingContestController
+
+
+class LivedataContestController(ProgrammingContestController):
+    def can_see_livedata(self, request):
+        return True
 
+    def get_round_freeze_time(self, round):
+        return datetime(2012, 6, 1, tzinfo=utc)
 
-# TODO
 
 class TestLivedata(TestCase):
     fixtures = ['test_users', 'test_users_nonames']
@@ -16,3 +34,65 @@ class TestLivedata(TestCase):
         for username, display in cases:
             user = User.objects.get(username=username)
             self.assertEqual(get_display_name(user), display or username)
+
+
+class TestLivedataEvents(TestCase):
+    fixtures = ['test_users', 'test_contest', 'test_full_package',
+                'test_problem_instance', 'test_submission']
+
+    def setUp(self):
+        contest = Contest.objects.get()
+        contest.controller_name = \
+                'oioioi.livedata.tests.LivedataContestController'
+        contest.save()
+        user = User.objects.get(username='test_user')
+        Participant(contest=contest, user=user, status='ACTIVE').save()
+        call_command('rebuild_livedata_events', contest.id)
+        self.url = reverse('livedata_events_view',
+                           kwargs={'contest_id': contest.id, 'round_id': 1})
+
+    def _get_events(self, since=None):
+        url = self.url
+        if since is not None:
+            url += '?since=%d' % since
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return json.loads(response.content)
+
+    def test_events(self):
+        self.assertEqual(LivedataEvent.objects.count(), 2)
+
+        self.client.login(username='test_user')
+        events = self._get_events()
+        self.assertEqual(events[0]['result'], 'CTRL')
+        self.assertEqual([e['result'] for e in events[1:]],
+                         ['FROZEN', 'FROZEN'])
+
+        self.client.login(username='test_admin')
+        events = self._get_events()
+        self.assertEqual([e['result'] for e in events[1:]], ['OK', 'RE'])
+        last_event_id = events[-1]['eventId']
+        self.assertEqual(self._get_events(since=last_event_id), [])
+
+        report = SubmissionReport.objects.create(
+                submission=Submission.objects.get(id=1), kind='NORMAL')
+        ScoreReport.objects.create(submission_report=report, status='WA')
+        events = self._get_events(since=last_event_id)
+        self.assertEqual(len(events), 1)
+        self.assertEqual(events[0]['reportId'], report.id)
+        self.assertEqual(events[0]['result'], 'WA')
+
+    def test_invalid_since(self):
+        self.client.login(username='test_user')
+        for since in ['abc', '-1']:
+            response = self.client.get(self.url + '?since=' + since)
+            self.assertEqual(response.status_code, 404)
+
+    def test_rebuild_keeps_cursors(self):
+        self.client.login(username='test_admin')
+        last_event_id = self._get_events()[-1]['eventId']
+
+        call_command('rebuild_livedata_events', Contest.objects.get().id)
+        self.assertEqual(LivedataEvent.objects.count(), 2)
+        events = self._get_events(since=last_event_id)
+        self.assertEqual([e['result'] for e in events], ['OK', 'RE'])
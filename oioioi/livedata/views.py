@@ -2,20 +2,28 @@ import datetime
 import functools
 from django.conf import settings
 from django.core.cache import get_cache
-from django.db.models import Q
 from django.shortcuts import get_object_or_404
 from django.utils import dateformat
 from django.utils.timezone import utc
-from django.http import HttpResponse
+from django.http import HttpResponse, Http404
 from oioioi.base.permissions import make_request_condition, enforce_condition
 from oioioi.base.utils import jsonify, allow_cross_origin
-from oioioi.contests.models import SubmissionReport
 from oioioi.contests.utils import is_contest_observer, is_contest_admin, \
         contest_exists
+from oioioi.livedata.models import LivedataEvent
 from oioioi.livedata.utils import can_see_livedata, get_display_name
 
 
-RESULT_FOR_FROZEN_SUBMISSION = 'FROZEN'
+def _get_since(request):
+    """Returns the event id passed as the ``since`` parameter, or ``None``
+       if the whole history is requested.
+    """
+    since = request.GET.get('since')
+    if since is None:
+        return None
+    if not since.isdigit():
+        raise Http404
+    return int(since)
 
 
 def cache_unless_admin_or_observer(view):
@@ -27,7 +35,9 @@ def cache_unless_admin_or_observer(view):
             return view(request, round_id)
 
         cache = get_cache('default')
-        cache_key = '%s/%s/%s' % (view.__name__, request.contest.id, round_id)
+        since = _get_since(request)
+        cache_key = '%s/%s/%s/%s' % (view.__name__, request.contest.id,
+                                     round_id, '' if since is None else since)
         result = cache.get(cache_key)
         if result is None:
             result = view(request, round_id)
@@ -75,51 +85,64 @@ def livedata_tasks_view(request, round_id):
 @cache_unless_admin_or_observer
 @jsonify
 def livedata_events_view(request, round_id):
-    user_is_participant = \
-        Q(submission__user__participant__contest_id=request.contest.id,
-          submission__user__participant__status='ACTIVE')
-    submission_ignored = Q(submission__kind='IGNORED')
+    """Returns the judged submissions of the round, read from the log of
+       :class:`~oioioi.livedata.models.LivedataEvent`.
+
+       Every event has an ``eventId``. If it's passed as the ``since``
+       parameter, only newer events are returned, so that clients do not
+       have to download the whole history on every poll. The ``START``
+       control event is sent only with the whole history.
+    """
+    round = get_object_or_404(request.contest.round_set.all(), pk=round_id)
+    events = LivedataEvent.objects \
+        .filter(round=round,
+                user__participant__contest_id=request.contest.id,
+                user__participant__status='ACTIVE') \
+        .exclude(submission_report__submission__kind='IGNORED')
 
-    reports = SubmissionReport.objects \
-        .filter(user_is_participant) \
-        .exclude(submission_ignored) \
-        .select_related('submission') \
-        .prefetch_related('scorereport_set')
+    since = _get_since(request)
+    if since is not None:
+        events = events.filter(id__gt=since)
 
     if (is_contest_admin(request) or is_contest_observer(request)) and \
             'from' in request.GET:
         # Only admin/observer is allowed to specify 'from' parameter.
         start_time = datetime.datetime.utcfromtimestamp(
                 int(request.GET['from'])).replace(tzinfo=utc)
-        reports = reports.filter(creation_date__gte=start_time)
+        events = events.filter(judging_date__gte=start_time)
 
-    round = get_object_or_404(request.contest.round_set.all(), pk=round_id)
-    contest_start = round.start_date
-    reports = reports.filter(submission__problem_instance__round=round)
     if is_contest_admin(request):
-        freeze_time = None
+        result_field = 'result'
     else:
-        freeze_time = request.contest.controller.get_round_freeze_time(round)
-
-    return [{
-        'submissionId': 'START',
-        'reportId': 'START',
-        'teamId': 'START',
-        'taskId': 'START',
-        'submissionTimestamp': int(dateformat.format(request.timestamp, 'U')),
-        'judgingTimestamp': int(dateformat.format(contest_start, 'U')),
-        'result': 'CTRL',
-    }] + [{
-        'submissionId': report.submission_id,
-        'reportId': report.pk,
-        'teamId': report.submission.user_id,
-        'taskId': report.submission.problem_instance_id,
-        'submissionTimestamp':
-            int(dateformat.format(report.submission.date, 'U')),
-        'judgingTimestamp': int(dateformat.format(report.creation_date, 'U')),
-        'result':
-            report.score_report.status
-            if freeze_time is None or report.submission.date < freeze_time
-            else RESULT_FOR_FROZEN_SUBMISSION,
-    } for report in reports.order_by('creation_date')
-        if report.score_report is not None]
+        result_field = 'public_result'
+    events = events.order_by('id').values_list('id',
+            'submission_report__submission_id', 'submission_report_id',
+            'user_id', 'problem_instance_id', 'submission_date',
+            'judging_date', result_field)
+
+    if since is not None:
+        start = []
+    else:
+        start = [{
+            'eventId': 0,
+            'submissionId': 'START',
+            'reportId': 'START',
+            'teamId': 'START',
+            'taskId': 'START',
+            'submissionTimestamp':
+                int(dateformat.format(request.timestamp, 'U')),
+            'judgingTimestamp': int(dateformat.format(round.start_date, 'U')),
+            'result': 'CTRL',
+        }]
+
+    return start + [{
+        'eventId': event_id,
+        'submissionId': submission_id,
+        'reportId': report_id,
+        'teamId': user_id,
+        'taskId': pi_id,
+        'submissionTimestamp': int(dateformat.format(submission_date, 'U')),
+        'judgingTimestamp': int(dateformat.format(judging_date, 'U')),
+        'result': result,
+    } for event_id, submission_id, report_id, user_id, pi_id,
+          submission_date, judging_date, result in events]
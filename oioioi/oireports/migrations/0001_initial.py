@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+import oioioi.oireports.models
+import oioioi.filetracker.fields
+import django.utils.timezone
+from django.conf import settings
+import oioioi.base.fields
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('contests', '0007_auto_20161214_1411'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GeneratedReport',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('creation_date', models.DateTimeField(default=django.utils.timezone.now, verbose_name='creation date')),
+                ('name', models.CharField(max_length=255, verbose_name='name')),
+                ('parameters', models.TextField()),
+                ('status', oioioi.base.fields.EnumField(default=b'?', max_length=64, verbose_name='status', choices=[(b'?', 'Pending'), (b'OK', 'Ready'), (b'ERR', 'Error')])),
+                ('info', models.TextField(verbose_name='info', blank=True)),
+                ('report_file', oioioi.filetracker.fields.FileField(upload_to=oioioi.oireports.models._make_report_filename, null=True, verbose_name='report file', blank=True)),
+                ('contest', models.ForeignKey(verbose_name='contest', to='contests.Contest')),
+                ('creator', models.ForeignKey(on_delete=django.db.models.deletion.SET_NULL, verbose_name='creator', blank=True, to=settings.AUTH_USER_MODEL, null=True)),
+            ],
+            options={
+                'ordering': ['-creation_date'],
+                'verbose_name': 'generated report',
+                'verbose_name_plural': 'generated reports',
+            },
+            bases=(models.Model,),
+        ),
+    ]
@@ -1,3 +1,152 @@
+import json
+import logging
+import os.path
+import tempfile
+import zipfile
+from multiprocessing.pool import ThreadPool
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.files import File
+from django.core.files.base import ContentFile
+from django.db import models
+from django.utils import timezone
+from django.utils.text import get_valid_filename, Truncator
+from django.utils.translation import ugettext_lazy as _
+from celery.task import task
+from filetracker import split_name
+
+from oioioi.base.fields import EnumField, EnumRegistry
 from oioioi.base.utils.deps import check_django_app_dependencies
+from oioioi.base.utils.pdf import render_pdf
+from oioioi.contests.models import Contest
+from oioioi.filetracker.fields import FileField
 
 check_django_app_dependencies(__name__, ['oioioi.oi'])
+
+logger = logging.getLogger(__name__)
+
+
+@task(ignore_result=True)
+def reportsmgr_job(report_id):
+    prefix = "Report generation (id: %s): " % (report_id,)
+    logger.info(prefix + "beginning...")
+
+    try:
+        report = GeneratedReport.objects.get(id=report_id)
+    except GeneratedReport.DoesNotExist:
+        return logger.info(prefix + "report with given id doesn't exist")
+
+    try:
+        report._generate()
+        report.status = 'OK'
+        logger.info(prefix + "success")
+    # pylint: disable=broad-except
+    except Exception as e:
+        logger.error(prefix + "failed", exc_info=True)
+        report.status = 'ERR'
+        report.info = Truncator(unicode(e)).chars(1000)
+    report.save()
+
+
+report_statuses = EnumRegistry()
+report_statuses.register('?', _("Pending"))
+report_statuses.register('OK', _("Ready"))
+report_statuses.register('ERR', _("Error"))
+
+
+def _make_report_filename(instance, filename):
+    return 'oireports/%s/%s' % (instance.contest.id,
+            get_valid_filename(os.path.basename(filename)))
+
+
+class GeneratedReport(models.Model):
+    """A PDF report generated in the background by :func:`reportsmgr_job`.
+
+       The users are split into chunks of
+       ``settings.OIREPORTS_PDF_CHUNK_SIZE`` and a separate PDF is rendered
+       for every chunk, ``settings.OIREPORTS_PDF_CONCURRENCY`` of them at
+       once. A report consisting of more than one chunk is stored as a ZIP
+       archive of the PDFs.
+    """
+    contest = models.ForeignKey(Contest, verbose_name=_("contest"))
+    creator = models.ForeignKey(User, null=True, blank=True,
+                                on_delete=models.SET_NULL,
+                                verbose_name=_("creator"))
+    creation_date = models.DateTimeField(default=timezone.now,
+                                         verbose_name=_("creation date"))
+    name = models.CharField(max_length=255, verbose_name=_("name"))
+    # Serialized by :func:`oioioi.oireports.utils.report_parameters`
+    parameters = models.TextField()
+    status = EnumField(report_statuses, default='?',
+                       verbose_name=_("status"))
+    info = models.TextField(blank=True, verbose_name=_("info"))
+    report_file = FileField(upload_to=_make_report_filename, null=True,
+                            blank=True, verbose_name=_("report file"))
+
+    class Meta(object):
+        verbose_name = _("generated report")
+        verbose_name_plural = _("generated reports")
+        ordering = ['-creation_date']
+
+    def __unicode__(self):
+        return self.name
+
+    def set_parameters(self, parameters):
+        self.parameters = json.dumps(parameters)
+
+    def get_parameters(self):
+        return json.loads(self.parameters)
+
+    def _render_chunks(self):
+        """Yields the LaTeX code of PDFs making up the report."""
+        from oioioi.oireports.utils import get_report_scope, \
+                serialize_reports, render_report
+
+        title, users, test_groups = get_report_scope(self.contest,
+                                                     self.get_parameters())
+        users = list(users)
+        chunk_size = max(1, settings.OIREPORTS_PDF_CHUNK_SIZE)
+        any_rows = False
+        for start in xrange(0, len(users), chunk_size):
+            rows = serialize_reports(users[start:start + chunk_size],
+                                     test_groups.keys(), test_groups)
+            if rows:
+                any_rows = True
+                yield render_report('oireports/pdfreport.tex', title, rows,
+                                    self.creation_date)
+        if not any_rows:
+            yield render_report('oireports/pdfreport.tex', title, [],
+                                self.creation_date)
+
+    def _generate(self):
+        # Each thread waits for its own pdflatex process, so the chunks are
+        # compiled in parallel, while the next ones are being serialized.
+        pool = ThreadPool(max(1, settings.OIREPORTS_PDF_CONCURRENCY))
+        try:
+            results = [pool.apply_async(render_pdf, (tex_code,))
+                       for tex_code in self._render_chunks()]
+            if len(results) == 1:
+                self.report_file.save(self.name + '.pdf',
+                                      ContentFile(results[0].get()),
+                                      save=False)
+                return
+            with tempfile.TemporaryFile() as archive_file:
+                archive = zipfile.ZipFile(archive_file, 'w',
+                                          zipfile.ZIP_DEFLATED)
+                for i, result in enumerate(results):
+                    archive.writestr('%s-%03d.pdf' % (self.name, i + 1),
+                                     result.get())
+                    # Do not keep the written PDFs in memory
+                    results[i] = None
+                archive.close()
+                archive_file.seek(0)
+                self.report_file.save(self.name + '.zip', File(archive_file),
+                                      save=False)
+        finally:
+            pool.terminate()
+
+    def download_name(self):
+        """Returns the name under which the report file is downloaded."""
+        path = split_name(unicode(self.report_file.name))[0]
+        return self.name + os.path.splitext(path)[1]
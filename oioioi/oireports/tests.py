@@ -9,6 +9,7 @@ from django.utils.timezone import utc
 from oioioi.base.tests import TestCase, fake_time
 from oioioi.contests.models import Contest
 from oioioi.filetracker.tests import TestStreamingMixin
+from oioioi.oireports.models import GeneratedReport
 from oioioi.oireports.views import CONTEST_REPORT_KEY
 from oioioi.participants.models import Participant
 
@@ -47,6 +48,18 @@ class TestReportViews(TestCase, TestStreamingMixin):
         self.client.login(username='test_admin')
         with fake_time(datetime(2015, 8, 5, tzinfo=utc)):
             response = self.client.post(url, post_vars)
+            self.assertRedirects(response, url)
+
+            # The report is generated in the background and listed
+            # on the reports page when finished.
+            report = GeneratedReport.objects.get()
+            self.assertEqual(report.status, 'OK')
+            download_url = reverse('oireports_download', kwargs={
+                'contest_id': contest.id, 'report_id': report.id})
+            response = self.client.get(url)
+            self.assertContains(response, download_url)
+
+            response = self.client.get(download_url)
             pages = slate.PDF(StringIO(self.streamingContent(response)))
             self.assertIn("test_user", pages[0])
             self.assertIn("Wynik:34", pages[0])
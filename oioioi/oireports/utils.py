@@ -0,0 +1,240 @@
+import itertools
+from collections import defaultdict
+from multiprocessing.pool import ThreadPool
+from operator import attrgetter
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.template.loader import render_to_string
+
+from oioioi.contests.models import Round, UserResultForProblem, \
+        ProblemInstance
+from oioioi.oireports.forms import CONTEST_REPORT_KEY
+from oioioi.programs.models import CompilationReport, GroupReport, \
+        TestReport
+from oioioi.participants.models import Region
+
+
+# Number of users whose reports are serialized at once
+SERIALIZATION_CHUNK_SIZE = 200
+
+
+def users_in_contest(contest, region=None):
+    queryset = User.objects.filter(participant__contest=contest,
+        participant__status='ACTIVE')
+    if region is not None:
+        queryset = queryset.filter(
+                participant__participants_onsiteregistration__region_id=region)
+    return queryset
+
+
+def report_parameters(report_form, test_groups):
+    """Returns a JSON-serializable dictionary describing the report
+       requested in a valid
+       :class:`~oioioi.oireports.forms.OIReportForm`.
+
+       The dictionary is accepted by :func:`get_report_scope`.
+    """
+    if report_form.cleaned_data['is_single_report']:
+        single_user = report_form.cleaned_data['single_report_user'] \
+                .username
+    else:
+        single_user = None
+    return {
+        'round': report_form.cleaned_data['report_round'],
+        'region': report_form.cleaned_data['report_region'],
+        'single_user': single_user,
+        'test_groups': dict((str(pi.id), list(groups))
+                            for pi, groups in test_groups.iteritems()),
+    }
+
+
+def get_report_scope(contest, parameters):
+    """Returns a tuple ``(title, users, test_groups)`` describing the report
+       given by ``parameters`` (see :func:`report_parameters`).
+
+       ``users`` is a queryset ordered as in the report and ``test_groups``
+       maps problem instances into lists of names of test groups to include.
+    """
+    round_key = parameters['round']
+    title = contest.name
+    if round_key != CONTEST_REPORT_KEY:
+        round = Round.objects.get(contest=contest, id=round_key)
+        title += ' -- ' + round.name
+
+    region_key = parameters['region']
+    if region_key == CONTEST_REPORT_KEY:
+        region = None
+    else:
+        region = Region.objects.get(short_name=region_key, contest=contest)
+
+    if parameters['single_user'] is not None:
+        users = User.objects.filter(username=parameters['single_user'])
+    else:
+        users = users_in_contest(contest, region)
+    users = users.order_by('last_name', 'first_name', 'username')
+
+    pis = ProblemInstance.objects.filter(contest=contest) \
+            .in_bulk(parameters['test_groups'].keys())
+    test_groups = dict((pis[int(pi_id)], groups) for pi_id, groups
+                       in parameters['test_groups'].iteritems()
+                       if int(pi_id) in pis)
+    return title, users, test_groups
+
+
+def _read_source(source_file):
+    try:
+        return source_file.read()
+    finally:
+        source_file.close()
+
+
+def _read_sources(source_files):
+    concurrency = max(1, settings.OIREPORTS_DOWNLOAD_CONCURRENCY)
+    if concurrency == 1 or len(source_files) <= 1:
+        return map(_read_source, source_files)
+    pool = ThreadPool(min(concurrency, len(source_files)))
+    try:
+        return pool.map(_read_source, source_files)
+    finally:
+        pool.terminate()
+
+
+def _filter_active_reports(queryset, submission_ids):
+    return queryset.filter(submission_report__submission_id__in=submission_ids,
+                           submission_report__status='ACTIVE',
+                           submission_report__kind__in=['INITIAL', 'NORMAL'])
+
+
+def _serialize_chunk(users, problem_instances, test_groups):
+    results = list(UserResultForProblem.objects
+            .filter(user__in=users,
+                    problem_instance__in=list(problem_instances),
+                    submission_report__isnull=False)
+            .select_related('problem_instance__problem',
+                    'submission_report__submission__programsubmission'))
+    if not results:
+        return []
+
+    submission_ids = [r.submission_report.submission_id for r in results]
+    all_groups = set(itertools.chain.from_iterable(test_groups.values()))
+
+    compilation_reports = dict((c.submission_report_id, c) for c in
+            CompilationReport.objects.filter(submission_report_id__in=[
+                r.submission_report_id for r in results]))
+
+    test_reports = defaultdict(list)
+    for test_report in _filter_active_reports(TestReport.objects,
+                                              submission_ids) \
+            .filter(test_group__in=all_groups) \
+            .select_related('submission_report') \
+            .order_by('test__kind', 'test__order', 'test_name'):
+        test_reports[test_report.submission_report.submission_id] \
+                .append(test_report)
+
+    group_reports = {}
+    for group_report in _filter_active_reports(GroupReport.objects,
+                                               submission_ids) \
+            .filter(group__in=all_groups) \
+            .select_related('submission_report') \
+            .order_by('id'):
+        group_reports[(group_report.submission_report.submission_id,
+                       group_report.group)] = group_report
+
+    source_files = [r.submission_report.submission.programsubmission
+                    .source_file for r in results]
+    sources = _read_sources(source_files)
+
+    resultsets_by_user = defaultdict(list)
+    for r, source_file, code in zip(results, source_files, sources):
+        submission_id = r.submission_report.submission_id
+        groups_set = set(test_groups[r.problem_instance])
+        tests = [t for t in test_reports[submission_id]
+                 if t.test_group in groups_set]
+
+        groups = []
+        for group_name, group_tests in itertools.groupby(tests,
+                attrgetter('test_group')):
+            groups.append({'tests': list(group_tests),
+                'report': group_reports[(submission_id, group_name)]})
+
+        problem_score = None
+        max_problem_score = None
+        for group in groups:
+            group_score = group['report'].score
+            group_max_score = group['report'].max_score
+
+            if problem_score is None:
+                problem_score = group_score
+            elif group_score is not None:
+                problem_score += group_score
+
+            if max_problem_score is None:
+                max_problem_score = group_max_score
+            elif group_max_score is not None:
+                max_problem_score += group_max_score
+
+        resultsets_by_user[r.user_id].append(dict(
+            result=r,
+            score=problem_score,
+            max_score=max_problem_score,
+            compilation_report=compilation_reports.get(
+                    r.submission_report_id),
+            groups=groups,
+            code=code,
+            codefile=source_file.file.name
+        ))
+
+    data = []
+    for user in users:
+        resultsets = resultsets_by_user.get(user.id)
+        if not resultsets:
+            continue
+        total_score = None
+        for resultset in resultsets:
+            if total_score is None:
+                total_score = resultset['score']
+            elif resultset['score'] is not None:
+                total_score += resultset['score']
+        data.append({
+            'user': user,
+            'resultsets': resultsets,
+            'sum': total_score,
+        })
+    return data
+
+
+def serialize_reports(users, problem_instances, test_groups):
+    """Generates a list of dictionaries representing reports of the given
+       users, in the order of ``users``. Users without any results are
+       skipped.
+
+       The reports are built from a few bulk queries for every chunk
+       of users and the source files are read concurrently by
+       ``settings.OIREPORTS_DOWNLOAD_CONCURRENCY`` threads.
+
+       :type users: iterable of :cls:`django.contrib.auth.User`
+       :param users: users to generate the reports for
+       :type problem_instances: list of
+                                 :cls:`oioioi.contests.ProblemInstance`
+       :param problem_instances: problem instances to include in the report
+       :type test_groups: dict(:cls:`oioioi.contests.ProblemInstance`
+                           -> list of str)
+       :param test_groups: dictionary mapping problem instances into lists
+                           of names of test groups to include
+    """
+    users = list(users)
+    data = []
+    for start in xrange(0, len(users), SERIALIZATION_CHUNK_SIZE):
+        data.extend(_serialize_chunk(
+                users[start:start + SERIALIZATION_CHUNK_SIZE],
+                problem_instances, test_groups))
+    return data
+
+
+def render_report(template_name, title, rows, timestamp):
+    return render_to_string(template_name, {
+        'rows': rows,
+        'title': title,
+        'timestamp': timestamp,
+    })
@@ -1,39 +1,29 @@
-import itertools
-from operator import attrgetter
-
-from django.template.loader import render_to_string
-from django.template.response import TemplateResponse
-from django.template import RequestContext
+from django.contrib import messages
 from django.core.exceptions import SuspiciousOperation
-from django.core.urlresolvers import reverse
 from django.core.files.base import ContentFile
+from django.core.urlresolvers import reverse
+from django.shortcuts import get_object_or_404, redirect
+from django.template.response import TemplateResponse
 from django.utils.translation import ugettext_lazy as _
-from django.contrib.auth.models import User
 
 from oioioi.base.permissions import enforce_condition
-from oioioi.base.utils.pdf import generate_pdf
 from oioioi.base.utils.user_selection import get_user_hints_view
 from oioioi.contests.menu import contest_admin_menu_registry
 from oioioi.filetracker.utils import stream_file
-from oioioi.contests.models import Round, UserResultForProblem, Submission
+from oioioi.contests.models import Submission
 from oioioi.contests.utils import is_contest_admin, contest_exists, \
         has_any_rounds
 from oioioi.oireports.forms import OIReportForm, CONTEST_REPORT_KEY
-from oioioi.programs.models import CompilationReport, GroupReport, \
-        TestReport
-from oioioi.participants.models import Region
+from oioioi.oireports.models import GeneratedReport, reportsmgr_job
+from oioioi.oireports.utils import report_parameters, get_report_scope, \
+        serialize_reports, render_report
 
 
-# FIXME conditions for views expressing oi dependence?
+# Number of recently generated reports listed on the reports page
+REPORTS_LIST_LENGTH = 20
 
-def _users_in_contest(request, region=None):
-    queryset = User.objects.filter(participant__contest=request.contest,
-        participant__status='ACTIVE')
-    if region is not None:
-        queryset = queryset.filter(
-                participant__participants_onsiteregistration__region_id=region)
-    return queryset
 
+# FIXME conditions for views expressing oi dependence?
 
 @contest_admin_menu_registry.register_decorator(_("Printing reports"),
     lambda request: reverse('oireports',
@@ -56,187 +46,49 @@ def oireports_view(request):
                 raise SuspiciousOperation
     else:
         form = OIReportForm(request)
+    reports = GeneratedReport.objects.filter(contest=request.contest) \
+            .select_related('creator')[:REPORTS_LIST_LENGTH]
     return TemplateResponse(request, 'oireports/report_options.html', {
             'form': form,
+            'reports': reports,
             'CONTEST_REPORT_KEY': CONTEST_REPORT_KEY
     })
 
 
-def _render_report(request, template_name, title, users,
-        problem_instances, test_groups):
-    rows = _serialize_reports(users, problem_instances, test_groups)
-    return render_to_string(template_name,
-            context_instance=RequestContext(request, {
-                'rows': rows,
-                'title': title,
-            }))
-
-
-def _serialize_report(user, problem_instances, test_groups):
-    """Generates a dictionary representing a single report.
-
-
-       :param request: Django request
-       :type user: :cls:`django.contrib.auth.User`
-       :param user: user to generate the report for
-       :type problem_instances: list of
-                                 :cls:`oioioi.contests.ProblemInstance`
-       :param problem_instances: problem instances to include in the report
-       :type test_groups: dict(:cls:`oioioi.contests.ProblemInstance`
-                           -> list of str)
-       :param test_groups: dictionary mapping problem instances into lists
-                           of names of test groups to include
-    """
-
-    resultsets = []
-    total_score = None
-
-    results = UserResultForProblem.objects.filter(
-            user=user,
-            problem_instance__in=list(problem_instances),
-            submission_report__isnull=False)
-    for r in results:
-        problem_instance = r.problem_instance
-        submission_report = r.submission_report
-        submission = submission_report.submission
-        source_file = submission.programsubmission.source_file
-        groups = list(test_groups[problem_instance])
-
-        try:
-            compilation_report = CompilationReport.objects \
-                    .get(submission_report=submission_report)
-        except CompilationReport.DoesNotExist:
-            compilation_report = None
-
-        try:
-            test_reports = TestReport.objects \
-                    .filter(submission_report__submission=submission) \
-                    .filter(submission_report__status='ACTIVE') \
-                    .filter(submission_report__kind__in=['INITIAL',
-                                                         'NORMAL']) \
-                    .filter(test_group__in=groups) \
-                    .order_by('test__kind', 'test__order', 'test_name')
-        except TestReport.DoesNotExist:
-            test_reports = []
-
-        group_reports = GroupReport.objects \
-                .filter(submission_report__submission=submission) \
-                .filter(submission_report__status='ACTIVE') \
-                .filter(submission_report__kind__in=['INITIAL', 'NORMAL']) \
-                .filter(group__in=groups)
-        group_reports = dict((g.group, g) for g in group_reports)
-        groups = []
-        for group_name, tests in itertools.groupby(test_reports,
-                attrgetter('test_group')):
-            groups.append({'tests': list(tests),
-                'report': group_reports[group_name]})
-
-        problem_score = None
-        max_problem_score = None
-        for group in groups:
-            group_score = group['report'].score
-            group_max_score = group['report'].max_score
-
-            if problem_score is None:
-                problem_score = group_score
-            elif group_score is not None:
-                problem_score += group_score
-
-            if max_problem_score is None:
-                max_problem_score = group_max_score
-            elif group_max_score is not None:
-                max_problem_score += group_max_score
-
-        resultsets.append(dict(
-            result=r,
-            score=problem_score,
-            max_score=max_problem_score,
-            compilation_report=compilation_report,
-            groups=groups,
-            code=source_file.read(),
-            codefile=source_file.file.name
-        ))
-        source_file.close()
-        if total_score is None:
-            total_score = problem_score
-        elif problem_score is not None:
-            total_score += problem_score
-    return {
-        'user': user,
-        'resultsets': resultsets,
-        'sum': total_score,
-    }
-
-
-def _serialize_reports(users, problem_instances, test_groups):
-    """Runs :meth:`serialize_report` for a number of users.
-
-       Returns a list of objects produced by serialize_report, sorted
-       by user's last name and first name.
-    """
-    data = []
-    for user in users.order_by('last_name', 'first_name', 'username'):
-        user_data = _serialize_report(user, problem_instances,
-                test_groups)
-        if user_data['resultsets']:
-            data.append(user_data)
-    return data
-
-
-def _report_text(request, template_file, report_form):
-    round_key = report_form.cleaned_data['report_round']
-    if round_key == CONTEST_REPORT_KEY:
-        round = None
-    else:
-        round = Round.objects.get(contest=request.contest, id=round_key)
-
-    title = request.contest.name
-    if round:
-        title += ' -- ' + round.name
-
-    # Region object
-    region_key = report_form.cleaned_data['report_region']
-    if region_key == CONTEST_REPORT_KEY:
-        region = None
-    else:
-        region = Region.objects.get(short_name=region_key,
-                contest=request.contest)
-
-    if report_form.cleaned_data['is_single_report']:
-        users = User.objects \
-            .filter(username=report_form.cleaned_data['single_report_user'])
-    else:
-        users = _users_in_contest(request, region)
-
-    # Generate report
-    testgroups = report_form.get_testgroups(request)
-    return _render_report(
-        request,
-        template_file,
-        title,
-        users,
-        testgroups.keys(),
-        testgroups
-    )
-
-
 def generate_pdfreport(request, report_form):
-    report = _report_text(request, 'oireports/pdfreport.tex', report_form)
-    filename = '%s-%s-%s.pdf' % (request.contest.id,
-            report_form.cleaned_data['report_round'],
-            report_form.cleaned_data['report_region'])
-
-    return generate_pdf(report, filename)
+    report = GeneratedReport(contest=request.contest, creator=request.user,
+            name='%s-%s-%s' % (request.contest.id,
+                report_form.cleaned_data['report_round'],
+                report_form.cleaned_data['report_region']))
+    report.set_parameters(report_parameters(report_form,
+            report_form.get_testgroups(request)))
+    report.save()
+    reportsmgr_job.delay(report.id)
+    messages.info(request, _("The report is being generated. It will be "
+                             "available for download below when finished."))
+    return redirect('oireports', contest_id=request.contest.id)
 
 
 def generate_xmlreport(request, report_form):
-    report = _report_text(request, 'oireports/xmlreport.xml', report_form)
+    title, users, test_groups = get_report_scope(request.contest,
+            report_parameters(report_form,
+                              report_form.get_testgroups(request)))
+    rows = serialize_reports(users, test_groups.keys(), test_groups)
+    report = render_report('oireports/xmlreport.xml', title, rows,
+                           request.timestamp)
     filename = '%s-%s-%s.xml' % (request.contest.id,
         report_form.cleaned_data['report_round'],
         report_form.cleaned_data['report_region'])
     return stream_file(ContentFile(report.encode('utf-8')), filename)
 
 
+@enforce_condition(contest_exists & is_contest_admin)
+def download_report_view(request, report_id):
+    report = get_object_or_404(GeneratedReport, id=report_id,
+                               contest=request.contest, status='OK')
+    return stream_file(report.report_file, report.download_name())
+
+
 @enforce_condition(contest_exists & is_contest_admin)
 def get_report_users_view(request):
     queryset = Submission.objects.filter(
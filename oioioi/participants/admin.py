@@ -14,7 +14,8 @@ from oioioi.contests.menu import contest_admin_menu_registry
 from oioioi.participants.forms import ParticipantForm, ExtendRoundForm, \
         RegionForm
 from oioioi.participants.models import Participant, OnsiteRegistration, Region
-from oioioi.contests.models import RoundTimeExtension
+from oioioi.contests.models import RoundTimeExtension, \
+        invalidate_visible_contests
 from oioioi.participants.utils import contest_has_participants, \
         is_contest_with_participants, has_participants_admin, \
         contest_is_onsite
@@ -94,10 +95,12 @@ class ParticipantAdmin(admin.ModelAdmin):
 
     def make_active(self, request, queryset):
         queryset.update(status='ACTIVE')
+        invalidate_visible_contests()
     make_active.short_description = _("Mark selected participants as active")
 
     def make_banned(self, request, queryset):
         queryset.update(status='BANNED')
+        invalidate_visible_contests()
     make_banned.short_description = _("Mark selected participants as banned")
 
     def extend_round(self, request, queryset):
@@ -1,13 +1,15 @@
 from nose.tools import nottest
 from django.core.exceptions import ObjectDoesNotExist
 from django.db import models
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
 from django.contrib.auth.models import User
 from django.utils.translation import ugettext_lazy as _
 
 from oioioi.base.fields import EnumRegistry, EnumField
 from oioioi.base.utils.deps import check_django_app_dependencies
 from oioioi.base.utils.validators import validate_db_string_id
-from oioioi.contests.models import Contest
+from oioioi.contests.models import Contest, invalidate_visible_contests
 from oioioi.participants.fields import \
         OneToOneBothHandsCascadingParticipantField
 
@@ -63,6 +65,12 @@ class Participant(models.Model):
         self.save()
 
 
+@receiver(post_save, sender=Participant)
+@receiver(post_delete, sender=Participant)
+def _invalidate_visible_contests(sender, **kwargs):
+    invalidate_visible_contests()
+
+
 class Region(models.Model):
     short_name = models.CharField(max_length=10,
         validators=[validate_db_string_id])
@@ -166,6 +166,16 @@ class ProblemController(RegisteredSubclassesBase, ObjectWithMixins):
 
         picontroller.submission_queued(submission, async_result)
 
+    def judge_many(self, submissions, extra_args=None, is_rejudge=False):
+        """Judges many submissions to the same problem instance.
+
+           Controllers may override it to load the data shared by the
+           submissions only once. The default implementation calls
+           :meth:`judge` for every submission.
+        """
+        for submission in submissions:
+            self.judge(submission, dict(extra_args or {}), is_rejudge)
+
     def mixins_for_admin(self):
         """Returns an iterable of mixins to add to the default
            :class:`oioioi.problems.admin.ProblemAdmin` for
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+from oioioi.problems.models import problem_search_terms, trigrams
+
+
+def build_search_index(apps, _schema_editor):
+    Problem = apps.get_model('problems', 'Problem')
+    Tag = apps.get_model('problems', 'Tag')
+    TagThrough = apps.get_model('problems', 'TagThrough')
+    ProblemSearchTerm = apps.get_model('problems', 'ProblemSearchTerm')
+    TagTrigram = apps.get_model('problems', 'TagTrigram')
+
+    tag_names = {}
+    for problem_id, tag_name in \
+            TagThrough.objects.values_list('problem_id', 'tag__name'):
+        tag_names.setdefault(problem_id, []).append(tag_name)
+
+    for problem in Problem.objects.only('id', 'name', 'short_name') \
+            .iterator():
+        terms = problem_search_terms(problem, tag_names.get(problem.id, []))
+        ProblemSearchTerm.objects.bulk_create(
+                ProblemSearchTerm(problem_id=problem.id, term=term,
+                                  weight=weight)
+                for term, weight in terms.iteritems())
+
+    TagTrigram.objects.bulk_create(
+            TagTrigram(tag_id=tag.id, trigram=trigram)
+            for tag in Tag.objects.all() for trigram in trigrams(tag.name))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('problems', '0007_auto_20161214_1411'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProblemSearchTerm',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('term', models.CharField(max_length=64, db_index=True)),
+                ('weight', models.PositiveSmallIntegerField()),
+                ('problem', models.ForeignKey(related_name='search_terms', to='problems.Problem')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='TagTrigram',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('trigram', models.CharField(max_length=3, db_index=True)),
+                ('tag', models.ForeignKey(related_name='trigrams', to='problems.Tag')),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='tagtrigram',
+            unique_together=set([('tag', 'trigram')]),
+        ),
+        migrations.AlterUniqueTogether(
+            name='problemsearchterm',
+            unique_together=set([('problem', 'term')]),
+        ),
+        migrations.RunPython(build_search_index, migrations.RunPython.noop),
+    ]
@@ -1,13 +1,18 @@
 import logging
 import os.path
+import re
+import time
+import unicodedata
 from contextlib import contextmanager
 from traceback import format_exception
 
 from django.core import validators
+from django.core.cache import cache
 from django.core.validators import validate_slug
 from django.core.files.base import ContentFile
 from django.db import models, transaction
-from django.db.models.signals import post_save, pre_delete
+from django.db.models.signals import post_save, pre_delete, \
+        post_delete
 from django.dispatch import receiver
 from django.utils import timezone
 from django.utils.translation import ugettext_lazy as _, pgettext_lazy
@@ -351,3 +356,162 @@ class TagThrough(models.Model):
 
     class Meta(object):
         unique_together = ('problem', 'tag')
+
+
+# Weights of the words of problems' fields in the search ranking
+SHORT_NAME_WEIGHT = 3
+NAME_WEIGHT = 2
+TAG_WEIGHT = 1
+
+SEARCH_TERM_MAX_LENGTH = 64
+
+_WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def search_words(text):
+    """Splits the text into lowercase words without diacritics, as stored
+       in :class:`ProblemSearchTerm`.
+    """
+    text = unicodedata.normalize('NFKD', unicode(text).lower())
+    text = u''.join(c for c in text if not unicodedata.combining(c))
+    return [word[:SEARCH_TERM_MAX_LENGTH] for word in _WORD_RE.findall(text)]
+
+
+def trigrams(text):
+    """Returns the set of trigrams of the lowercase text."""
+    text = unicode(text).lower()
+    return set(text[i:i + 3] for i in xrange(len(text) - 2))
+
+
+class ProblemSearchTerm(models.Model):
+    """A word of a problem's short name, name or tags, indexed for
+       the prefix search in the problemset
+       (see :func:`oioioi.problems.search.search_problems`).
+    """
+    problem = models.ForeignKey(Problem, related_name='search_terms')
+    term = models.CharField(max_length=SEARCH_TERM_MAX_LENGTH, db_index=True)
+    weight = models.PositiveSmallIntegerField()
+
+    class Meta(object):
+        unique_together = ('problem', 'term')
+
+
+class TagTrigram(models.Model):
+    """A trigram of a tag name, used to find tags containing a given text
+       without scanning all of them.
+    """
+    tag = models.ForeignKey(Tag, related_name='trigrams')
+    trigram = models.CharField(max_length=3, db_index=True)
+
+    class Meta(object):
+        unique_together = ('tag', 'trigram')
+
+
+def problem_search_terms(problem, tag_names):
+    """Returns a dictionary mapping the search terms of the problem
+       into their weights.
+    """
+    terms = {}
+    for text, weight in [(problem.short_name, SHORT_NAME_WEIGHT),
+                         (problem.name, NAME_WEIGHT)] + \
+            [(name, TAG_WEIGHT) for name in tag_names]:
+        for word in search_words(text):
+            terms[word] = max(weight, terms.get(word, 0))
+    return terms
+
+
+@transaction.atomic
+def update_problem_search_index(problem, prune_only=False):
+    """Updates the search terms of the problem.
+
+       If ``prune_only`` is set, no new terms are created. It is used when
+       tags are removed from a problem, which may happen while the problem
+       itself (and its terms) is being deleted.
+    """
+    tag_names = TagThrough.objects.filter(problem_id=problem.id) \
+            .values_list('tag__name', flat=True)
+    terms = problem_search_terms(problem, tag_names)
+    old_terms = dict(ProblemSearchTerm.objects.filter(problem_id=problem.id)
+                     .values_list('term', 'weight'))
+
+    removed = [term for term in old_terms if term not in terms]
+    if removed:
+        ProblemSearchTerm.objects.filter(problem_id=problem.id,
+                                         term__in=removed).delete()
+    for term, weight in terms.iteritems():
+        if term in old_terms and old_terms[term] != weight:
+            ProblemSearchTerm.objects.filter(problem_id=problem.id,
+                                             term=term).update(weight=weight)
+    if not prune_only:
+        ProblemSearchTerm.objects.bulk_create(
+                ProblemSearchTerm(problem_id=problem.id, term=term,
+                                  weight=weight)
+                for term, weight in terms.iteritems()
+                if term not in old_terms)
+
+
+@transaction.atomic
+def update_tag_trigrams(tag):
+    TagTrigram.objects.filter(tag_id=tag.id).delete()
+    TagTrigram.objects.bulk_create(TagTrigram(tag_id=tag.id, trigram=trigram)
+                                   for trigram in trigrams(tag.name))
+
+
+PROBLEMSET_VERSION_CACHE_KEY = 'problems/problemset/version'
+
+
+def problemset_version():
+    """Returns the version of the data shown in the problemset, used in
+       cache keys by :func:`oioioi.problems.search.search_problems`.
+    """
+    # The initial value depends on time, so that the version doesn't go
+    # back when the key is evicted from the cache.
+    cache.add(PROBLEMSET_VERSION_CACHE_KEY, int(time.time() * 1000), None)
+    return cache.get(PROBLEMSET_VERSION_CACHE_KEY) or 0
+
+
+def invalidate_problemset():
+    """Invalidates cached search results of the problemset."""
+    try:
+        cache.incr(PROBLEMSET_VERSION_CACHE_KEY)
+    except ValueError:
+        problemset_version()
+
+
+@receiver(post_save, sender=Problem)
+def _update_problem_search_index(sender, instance, **kwargs):
+    update_problem_search_index(instance)
+    invalidate_problemset()
+
+
+@receiver(post_save, sender=TagThrough)
+def _add_tag_to_search_index(sender, instance, **kwargs):
+    problem = Problem.objects.filter(id=instance.problem_id).first()
+    if problem is not None:
+        update_problem_search_index(problem)
+    invalidate_problemset()
+
+
+@receiver(post_delete, sender=TagThrough)
+def _remove_tag_from_search_index(sender, instance, **kwargs):
+    problem = Problem.objects.filter(id=instance.problem_id).first()
+    if problem is not None:
+        update_problem_search_index(problem, prune_only=True)
+    invalidate_problemset()
+
+
+@receiver(post_save, sender=Tag)
+def _update_tag_search_index(sender, instance, created, raw, **kwargs):
+    update_tag_trigrams(instance)
+    if not created and not raw:
+        # The tag could have been renamed
+        for problem in Problem.objects.filter(tagthrough__tag=instance):
+            update_problem_search_index(problem)
+    invalidate_problemset()
+
+
+@receiver(post_delete, sender=Problem)
+@receiver(post_save, sender=ProblemSite)
+@receiver(post_delete, sender=ProblemSite)
+def _invalidate_problemset(sender, **kwargs):
+    invalidate_problemset()
@@ -9,6 +9,7 @@ from django.utils.safestring import mark_safe
 from django.template.loader import render_to_string
 from django.template.response import TemplateResponse
 from django.shortcuts import get_object_or_404, redirect
+from django.http import Http404
 
 from oioioi.base.menu import OrderedRegistry
 from oioioi.problems.utils import query_statement, query_zip
@@ -52,7 +53,9 @@ def problem_site_tab(title, key, order=sys.maxint, condition=None):
 def problem_site_statement_zip_view(request, site_key, path):
     problem = get_object_or_404(Problem, problemsite__url_key=site_key)
     statement = query_statement(problem.id)
-    return query_zip(statement, path)
+    if statement is None:
+        raise Http404
+    return query_zip(statement, path, request)
 
 
 @problem_site_tab(_("Problem statement"),
@@ -64,8 +67,7 @@ def problem_site_statement(request, problem):
                 'problems/no_problem_statement.html',
                 {'problem': problem})
     elif statement.extension == '.zip':
-        response = problem_site_statement_zip_view(request,
-                problem.problemsite.url_key, 'index.html')
+        response = query_zip(statement, 'index.html')
         statement_html = mark_safe(response.content)
     else:
         statement_url = reverse('problem_site_external_statement',
@@ -0,0 +1,158 @@
+"""Searching the problemset.
+
+   Problems are searched using an index of the words of their short names,
+   names and tags (see :class:`~oioioi.problems.models.ProblemSearchTerm`).
+   Every word of the query has to be a prefix of a term of the problem and
+   problems are ranked by the weights of the matched terms, exact matches
+   counting twice.
+
+   Ordered lists of ids of the found problems are cached, keyed by the
+   query and the searched queryset, and only the problems from the displayed
+   page are fetched (see :class:`LazyProblemList`).
+"""
+
+import hashlib
+import re
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Q, Count, Sum, Case, When, Value, F, \
+        IntegerField
+from django.utils.encoding import force_bytes
+
+from oioioi.problems.models import Problem, ProblemSearchTerm, Tag, \
+        TagThrough, TagTrigram, problemset_version, search_words, trigrams
+
+
+# Problems are fetched in chunks of that size, when all of them
+# are accessed.
+FETCH_CHUNK_SIZE = 100
+
+_TAG_SEPARATOR_RE = re.compile(r'[\s,]+')
+
+
+def parse_tags(text):
+    """Returns the list of tag names in a tag search query."""
+    return [name for name in _TAG_SEPARATOR_RE.split(text) if name]
+
+
+def _filter_by_tags(problems, tag_names):
+    tag_ids = list(Tag.objects.filter(name__in=tag_names)
+                   .values_list('id', flat=True))
+    if len(tag_ids) < len(set(tag_names)):
+        return problems.none()
+    tagged = TagThrough.objects.filter(tag_id__in=tag_ids) \
+            .values('problem') \
+            .annotate(num_tags=Count('tag')) \
+            .filter(num_tags=len(tag_ids)) \
+            .values('problem')
+    return problems.filter(id__in=tagged)
+
+
+def _rank_by_words(problems, words):
+    # Every word has to be matched by some term, possibly by the same one
+    # as another word
+    matches = dict(('matched_%d' % i,
+                    Sum(Case(When(term__startswith=word, then=Value(1)),
+                             default=Value(0), output_field=IntegerField())))
+                   for i, word in enumerate(words))
+    score = Case(When(term__in=words, then=F('weight') * 2),
+                 default=F('weight'), output_field=IntegerField())
+    ranking = ProblemSearchTerm.objects \
+            .filter(reduce(lambda a, b: a | b,
+                           [Q(term__startswith=word) for word in words]),
+                    problem__in=problems.values('id')) \
+            .values('problem') \
+            .annotate(score=Sum(score), **matches) \
+            .filter(**dict((name + '__gt', 0) for name in matches)) \
+            .order_by('-score', 'problem__name', 'problem')
+    return [row['problem'] for row in ranking]
+
+
+def _find_problem_ids(problems, query, tag_names):
+    if tag_names:
+        problems = _filter_by_tags(problems, tag_names)
+    words = []
+    for word in search_words(query):
+        if word not in words:
+            words.append(word)
+    if not words:
+        return list(problems.order_by('name', 'id')
+                    .values_list('id', flat=True))
+    return _rank_by_words(problems, words)
+
+
+def _cache_key(problems, query, tag_names):
+    params = repr((unicode(problems.query), query, sorted(tag_names)))
+    return 'problems/search/%d/%s' % (problemset_version(),
+            hashlib.md5(force_bytes(params)).hexdigest())
+
+
+def search_problems(problems, query='', tag_names=()):
+    """Returns a :class:`LazyProblemList` of the problems from
+       the queryset ``problems`` matching the text ``query`` and having
+       all tags from ``tag_names``.
+
+       Without a text query, problems are ordered by name.
+    """
+    tag_names = list(tag_names)
+    key = _cache_key(problems, query, tag_names)
+    problem_ids = cache.get(key)
+    if problem_ids is None:
+        problem_ids = _find_problem_ids(problems, query, tag_names)
+        cache.set(key, problem_ids, settings.PROBLEMSET_SEARCH_CACHE_TIMEOUT)
+    return LazyProblemList(problem_ids)
+
+
+def find_tags(substr, limit):
+    """Returns names of at most ``limit`` tags containing ``substr``.
+       Tags starting with it are returned first.
+    """
+    substr = substr.lower()
+    tags = Tag.objects.filter(name__icontains=substr)
+    substr_trigrams = trigrams(substr)
+    if substr_trigrams:
+        # A tag contains the text only if it has all its trigrams
+        tags = tags.filter(id__in=TagTrigram.objects
+                .filter(trigram__in=substr_trigrams)
+                .values('tag')
+                .annotate(num_trigrams=Count('trigram'))
+                .filter(num_trigrams=len(substr_trigrams))
+                .values('tag'))
+    names = tags.values_list('name', flat=True)
+    return sorted(names, key=lambda name: (not name.lower()
+                                           .startswith(substr),
+                                           len(name), name))[:limit]
+
+
+class LazyProblemList(object):
+    """A read-only sequence of problems with the given ids. Slicing it
+       (as done by the pagination) fetches only the problems from
+       the requested page, together with their sites and tags.
+    """
+    def __init__(self, problem_ids):
+        self._problem_ids = problem_ids
+
+    def __len__(self):
+        return len(self._problem_ids)
+
+    def __nonzero__(self):
+        return len(self) > 0
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return self._fetch(self._problem_ids[key])
+        return self._fetch([self._problem_ids[key]])[0]
+
+    def __iter__(self):
+        for start in xrange(0, len(self), FETCH_CHUNK_SIZE):
+            for problem in self[start:start + FETCH_CHUNK_SIZE]:
+                yield problem
+
+    def _fetch(self, problem_ids):
+        problems = Problem.objects.select_related('problemsite') \
+                .prefetch_related('tag_set') \
+                .in_bulk(problem_ids)
+        # Problems deleted since the search are skipped
+        return [problems[problem_id] for problem_id in problem_ids
+                if problem_id in problems]
@@ -2,6 +2,8 @@
 
 import os.path
 import urllib
+import zipfile
+from StringIO import StringIO
 from datetime import datetime
 
 from django.contrib.auth.models import User, Permission
@@ -24,7 +26,8 @@ from oioioi.problems.controllers import ProblemController
 from oioioi.problems.problem_sources import UploadedPackageSource
 from oioioi.problems.package import ProblemPackageBackend
 from oioioi.problems.models import Problem, ProblemStatement, ProblemPackage, \
-        ProblemAttachment, make_problem_filename, ProblemSite
+        ProblemAttachment, make_problem_filename, ProblemSite, Tag, \
+        TagThrough
 from oioioi.problems.problem_site import problem_site_tab
 from oioioi.programs.controllers import ProgrammingContestController
 
@@ -456,6 +459,38 @@ class TestProblemSite(TestCase, TestStreamingMixin):
         self.assertEqual(response.status_code, 200)
         self.assertContains(response, url_external_stmt)
 
+    def test_zip_statement(self):
+        problem = Problem.objects.get()
+        ProblemStatement.objects.filter(problem=problem).delete()
+        archive_content = StringIO()
+        archive = zipfile.ZipFile(archive_content, 'w')
+        archive.writestr('index.html', '<p>zip-statement-index</p>')
+        archive.writestr('style.css', 'p { color: red; }')
+        archive.close()
+        ProblemStatement.objects.create(problem=problem,
+                content=ContentFile(archive_content.getvalue(),
+                                    name='statement.zip'))
+
+        response = self.client.get(self._get_site_urls()['statement'])
+        self.assertContains(response, 'zip-statement-index')
+
+        url = reverse('problem_site_statement_zip',
+                      kwargs={'site_key': '123', 'path': 'style.css'})
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, 'p { color: red; }')
+        self.assertEqual(response['Content-Type'], 'text/css')
+        etag = response['ETag']
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        for path in ['missing.css', '../style.css']:
+            url = reverse('problem_site_statement_zip',
+                          kwargs={'site_key': '123', 'path': path})
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 404)
+
     def test_files_tab(self):
         url = self._get_site_urls()['files']
         response = self.client.get(url)
@@ -876,6 +911,83 @@ class TestTags(TestCase):
         self.assertNotIn('>mrowka<', response.content)
 
 
+class TestProblemsetSearch(TestCase):
+    fixtures = ['test_users', 'test_contest', 'test_problem_packages',
+                'test_problem_site', 'test_tags']
+
+    def search(self, **params):
+        # With a contest, the problemset is shown under the contest's URL
+        url = reverse('problemset_main') + '?' + urllib.urlencode(params)
+        return self.client.get(url, follow=True)
+
+    def test_search_index(self):
+        problem = Problem.objects.get()
+        self.assertEqual(set(problem.search_terms.values_list('term',
+                                                              flat=True)),
+                         set(['xyz', 'mrowkowiec']))
+
+        problem.name = u'Wielka Mr\xf3wka'
+        problem.save()
+        tag = Tag.objects.get(name='mrowka')
+        TagThrough.objects.create(problem=problem, tag=tag)
+        TagThrough.objects.filter(tag__name='mrowkowiec').delete()
+        self.assertEqual(set(problem.search_terms.values_list('term',
+                                                              flat=True)),
+                         set(['xyz', 'wielka', 'mrowka']))
+
+    def test_text_search(self):
+        response = self.search(q='XY')
+        self.assertIn('XYZ', response.content)
+
+        response = self.search(q='mrowk')
+        self.assertIn('XYZ', response.content)
+
+        response = self.search(q='xyz mrowka')
+        self.assertNotIn('XYZ', response.content)
+
+        # The results are cached, but invalidated when problems change
+        problem = Problem.objects.get()
+        problem.name = 'Mrowka'
+        problem.save()
+        response = self.search(q='xyz mrowka')
+        self.assertIn('Mrowka', response.content)
+
+        # Repeated words and words matched by the same term
+        for q in ['mrowka mrowka', 'mrow mrowk']:
+            response = self.search(q=q)
+            self.assertIn('Mrowka', response.content)
+
+    def test_tags_intersection(self):
+        response = self.search(tag_search='mrowkowiec')
+        self.assertIn('XYZ', response.content)
+
+        response = self.search(tag_search='mrowkowiec mrowka')
+        self.assertNotIn('XYZ', response.content)
+
+        TagThrough.objects.create(problem=Problem.objects.get(),
+                                  tag=Tag.objects.get(name='mrowka'))
+        response = self.search(tag_search='mrowkowiec mrowka')
+        self.assertIn('XYZ', response.content)
+
+    def test_pagination(self):
+        problem = Problem.objects.get()
+        for i in xrange(25):
+            copy = Problem.objects.create(name='XYZ copy %02d' % i,
+                                          short_name='xyz%d' % i,
+                                          is_public=True)
+            ProblemSite.objects.create(problem=copy,
+                                       url_key='%s_%d' % (
+                                           problem.problemsite.url_key, i))
+
+        response = self.search(q='xyz')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('XYZ copy 18', response.content)
+        self.assertNotIn('XYZ copy 19', response.content)
+
+        response = self.search(q='xyz', page=2)
+        self.assertIn('XYZ copy 19', response.content)
+
+
 class TestAddToProblemsetPermissions(TestCase):
     fixtures = ['test_users']
 
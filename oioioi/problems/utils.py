@@ -1,12 +1,19 @@
+import hashlib
 import mimetypes
-import sys
+import os
+import shutil
+import tempfile
 import zipfile
 
 from django.conf import settings
 from django.core.exceptions import SuspiciousOperation, PermissionDenied
-from django.http import Http404, HttpResponse
+from django.http import Http404, HttpResponse, HttpResponseNotModified
 from django.shortcuts import get_object_or_404
 from django.utils import translation
+from django.utils.encoding import force_bytes
+from django.utils.http import http_date, parse_etags, \
+        parse_http_date_safe, quote_etag
+from filetracker import split_name
 
 from oioioi.base.utils import request_cached
 from oioioi.contests.utils import is_contest_admin
@@ -76,43 +83,126 @@ def can_add_to_problemset(request):
     return request.user.has_perm('problems.problems_db_admin')
 
 
+_EXTENSION_PREFERENCES = ['.zip', '.pdf', '.ps', '.html', '.txt']
+_EXTENSION_RANKS = dict((ext, i)
+                        for i, ext in enumerate(_EXTENSION_PREFERENCES))
+
+
 def query_statement(problem_id):
-    statements = ProblemStatement.objects.filter(problem=problem_id)
+    statements = list(ProblemStatement.objects.filter(problem=problem_id))
     if not statements:
         return None
 
     lang_prefs = [translation.get_language()] + ['', None] + \
             [l[0] for l in settings.LANGUAGES]
-    ext_prefs = ['.zip', '.pdf', '.ps', '.html', '.txt']
+    lang_ranks = {}
+    for i, lang in enumerate(lang_prefs):
+        lang_ranks.setdefault(lang, i)
 
-    def sort_key(statement):
-        try:
-            lang_pref = lang_prefs.index(statement.language)
-        except ValueError:
-            lang_pref = sys.maxint
-        try:
-            ext_pref = (ext_prefs.index(statement.extension), '')
-        except ValueError:
-            ext_pref = (sys.maxint, statement.extension)
-        return lang_pref, ext_pref
+    def rank(statement):
+        extension = statement.extension
+        return (lang_ranks.get(statement.language, len(lang_prefs)),
+                _EXTENSION_RANKS.get(extension, len(_EXTENSION_RANKS)),
+                extension)
+
+    return min(statements, key=rank)
 
-    return sorted(statements, key=sort_key)[0]
+
+def _statement_cache_dir(statement):
+    name = statement.content.name
+    versioned_name = getattr(name, 'versioned_name', name)
+    return os.path.join(settings.STATEMENT_ZIP_CACHE_DIR,
+                        hashlib.sha1(force_bytes(versioned_name)).hexdigest())
+
+
+def _statement_version(statement):
+    """Returns the Filetracker version (a timestamp) of the statement file,
+       if known.
+    """
+    name = statement.content.name
+    version = split_name(getattr(name, 'versioned_name', name))[1]
+    return int(version) if version is not None else None
 
 
-def query_zip(statement, path):
+def _extract_statement(statement, target_dir):
+    parent_dir = os.path.dirname(target_dir)
+    try:
+        os.makedirs(parent_dir)
+    except OSError:
+        if not os.path.isdir(parent_dir):
+            raise
+    tmp_dir = tempfile.mkdtemp(dir=parent_dir, prefix='.extracting-')
+    try:
+        try:
+            archive = zipfile.ZipFile(statement.content)
+            try:
+                archive.extractall(tmp_dir)
+            finally:
+                archive.close()
+        finally:
+            statement.content.close()
+        try:
+            os.rename(tmp_dir, target_dir)
+        except OSError:
+            # Extracted by someone else in the meantime
+            if not os.path.isdir(target_dir):
+                raise
+    finally:
+        if os.path.isdir(tmp_dir):
+            shutil.rmtree(tmp_dir)
+
+
+def _not_modified(request, etag, last_modified):
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if if_none_match is not None:
+        etags = parse_etags(if_none_match)
+        return etag in etags or '*' in etags
+    if_modified_since = parse_http_date_safe(
+            request.META.get('HTTP_IF_MODIFIED_SINCE'))
+    return if_modified_since is not None and last_modified is not None \
+            and last_modified <= if_modified_since
+
+
+def query_zip(statement, path, request=None):
+    """Returns a response with the file ``path`` from the ZIP archive
+       of the statement.
+
+       Archives are extracted once into ``settings.STATEMENT_ZIP_CACHE_DIR``,
+       in a directory named after the versioned Filetracker name of
+       the statement, so serving a file usually costs a single ``stat``.
+
+       If ``request`` is given, conditional requests are answered with
+       *304 Not Modified*.
+    """
     if statement.extension != '.zip':
         raise SuspiciousOperation
 
-    zip = zipfile.ZipFile(statement.content)
-    try:
-        info = zip.getinfo(path)
-    except KeyError:
+    cache_dir = _statement_cache_dir(statement)
+    file_path = os.path.normpath(os.path.join(cache_dir, path))
+    if not file_path.startswith(cache_dir + os.sep):
         raise Http404
-
-    content_type = mimetypes.guess_type(path)[0] or \
-        'application/octet-stream'
-    response = HttpResponse(zip.read(path), content_type=content_type)
-    response['Content-Length'] = info.file_size
+    if not os.path.isfile(file_path):
+        if os.path.isdir(cache_dir):
+            raise Http404
+        _extract_statement(statement, cache_dir)
+        if not os.path.isfile(file_path):
+            raise Http404
+
+    etag = hashlib.sha1(force_bytes(u'%s:%s' % (cache_dir, path))) \
+            .hexdigest()
+    last_modified = _statement_version(statement)
+    if request is not None and _not_modified(request, etag, last_modified):
+        response = HttpResponseNotModified()
+    else:
+        with open(file_path, 'rb') as f:
+            content = f.read()
+        content_type = mimetypes.guess_type(path)[0] or \
+            'application/octet-stream'
+        response = HttpResponse(content, content_type=content_type)
+        response['Content-Length'] = len(content)
+    response['ETag'] = quote_etag(etag)
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified)
     return response
 
 
@@ -17,7 +17,7 @@ from django.conf import settings
 from oioioi.base.utils import tabbed_view, jsonify
 from oioioi.base.utils.redirect import safe_redirect
 from oioioi.problems.models import ProblemStatement, ProblemAttachment, \
-        Problem, ProblemPackage, Tag
+        Problem, ProblemPackage
 from oioioi.filetracker.utils import stream_file
 from oioioi.problems.utils import can_admin_problem, \
         query_statement, can_admin_instance_of_problem, \
@@ -29,11 +29,11 @@ from oioioi.contests.models import Submission, SubmissionReport, \
 from oioioi.contests.processors import recent_contests
 from oioioi.contests.utils import is_contest_admin, administered_contests
 from oioioi.contests.middleware import activate_contest
-from oioioi.programs.models import ModelSolution, TestReport, GroupReport, \
-        ModelProgramSubmission
+from oioioi.programs.models import ModelSolution, ModelProgramSubmission
+from oioioi.programs.utils import get_model_solutions_results, \
+        invalidate_model_solutions_results
 from oioioi.problems.forms import ProblemsetSourceForm
-
-from collections import defaultdict
+from oioioi.problems.search import search_problems, parse_tags, find_tags
 
 # problem_site_statement_zip_view is used in one of the tabs
 # in problem_site.py. We placed the view in problem_site.py
@@ -142,23 +142,13 @@ def add_or_update_problem_view(request):
                                  'problems/add_or_update.html')
 
 
-def get_problem_queryset_by_tag(datadict):
-    try:
-        tag_name = datadict['tag_search']
-        if not tag_name:
-            return Problem.objects, ''
-        tag = Tag.objects.get(name=tag_name)
-        return tag.problems, tag_name
-    except KeyError:
-        return Problem.objects, ''
-    except Tag.DoesNotExist:
-        return Problem.objects.none(), ''
-
-
 def problemset_generate_view(request, page_title, problems):
+    tag_search = request.GET.get('tag_search', '')
+    search_query = request.GET.get('q', '')
+    problems = search_problems(problems, search_query, parse_tags(tag_search))
+
     # We want to show "Add to contest" button only
     # if user is contest admin for any contest.
-    queryset, query_string = get_problem_queryset_by_tag(request.GET)
     show_add_button, administered_recent_contests = \
         _generate_add_to_contest_metadata(request)
     form = ProblemsetSourceForm("")
@@ -168,7 +158,8 @@ def problemset_generate_view(request, page_title, problems):
       {'problems': problems,
        'page_title': page_title,
        'select_problem_src': request.GET.get('select_problem_src'),
-       'tag_search': query_string,
+       'tag_search': tag_search,
+       'search_query': search_query,
        'show_tags': getattr(settings, 'PROBLEM_TAGS_VISIBLE', False),
        'show_search_bar': True,
        'show_add_button': show_add_button,
@@ -179,18 +170,16 @@ def problemset_generate_view(request, page_title, problems):
 def problemset_main_view(request):
     page_title = \
         _("Welcome to problemset, the place where all the problems are.")
-    queryset = get_problem_queryset_by_tag(request.GET)[0]
-    problems = queryset.filter(is_public=True, problemsite__isnull=False) \
-        .order_by('name')
+    problems = Problem.objects.filter(is_public=True,
+                                      problemsite__isnull=False)
 
     return problemset_generate_view(request, page_title, problems)
 
 
 def problemset_my_problems_view(request):
     page_title = _("My problems")
-    queryset, query_string = get_problem_queryset_by_tag(request.GET)
-    problems = queryset.filter(author=request.user, problemsite__isnull=False)\
-        .order_by('name')
+    problems = Problem.objects.filter(author=request.user,
+                                      problemsite__isnull=False)
 
     return problemset_generate_view(request, page_title, problems)
 
@@ -199,8 +188,7 @@ def problemset_all_problems_view(request):
     if not request.user.is_superuser:
         raise PermissionDenied
     page_title = _("All problems")
-    queryset, query_string = get_problem_queryset_by_tag(request.GET)
-    problems = queryset.filter(problemsite__isnull=False).order_by('name')
+    problems = Problem.objects.filter(problemsite__isnull=False)
 
     return problemset_generate_view(request, page_title, problems)
 
@@ -299,75 +287,40 @@ def model_solutions_view(request, problem_instance_id):
     if not can_admin_problem_instance(request, problem_instance):
         raise PermissionDenied
 
-    filter_kwargs = {
-        'test__isnull': False,
-        'submission_report__submission__problem_instance':
-            problem_instance,
-        'submission_report__submission__programsubmission'
-                '__modelprogramsubmission__isnull': False,
-        'submission_report__status': 'ACTIVE',
-    }
-    test_reports = TestReport.objects.filter(**filter_kwargs) \
-            .select_related()
-    filter_kwargs = {
-        'submission_report__submission__problem_instance':
-            problem_instance,
-        'submission_report__submission__programsubmission'
-                '__modelprogramsubmission__isnull': False,
-        'submission_report__status': 'ACTIVE',
-    }
-    group_reports = GroupReport.objects.filter(**filter_kwargs) \
-            .select_related()
-    submissions = ModelProgramSubmission.objects \
-            .filter(problem_instance=problem_instance) \
-            .order_by('model_solution__order_key') \
-            .select_related('model_solution') \
-            .all()
-    tests = problem_instance.test_set \
-            .order_by('order', 'group', 'name').all()
-
-    group_results = defaultdict(lambda: defaultdict(lambda: None))
-    for gr in group_reports:
-        group_results[gr.group][gr.submission_report.submission_id] = gr
-
-    test_results = defaultdict(lambda: defaultdict(lambda: None))
-    for tr in test_reports:
-        test_results[tr.test_id][tr.submission_report.submission_id] = tr
+    submissions = list(ModelProgramSubmission.objects
+            .filter(problem_instance=problem_instance)
+            .order_by('model_solution__order_key')
+            .select_related('model_solution'))
+    tests = list(problem_instance.test_set
+            .order_by('order', 'group', 'name')
+            .only('id', 'name', 'time_limit'))
+    results = get_model_solutions_results(problem_instance)
 
     submissions_percentage_statuses = {s.id: '25' for s in submissions}
+    total_times = {s.id: 0 for s in submissions}
     rows = []
-    submissions_row = []
     for t in tests:
-        row_test_results = test_results[t.id]
-        row_group_results = group_results[t.group]
-        percentage_statuses = {s.id: '100' for s in submissions}
+        row_results = []
         for s in submissions:
-            if row_test_results[s.id] is not None:
-                time_ratio = float(row_test_results[s.id].time_used) / \
-                        row_test_results[s.id].test_time_limit
-                if time_ratio <= 0.25:
-                    percentage_statuses[s.id] = '25'
-                elif time_ratio <= 0.50:
-                    percentage_statuses[s.id] = '50'
-                    if submissions_percentage_statuses[s.id] is not '100':
-                        submissions_percentage_statuses[s.id] = '50'
-                else:
-                    percentage_statuses[s.id] = '100'
-                    submissions_percentage_statuses[s.id] = '100'
-
-        rows.append({
-            'test': t,
-            'results': [{
-                    'test_report': row_test_results[s.id],
-                    'group_report': row_group_results[s.id],
-                    'is_partial_score': s.problem_instance.controller
-                        ._is_partial_score(row_test_results[s.id]),
-                    'percentage_status': percentage_statuses[s.id]
-                    }
-                for s in submissions
-                ]
-        })
+            result = results.get((t.id, s.id))
+            if result is None:
+                row_results.append({'status': '', 'time_used': None,
+                                    'percentage_status': '100',
+                                    'is_partial_score': False})
+                continue
+            status, time_used, percentage_status, is_partial_score = result
+            if percentage_status == '100':
+                submissions_percentage_statuses[s.id] = '100'
+            elif percentage_status == '50' and \
+                    submissions_percentage_statuses[s.id] != '100':
+                submissions_percentage_statuses[s.id] = '50'
+            total_times[s.id] += time_used
+            row_results.append({'status': status, 'time_used': time_used,
+                                'percentage_status': percentage_status,
+                                'is_partial_score': is_partial_score})
+        rows.append({'test': t, 'results': row_results})
 
+    submissions_row = []
     for s in submissions:
         status = s.status
         if s.status == 'OK' or s.status == 'INI_OK':
@@ -380,10 +333,7 @@ def model_solutions_view(request, problem_instance_id):
 
     total_row = {
         'test': sum(t.time_limit for t in tests),
-        'results':
-            [sum(t[s.id].time_used if t[s.id] else 0
-                 for t in test_results.values())
-             for s in submissions],
+        'results': [total_times[s.id] for s in submissions],
     }
 
     context = {
@@ -405,6 +355,7 @@ def rejudge_model_solutions_view(request, problem_instance_id):
     if not request.user.has_perm('contests.contest_admin', contest):
         raise PermissionDenied
     ModelSolution.objects.recreate_model_submissions(problem_instance)
+    invalidate_model_solutions_results(problem_instance)
     messages.info(request, _("Model solutions sent for evaluation."))
     return redirect('model_solutions', problem_instance.id)
 
@@ -415,5 +366,4 @@ def get_tag_hints_view(request):
     if len(substr) < 2:
         raise Http404
     num_hints = getattr(settings, 'NUM_HINTS', 10)
-    queryset = Tag.objects.filter(name__icontains=substr)[:num_hints].all()
-    return [str(tag.name) for tag in queryset]
+    return [str(name) for name in find_tags(substr, num_hints)]
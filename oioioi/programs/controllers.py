@@ -26,6 +26,8 @@ from oioioi.programs.models import ProgramSubmission, OutputChecker, \
         CompilationReport, TestReport, GroupReport, ModelProgramSubmission, \
         Submission, UserOutGenStatus
 from oioioi.programs.utils import has_report_actions_config
+from oioioi.programs.handlers import get_tests_for_evaluation, \
+        get_used_tests
 from oioioi.filetracker.utils import django_to_filetracker_path
 from oioioi.evalmgr import recipe_placeholder, add_before_placeholder, \
         extend_after_placeholder
@@ -233,6 +235,11 @@ class ProgrammingProblemController(ProblemController):
                             'oioioi.programs.utils.min_group_scorer')
         environ.setdefault('score_aggregator',
                 'oioioi.programs.utils.sum_score_aggregator')
+        if settings.EARLY_ABORT_EVALUATION \
+                and not environ.get('save_outputs') \
+                and environ['group_scorer'] == \
+                    'oioioi.programs.utils.min_group_scorer':
+            environ.setdefault('early_abort', 'group')
 
         checker = OutputChecker.objects.get(problem=self.problem).exe_file
         if checker:
@@ -246,6 +253,29 @@ class ProgrammingProblemController(ProblemController):
                     ('update_submission_score',
                         'oioioi.contests.handlers.update_submission_score'))
 
+    def judge_many(self, submissions, extra_args=None, is_rejudge=False):
+        """Judges many submissions to the same problem instance, loading
+           the tests (and the tests used by the active reports, when
+           rejudging) once for all of them.
+        """
+        if not submissions:
+            return
+        extra_args = extra_args or {}
+        preloaded_tests = None
+        if 'tests_subset' not in extra_args:
+            preloaded_tests = get_tests_for_evaluation(
+                    submissions[0].problem_instance_id)
+        if is_rejudge:
+            tests_used = get_used_tests([s.id for s in submissions])
+        for submission in submissions:
+            submission_extra_args = dict(extra_args)
+            if preloaded_tests is not None:
+                submission_extra_args['preloaded_tests'] = preloaded_tests
+            if is_rejudge:
+                submission_extra_args['tests_used'] = \
+                        tests_used[submission.id]
+            self.judge(submission, submission_extra_args, is_rejudge)
+
     def _map_report_to_submission_status(self, status, problem_instance,
                                          kind='INITIAL'):
         if kind == 'INITIAL':
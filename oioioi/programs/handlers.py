@@ -101,6 +101,56 @@ def compile_end(env, **kwargs):
     return env
 
 
+def _make_test_env(test):
+    test_env = {}
+    test_env['id'] = test.id
+    test_env['name'] = test.name
+    test_env['in_file'] = django_to_filetracker_path(test.input_file)
+    test_env['hint_file'] = django_to_filetracker_path(test.output_file)
+    test_env['kind'] = test.kind
+    test_env['group'] = test.group or test.name
+    test_env['max_score'] = test.max_score
+    test_env['order'] = test.order
+    if test.time_limit:
+        test_env['exec_time_limit'] = test.time_limit
+    if test.memory_limit:
+        test_env['exec_mem_limit'] = test.memory_limit
+    return test_env
+
+
+def get_tests_for_evaluation(problem_instance_id):
+    """Loads all tests of the problem instance in one query.
+
+       Returns a dictionary with keys:
+         * ``tests``: a dictionary mapping test names to test envs
+           (without ``to_judge``),
+         * ``active``: a list of names of the active tests.
+
+       The result may be passed to :func:`collect_tests` in
+       ``env['extra_args']['preloaded_tests']``, so that it's not loaded again
+       for every judged submission.
+    """
+    tests = Test.objects.filter(problem_instance__id=problem_instance_id)
+    return {
+        'tests': dict((test.name, _make_test_env(test)) for test in tests),
+        'active': [test.name for test in tests if test.is_active],
+    }
+
+
+def get_used_tests(submission_ids):
+    """Returns a dictionary mapping ids of the given submissions to the lists
+       of names of tests in their active reports, using one query.
+    """
+    tests_used = defaultdict(list)
+    test_reports = TestReport.objects.filter(
+            submission_report__submission__id__in=submission_ids,
+            submission_report__status='ACTIVE') \
+        .values_list('submission_report__submission__id', 'test_name')
+    for submission_id, test_name in test_reports:
+        tests_used[submission_id].append(test_name)
+    return tests_used
+
+
 @_skip_on_compilation_error
 @transaction.atomic
 def collect_tests(env, **kwargs):
@@ -109,62 +159,52 @@ def collect_tests(env, **kwargs):
 
        Used ``environ`` keys:
          * ``problem_instance_id``
+         * ``extra_args``: ``preloaded_tests`` (see
+           :func:`get_tests_for_evaluation`) and ``tests_used`` (the names of
+           tests in the active reports of the submission) may be given here
+           if they were loaded in bulk for many submissions
 
        Produced ``environ`` keys:
           * ``tests``: a dictionary mapping test names to test envs
     """
 
     env.setdefault('tests', {})
-
-    if 'tests_subset' in env['extra_args']:
-        tests = Test.objects.in_bulk(env['extra_args']['tests_subset']) \
-                                                                    .values()
+    extra_args = env['extra_args']
+    problem_instance = env['problem_instance_id']
+    preloaded_tests = extra_args.pop('preloaded_tests', None) \
+            or get_tests_for_evaluation(problem_instance)
+    all_tests = preloaded_tests['tests']
+    active_tests = [all_tests[name] for name in preloaded_tests['active']]
+
+    if 'tests_subset' in extra_args:
+        tests = [_make_test_env(test) for test in
+                 Test.objects.in_bulk(extra_args['tests_subset']).values()]
     else:
-        tests = Test.objects.filter(
-            problem_instance__id=env['problem_instance_id'],
-            is_active=True)
+        tests = active_tests
 
-    problem_instance = env['problem_instance_id']
     if env['is_rejudge']:
-        submission = env['submission_id']
-        rejudge_type = env['extra_args'].setdefault('rejudge_type', 'FULL')
-        tests_to_judge = env['extra_args'].setdefault('tests_to_judge', [])
-        test_reports = TestReport.objects.filter(
-            submission_report__submission__id=submission,
-            submission_report__status='ACTIVE')
-        tests_used = [report.test_name for report in test_reports]
+        rejudge_type = extra_args.setdefault('rejudge_type', 'FULL')
+        tests_to_judge = extra_args.setdefault('tests_to_judge', [])
+        tests_used = extra_args.pop('tests_used', None)
+        if tests_used is None:
+            tests_used = get_used_tests([env['submission_id']]) \
+                    [env['submission_id']]
+        tests_used = set(tests_used)
         if rejudge_type == 'NEW':
-            tests_to_judge = [t.name for t in
-                              Test.objects.filter(
-                                  problem_instance__id=problem_instance,
-                                  is_active=True)
-                              .exclude(name__in=tests_used)]
+            tests_to_judge = [t['name'] for t in active_tests
+                              if t['name'] not in tests_used]
         elif rejudge_type == 'JUDGED':
-            tests = Test.objects.filter(
-                problem_instance__id=problem_instance,
-                name__in=tests_used)
+            tests = [all_tests[name] for name in tests_used
+                     if name in all_tests]
             tests_to_judge = [t for t in tests_to_judge if t in tests_used]
         elif rejudge_type == 'FULL':
-            tests_to_judge = [t.name for t in tests]
+            tests_to_judge = [t['name'] for t in tests]
     else:
-        tests_to_judge = [t.name for t in tests]
-
-    for test in tests:
-        test_env = {}
-        test_env['id'] = test.id
-        test_env['name'] = test.name
-        test_env['in_file'] = django_to_filetracker_path(test.input_file)
-        test_env['hint_file'] = django_to_filetracker_path(test.output_file)
-        test_env['kind'] = test.kind
-        test_env['group'] = test.group or test.name
-        test_env['max_score'] = test.max_score
-        test_env['order'] = test.order
-        if test.time_limit:
-            test_env['exec_time_limit'] = test.time_limit
-        if test.memory_limit:
-            test_env['exec_mem_limit'] = test.memory_limit
-        test_env['to_judge'] = False
-        env['tests'][test.name] = test_env
+        tests_to_judge = [t['name'] for t in tests]
+
+    for test_env in tests:
+        # Preloaded test envs may be shared by many submissions
+        env['tests'][test_env['name']] = dict(test_env, to_judge=False)
 
     for test in tests_to_judge:
         env['tests'][test]['to_judge'] = True
@@ -195,6 +235,8 @@ def run_tests(env, kind=None, **kwargs):
            arguments passed to
            :fun:`oioioi.sioworkers.jobs.run_sioworkers_jobs`
            (kwargs).
+         * ``early_abort``: if set (and outputs are not saved), the tests
+           are run in waves, see :func:`run_tests_end`.
 
        Produced ``environ`` keys:
          * ``test_results``: a dictionary, mapping test names into
@@ -242,14 +284,87 @@ def run_tests(env, kind=None, **kwargs):
         job['untrusted_checker'] = env['untrusted_checker']
         jobs[test_name] = job
     extra_args = env.get('sioworkers_extra_args', {}).get(kind, {})
-    env['workers_jobs'] = jobs
-    env['workers_jobs.extra_args'] = extra_args
     env['workers_jobs.not_to_judge'] = not_to_judge
+    if env.get('early_abort') and not env.get('save_outputs') and jobs:
+        env['early_abort.jobs'] = jobs
+        env['early_abort.extra_args'] = extra_args
+        env['early_abort.wave_size'] = settings.EARLY_ABORT_FIRST_WAVE_SIZE
+        _send_next_wave(env)
+    else:
+        env['workers_jobs'] = jobs
+        env['workers_jobs.extra_args'] = extra_args
     return env
 
 
+def _early_abort_unit(env, test_name):
+    """Returns the part of the tests which is decided by a failure
+       of the given test.
+    """
+    if env['early_abort'] == 'submission':
+        return None
+    return env['tests'][test_name]['group']
+
+
+def _send_next_wave(env):
+    """Moves the next wave of jobs waiting in ``env['early_abort.jobs']``
+       to ``env['workers_jobs']``.
+
+       A wave consists of the first ``env['early_abort.wave_size']`` tests
+       (in the order of tests) of every group, or of the whole submission
+       if ``env['early_abort']`` is ``'submission'``. The size of the next
+       wave is doubled, so that a correct solution needs only a few rounds.
+    """
+    pending = env['early_abort.jobs']
+    units = defaultdict(list)
+    for test_name, job in pending.iteritems():
+        units[_early_abort_unit(env, test_name)] \
+                .append((job['order'], test_name))
+    wave_size = env['early_abort.wave_size']
+    jobs = {}
+    for unit_tests in units.itervalues():
+        for _order, test_name in sorted(unit_tests)[:wave_size]:
+            jobs[test_name] = pending.pop(test_name)
+    env['early_abort.wave_size'] = 2 * wave_size
+    env['workers_jobs'] = jobs
+    env['workers_jobs.extra_args'] = env['early_abort.extra_args']
+
+
+def _continue_early_abort(env, results):
+    """Skips the waiting tests, whose outcome can no longer change
+       the result, and sends the next wave of the remaining ones.
+    """
+    pending = env['early_abort.jobs']
+    failed_units = set(_early_abort_unit(env, test_name)
+                       for test_name, result in results.iteritems()
+                       if result.get('result_code') != 'OK')
+    for test_name in pending.keys():
+        if _early_abort_unit(env, test_name) in failed_units:
+            del pending[test_name]
+            env['test_results'][test_name] = dict(env['tests'][test_name],
+                    result_code='SKIP', result_string='', time_used=0)
+    if pending:
+        _send_next_wave(env)
+        env['workers_jobs.not_to_judge'] = []
+        env['recipe'].insert(0, ('early_abort_run_tests_end',
+                'oioioi.programs.handlers.run_tests_end'))
+    else:
+        del env['early_abort.jobs']
+        del env['early_abort.extra_args']
+        del env['early_abort.wave_size']
+
+
 @_skip_on_compilation_error
 def run_tests_end(env, **kwargs):
+    """Saves results of the jobs sent by :func:`run_tests` into
+       ``env['test_results']``.
+
+       If ``env['early_abort']`` is set to ``'group'`` or ``'submission'``,
+       the tests are run in waves (see :func:`_send_next_wave`). After
+       a test fails, the remaining tests of its group (or all remaining tests,
+       respectively) are not run, but reported with the ``SKIP`` status.
+       This should be used only if failing a test means getting no points
+       for the group (or for the submission).
+    """
     not_to_judge = env['workers_jobs.not_to_judge']
     del env['workers_jobs.not_to_judge']
     jobs = env['workers_jobs.results']
@@ -259,6 +374,8 @@ def run_tests_end(env, **kwargs):
     for test_name in not_to_judge:
         env['test_results'].setdefault(test_name, {}) \
                 .update(env['tests'][test_name])
+    if 'early_abort.jobs' in env:
+        _continue_early_abort(env, jobs)
     return env
 
 
@@ -285,6 +402,16 @@ def grade_tests(env, **kwargs):
     fun = import_string(env.get('test_scorer')
             or settings.DEFAULT_TEST_SCORER)
     tests = env['tests']
+    not_to_judge = [test_name for test_name in env['test_results']
+                    if not tests[test_name]['to_judge']]
+    reports = {}
+    if not_to_judge:
+        reports = dict((report.test_name, report) for report in
+                       TestReport.objects.filter(
+                           submission_report__submission__id=
+                               env['submission_id'],
+                           submission_report__status='ACTIVE',
+                           test_name__in=not_to_judge))
     for test_name, test_result in env['test_results'].iteritems():
         if tests[test_name]['to_judge']:
             score, max_score, status = fun(tests[test_name], test_result)
@@ -294,10 +421,11 @@ def grade_tests(env, **kwargs):
             test_result['max_score'] = max_score and max_score.serialize()
             test_result['status'] = status
         else:
-            report = TestReport.objects.get(
-                submission_report__submission__id=env['submission_id'],
-                submission_report__status='ACTIVE',
-                test_name=test_name)
+            if test_name not in reports:
+                raise TestReport.DoesNotExist("No active report for test "
+                        "%s of submission %s" % (test_name,
+                        env['submission_id']))
+            report = reports[test_name]
             score = report.score
             max_score = IntegerScore(report.test_max_score)
             status = report.status
@@ -204,6 +204,7 @@ submission_statuses.register('MLE', _("Memory limit exceeded"))
 submission_statuses.register('OLE', _("Output limit exceeded"))
 submission_statuses.register('SE', _("System error"))
 submission_statuses.register('RV', _("Rule violation"))
+submission_statuses.register('SKIP', _("Skipped"))
 
 submission_statuses.register('INI_OK', _("Initial tests: OK"))
 submission_statuses.register('INI_ERR', _("Initial tests: failed"))
@@ -18,6 +18,7 @@ from oioioi.filetracker.tests import TestStreamingMixin
 from oioioi.programs import utils
 from oioioi.base.tests import check_not_accessible, fake_time
 from oioioi.contests.models import Submission, ProblemInstance, Contest, Round
+from oioioi.contests.utils import aggregate_statuses, rejudge_submissions
 from oioioi.contests.tests import PrivateRegistrationController, \
         SubmitFileMixin
 from oioioi.programs.models import Test, ModelSolution, ProgramSubmission, \
@@ -27,6 +28,7 @@ from oioioi.sinolpack.tests import get_test_filename
 from oioioi.contests.scores import IntegerScore
 from oioioi.base.utils import memoized_property
 from oioioi.base.notification import NotificationHandler
+from oioioi.programs import handlers
 from oioioi.programs.handlers import make_report
 from oioioi.programs.views import _testreports_to_generate_outs
 
@@ -132,6 +134,14 @@ class TestProgramsViews(TestCase, TestStreamingMixin):
         self.assertEqual(response.content.count('subm_status subm_CE'), 2)
         self.assertEqual(response.content.count('>10.00s<'), 5)
 
+        # The results are cached until the model solutions are rejudged
+        TestReport.objects.filter(status='WA').update(status='RE')
+        response = self.client.get(url)
+        self.assertEqual(response.content.count('subm_status subm_WA'), 5)
+        utils.invalidate_model_solutions_results(pi)
+        response = self.client.get(url)
+        self.assertLess(response.content.count('subm_status subm_WA'), 5)
+
 
 class TestHeaderLinks(TestCase):
     fixtures = ['test_users', 'test_contest', 'test_full_package',
@@ -819,6 +829,88 @@ class TestScorers(TestCase):
                 utils.sum_score_aggregator(self.g_results_unequal_max_scores))
 
 
+class TestEarlyAbort(TestCase):
+    fixtures = ['test_users', 'test_contest', 'test_full_package',
+            'test_problem_instance', 'test_submission']
+
+    def _make_env(self, early_abort):
+        tests = {}
+        for group, count in [('1', 4), ('2', 2)]:
+            for i in xrange(count):
+                name = group + 'abcd'[i]
+                tests[name] = {'name': name, 'group': group, 'kind': 'NORMAL',
+                               'order': i, 'to_judge': True, 'max_score': 10,
+                               'exec_time_limit': 1000}
+        return {'tests': tests, 'compiled_file': '/exe', 'exec_info': {},
+                'untrusted_checker': False, 'early_abort': early_abort,
+                'recipe': [], 'submission_id': 1,
+                'compilation_result': 'OK', 'compilation_message': ''}
+
+    def _finish_wave(self, env, results):
+        jobs = env.pop('workers_jobs')
+        self.assertEqual(set(results), set(jobs))
+        del env['workers_jobs.extra_args']
+        env['workers_jobs.results'] = dict(
+                (name, dict(jobs[name], result_code=code, time_used=100))
+                for name, code in results.iteritems())
+        return handlers.run_tests_end(env)
+
+    @override_settings(EARLY_ABORT_FIRST_WAVE_SIZE=1)
+    def test_group_early_abort(self):
+        env = handlers.run_tests(self._make_env('group'))
+        env = self._finish_wave(env, {'1a': 'WA', '2a': 'OK'})
+        for name in ['1b', '1c', '1d']:
+            self.assertEqual(env['test_results'][name]['result_code'],
+                             'SKIP')
+        self.assertEqual(env['recipe'][0][1],
+                         'oioioi.programs.handlers.run_tests_end')
+        env['recipe'] = []
+        env = self._finish_wave(env, {'2b': 'OK'})
+        self.assertNotIn('workers_jobs', env)
+        self.assertNotIn('early_abort.jobs', env)
+        self.assertEqual(len(env['test_results']), 6)
+
+    @override_settings(EARLY_ABORT_FIRST_WAVE_SIZE=1)
+    def test_submission_early_abort(self):
+        env = handlers.run_tests(self._make_env('submission'))
+        env = self._finish_wave(env, {'1a': 'OK'})
+        env['recipe'] = []
+        env = self._finish_wave(env, {'2a': 'OK', '1b': 'TLE'})
+        self.assertNotIn('workers_jobs', env)
+        self.assertEqual(env['test_results']['1b']['result_code'], 'TLE')
+        for name in ['1c', '1d', '2b']:
+            self.assertEqual(env['test_results'][name]['result_code'],
+                             'SKIP')
+
+    @override_settings(EARLY_ABORT_FIRST_WAVE_SIZE=1)
+    def test_grading_aborted_evaluation(self):
+        env = handlers.run_tests(self._make_env('group'))
+        env = self._finish_wave(env, {'1a': 'WA', '2a': 'OK'})
+        env['recipe'] = []
+        env = self._finish_wave(env, {'2b': 'OK'})
+
+        env['test_scorer'] = 'oioioi.programs.utils.discrete_test_scorer'
+        env['group_scorer'] = 'oioioi.programs.utils.min_group_scorer'
+        env = handlers.grade_tests(env)
+        env = handlers.grade_groups(env)
+        env = handlers.grade_submission(env)
+        env = make_report(env)
+
+        self.assertEqual(env['group_results']['1']['status'], 'WA')
+        self.assertEqual(env['group_results']['2']['status'], 'OK')
+        self.assertEqual(env['status'], 'WA')
+        self.assertEqual(env['score'], IntegerScore(10).serialize())
+        reports = TestReport.objects.filter(
+                submission_report_id=env['report_id'])
+        self.assertEqual(dict((r.test_name, r.status) for r in reports),
+                         {'1a': 'WA', '1b': 'SKIP', '1c': 'SKIP',
+                          '1d': 'SKIP', '2a': 'OK', '2b': 'OK'})
+
+    def test_skipped_status(self):
+        self.assertEqual(aggregate_statuses(['OK', 'SKIP', 'WA']), 'WA')
+        self.assertEqual(aggregate_statuses(['OK', 'SKIP']), 'SKIP')
+
+
 class TestUserOutsGenerating(TestCase):
     fixtures = ['test_users', 'test_contest', 'test_full_package',
                 'test_problem_instance', 'test_submission',
@@ -963,7 +1055,8 @@ class TestRejudge(TestCase, SubmitFileMixin):
             test.save()
 
     def _test_rejudge(self, submit_active_tests, rejudge_active_tests,
-            rejudge_type, tests_subset, expected_ok, expected_re):
+            rejudge_type, tests_subset, expected_ok, expected_re,
+            batch=False):
         self.client.login(username='test_user')
 
         contest = Contest.objects.get()
@@ -1001,10 +1094,13 @@ class TestRejudge(TestCase, SubmitFileMixin):
         self._set_active_tests(rejudge_active_tests, all_tests)
 
         ContestWithJudgeInfoController.judged = False
-        submission.problem_instance.controller.judge(submission,
-                                 is_rejudge=True,
-                                 extra_args={'tests_to_judge': tests_subset,
-                                             'rejudge_type': rejudge_type})
+        extra_args = {'tests_to_judge': tests_subset,
+                      'rejudge_type': rejudge_type}
+        if batch:
+            rejudge_submissions([submission], extra_args)
+        else:
+            submission.problem_instance.controller.judge(submission,
+                                 is_rejudge=True, extra_args=extra_args)
         self.assertTrue(ContestWithJudgeInfoController.judged)
 
         reports = TestReport.objects.filter(
@@ -1055,6 +1151,23 @@ class TestRejudge(TestCase, SubmitFileMixin):
                            ['0', '1b', '3'],
                            ['1a', '2'])
 
+    def test_rejudge_batch(self):
+        self._test_rejudge(['0', '1ocen', '1b', '3'],
+                           ['0', '1a', '1b', '2', '3'],
+                           'NEW',
+                           {},
+                           ['0', '1b', '3'],
+                           ['1a', '2'],
+                           batch=True)
+
+        self._test_rejudge(['0', '1ocen', '1b', '3'],
+                           [],
+                           'JUDGED',
+                           {'0', '1a', '2', '3'},
+                           ['1ocen', '1b'],
+                           ['0', '3'],
+                           batch=True)
+
 
 class TestLimitsLimits(TestCase):
     fixtures = ['test_users', 'test_contest', 'test_full_package',
@@ -1,13 +1,17 @@
+import time
 from math import ceil
 from operator import itemgetter
 
+from django.conf import settings
+from django.core.cache import cache
 from django.core.exceptions import PermissionDenied
+from django.db.models import Count, Max
 from django.shortcuts import get_object_or_404
 from oioioi.contests.scores import ScoreValue, IntegerScore
-from oioioi.contests.models import Submission
+from oioioi.contests.models import Submission, SubmissionReport
 from oioioi.contests.utils import aggregate_statuses
 from oioioi.programs.models import ProgramSubmission, LibraryProblemData, \
-        ReportActionsConfig
+        ReportActionsConfig, ModelProgramSubmission, TestReport
 
 def sum_score_aggregator(group_results):
     if not group_results:
@@ -148,3 +152,85 @@ def is_problem_with_library(problem):
         return bool(problem.libraryproblemdata)
     except LibraryProblemData.DoesNotExist:
         return False
+
+
+def _model_solutions_version_key(problem_instance):
+    return 'programs/model_solutions/%d/version' % (problem_instance.id,)
+
+
+def _model_solutions_version(problem_instance):
+    key = _model_solutions_version_key(problem_instance)
+    # The initial value depends on time, so that the version doesn't go
+    # back when the key is evicted from the cache.
+    cache.add(key, int(time.time() * 1000), None)
+    return cache.get(key) or 0
+
+
+def invalidate_model_solutions_results(problem_instance):
+    """Invalidates the cached results returned by
+       :func:`get_model_solutions_results`.
+    """
+    try:
+        cache.incr(_model_solutions_version_key(problem_instance))
+    except ValueError:
+        _model_solutions_version(problem_instance)
+
+
+def _time_percentage(time_used, time_limit):
+    if not time_limit:
+        return '100'
+    time_ratio = float(time_used) / time_limit
+    if time_ratio <= 0.25:
+        return '25'
+    elif time_ratio <= 0.50:
+        return '50'
+    return '100'
+
+
+def _compute_model_solutions_results(problem_instance, model_submissions):
+    is_partial_score = problem_instance.problem.controller._is_partial_score
+    results = {}
+    # Later reports win, as when there is more than one active report
+    # of a submission for the same test.
+    rows = TestReport.objects \
+            .filter(test__isnull=False,
+                    submission_report__submission__in=model_submissions,
+                    submission_report__status='ACTIVE') \
+            .order_by('submission_report_id') \
+            .values_list('test_id', 'submission_report__submission_id',
+                         'status', 'time_used', 'test_time_limit', 'score',
+                         'test_max_score')
+    for test_id, submission_id, status, time_used, time_limit, score, \
+            max_score in rows.iterator():
+        partial = is_partial_score(TestReport(status=status, score=score,
+                                              test_max_score=max_score))
+        results[(test_id, submission_id)] = (status, time_used,
+                _time_percentage(time_used, time_limit), partial)
+    return results
+
+
+def get_model_solutions_results(problem_instance):
+    """Returns the results of model solutions of the problem instance on
+       its tests, as a dictionary mapping pairs ``(test_id, submission_id)``
+       into tuples ``(status, time_used, time_percentage,
+       is_partial_score)``.
+
+       Only the needed columns of active test reports are fetched and
+       the result is cached. It is invalidated when new reports of model
+       solutions become active or when
+       :func:`invalidate_model_solutions_results` is called.
+    """
+    model_submissions = ModelProgramSubmission.objects \
+            .filter(problem_instance=problem_instance).values('id')
+    fingerprint = SubmissionReport.objects \
+            .filter(submission__in=model_submissions, status='ACTIVE') \
+            .aggregate(last_id=Max('id'), count=Count('id'))
+    key = 'programs/model_solutions/%d/%d/%s/%d' % (problem_instance.id,
+            _model_solutions_version(problem_instance),
+            fingerprint['last_id'], fingerprint['count'])
+    results = cache.get(key)
+    if results is None:
+        results = _compute_model_solutions_results(problem_instance,
+                                                   model_submissions)
+        cache.set(key, results, settings.MODEL_SOLUTIONS_CACHE_TIMEOUT)
+    return results
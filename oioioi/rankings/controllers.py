@@ -1,13 +1,16 @@
 from collections import defaultdict
 from operator import itemgetter
+import json
 import unicodecsv
 import math
 
 from django.conf import settings
+from django.core.cache import cache
 from django.core.urlresolvers import reverse
-from django.http import HttpResponse
+from django.http import StreamingHttpResponse
 from django.template import RequestContext
 from django.template.loader import render_to_string
+from django.template.response import TemplateResponse
 from django.test import RequestFactory
 from django.utils import timezone
 from django.utils.encoding import force_unicode, force_str
@@ -24,12 +27,24 @@ from oioioi.contests.utils import is_contest_admin, is_contest_observer, \
         contest_exists, can_enter_contest
 from oioioi.filetracker.utils import make_content_disposition_header
 
-from oioioi.rankings.models import Ranking, RankingPage
+from oioioi.rankings.models import Ranking
 
 
 CONTEST_RANKING_KEY = 'c'
 
 
+class _Echo(object):
+    """A file-like object returning what is written to it, so that rows
+       formatted by a csv writer can be streamed.
+    """
+    def write(self, value):
+        return value
+
+
+def _user_order_key(user):
+    return (user.last_name, user.first_name, user.username)
+
+
 class RankingMixinForContestController(object):
     def ranking_controller(self):
         """Return the actual :class:`RankingController` for the contest."""
@@ -38,7 +53,17 @@ class RankingMixinForContestController(object):
     def update_user_results(self, user, problem_instance, *args, **kwargs):
         super(RankingMixinForContestController, self) \
             .update_user_results(user, problem_instance, *args, **kwargs)
-        Ranking.invalidate_contest(problem_instance.round.contest)
+        Ranking.invalidate_user_result(user, problem_instance)
+
+    def update_many_user_results(self, users, problem_instances, *args,
+                                 **kwargs):
+        users = list(users)
+        problem_instances = list(problem_instances)
+        super(RankingMixinForContestController, self) \
+            .update_many_user_results(users, problem_instances, *args,
+                                      **kwargs)
+        Ranking.invalidate_user_results(self.contest, users,
+                                        problem_instances)
 
 ContestController.mix_in(RankingMixinForContestController)
 
@@ -119,55 +144,86 @@ class RankingController(RegisteredSubclassesBase, ObjectWithMixins):
            HTML generation. Feel free to override render_ranking to customize
            its logic.
 
+           Pages are rendered from the serialized data only when requested
+           and are cached until the ranking is recalculated.
+
            If the ranking is still being generated, or the user requested an
            invalid page, displays an appropriate message.
         """
-        page_nr = request.GET.get('page', 1)
+        try:
+            page_nr = int(request.GET.get('page', 1))
+        except ValueError:
+            return mark_safe(render_to_string("rankings/no_page.html"))
         key = self.get_full_key(request, partial_key)
         # Let's pretend the ranking is always up-to-date during tests.
         if getattr(settings, 'MOCK_RANKINGSD', False):
             data = self.serialize_ranking(key)
             html = self._render_ranking_page(key, data, page_nr)
-            print data
             return mark_safe(html)
 
-        ranking = Ranking.objects.get_or_create(contest=self.contest,
-                key=key)[0]
-        try:
-            page = ranking.pages.get(nr=page_nr)
-        except RankingPage.DoesNotExist:
+        # The serialized data is loaded only if the page is not cached.
+        ranking = Ranking.objects.defer('serialized_data') \
+                .get_or_create(contest=self.contest, key=key)[0]
+        ranking.mark_viewed()
+        if ranking.version == 0:
             # The ranking hasn't been yet generated
             if page_nr == 1:
                 return mark_safe(render_to_string(
                     "rankings/generating_ranking.html"))
             return mark_safe(render_to_string("rankings/no_page.html"))
 
+        html = self._get_cached_ranking_page(ranking, page_nr)
+        if html is None:
+            return mark_safe(render_to_string("rankings/no_page.html"))
+
         context = {
-            'ranking_html': mark_safe(page.data),
+            'ranking_html': mark_safe(html),
             'is_up_to_date': ranking.is_up_to_date(),
         }
         return mark_safe(render_to_string("rankings/rendered_ranking.html",
                 context))
 
+    def _get_cached_ranking_page(self, ranking, page_nr):
+        """Returns html code of the page of the ranking, rendering it if it
+           is not present in the cache, or ``None`` if there is no such page.
+        """
+        cache_key = 'rankings/page/%d/%d/%d' % (ranking.id, ranking.version,
+                                               page_nr)
+        html = cache.get(cache_key)
+        if html is None:
+            data = ranking.serialized
+            if data is None or not 1 <= page_nr <= self._num_pages(data):
+                return None
+            html = self._render_ranking_page(ranking.key, data, page_nr)
+            cache.set(cache_key, html, settings.RANKING_PAGE_CACHE_TIMEOUT)
+        return html
+
+    def _num_pages(self, data):
+        on_page = data['participants_on_page']
+        num_pages = (len(data['rows']) + on_page - 1) / on_page
+        return max(num_pages, 1)  # There is always at least a single page
+
     def get_serialized_ranking(self, key):
         return self.serialize_ranking(key)
 
     def build_ranking(self, key):
-        """Serializes data and renders html for given key.
+        """Serializes data for given key.
 
-           Results are processed using serialize_ranking, and then as many
-           pages as needed are rendered. Returns a tuple containing serialized
-           data and a list of strings, that are html code of ranking pages.
+           The html code of the pages is rendered later, when they are
+           requested, using :meth:`_render_ranking_page`.
         """
-        data = self.serialize_ranking(key)
-        pages = []
-        num_participants = len(data['rows'])
-        on_page = data['participants_on_page']
-        num_pages = (num_participants + on_page - 1) / on_page
-        num_pages = max(num_pages, 1)  # Render at least a single page
-        for i in range(1, num_pages+1):
-            pages.append(self._render_ranking_page(key, data, i))
-        return data, pages
+        return self.serialize_ranking(key)
+
+    def update_serialized_ranking(self, key, data, user_ids):
+        """Updates ``data`` returned by :meth:`serialize_ranking` after
+           results of users with ids from ``user_ids`` have changed.
+
+           ``data`` may have been updated incrementally before, or be
+           ``None`` if the stored data cannot be restored. Returns
+           the updated data, or ``None`` if incremental updates are not
+           supported, which is the default.
+        """
+        return None
 
     def _fake_request(self, page):
         """Creates a fake request used to render ranking.
@@ -186,9 +242,36 @@ class RankingController(RegisteredSubclassesBase, ObjectWithMixins):
     def _render_ranking_page(self, key, data, page):
         raise NotImplementedError
 
+    def _get_data_for_export(self, key):
+        """Returns the last serialized data stored by rankingsd, even if
+           it isn't up to date, or ``None`` if the ranking hasn't been
+           generated yet. The ranking is given a priority in recalculation
+           anyway.
+        """
+        # Let's pretend the ranking is always up-to-date during tests.
+        if getattr(settings, 'MOCK_RANKINGSD', False):
+            return self.serialize_ranking(key)
+
+        ranking = Ranking.objects.defer('serialized_data') \
+                .get_or_create(contest=self.contest, key=key)[0]
+        ranking.mark_viewed()
+        if ranking.version == 0:
+            return None
+        # None if the stored data cannot be restored
+        return ranking.serialized
+
+    def _export_not_ready(self, request):
+        response = TemplateResponse(request,
+                'rankings/export_not_ready.html', status=202)
+        response['Retry-After'] = str(settings.RANKING_MIN_COOLDOWN)
+        return response
+
     def render_ranking_to_csv(self, request, partial_key):
         raise NotImplementedError
 
+    def render_ranking_to_json(self, request, partial_key):
+        raise NotImplementedError
+
     def serialize_ranking(self, key):
         """Returns some data (representing ranking).
            This data will be used by :meth:`render_ranking`
@@ -239,21 +322,16 @@ class DefaultRankingController(RankingController):
         key = self.get_full_key(request, partial_key)
         if getattr(settings, 'MOCK_RANKINGSD', False):
             rows = self.serialize_ranking(key)['rows']
-        else:
-            try:
-                ranking = Ranking.objects.get(contest=self.contest, key=key)
-            except Ranking.DoesNotExist:
-                return None
-            serialized = ranking.serialized or {}
-            rows = serialized.get('rows')
-            if not rows:  # Ranking isn't ready yet
-                return None
+            for i, row in enumerate(rows):
+                if row['user'] == user:
+                    return i + 1
+            # User not found
+            return None
 
-        for i, row in enumerate(rows):
-            if row['user'] == user:
-                return i + 1
-        # User not found
-        return None
+        position = Ranking.find_user_position(self.contest, key, user)
+        if position is None:  # User not found or ranking isn't ready yet
+            return None
+        return position + 1
 
     def _render_ranking_page(self, key, data, page):
         request = self._fake_request(page)
@@ -276,22 +354,72 @@ class DefaultRankingController(RankingController):
         line.append(row['sum'])
         return line
 
+    def _iter_csv(self, key, data):
+        writer = unicodecsv.writer(_Echo())
+        yield writer.writerow(map(force_unicode,
+                              self._get_csv_header(key, data)))
+        for row in data['rows']:
+            yield writer.writerow(map(force_unicode,
+                                  self._get_csv_row(key, row)))
+
     def render_ranking_to_csv(self, request, partial_key):
+        """Streams the ranking stored by rankingsd as a CSV file.
+
+           If the stored ranking is not up to date, a message asking to
+           retry later is returned instead.
+        """
         key = self.get_full_key(request, partial_key)
-        data = self.serialize_ranking(key)
+        data = self._get_data_for_export(key)
+        if data is None:
+            return self._export_not_ready(request)
 
-        response = HttpResponse(content_type='text/csv')
+        response = StreamingHttpResponse(self._iter_csv(key, data),
+                                         content_type='text/csv')
         response['Content-Disposition'] = \
                 make_content_disposition_header('attachment',
                     u'%s-%s-%s.csv' % (_("ranking"), self.contest.id, key))
-        writer = unicodecsv.writer(response)
+        return response
+
+    def _get_json_row(self, key, data, row):
+        user = row['user']
+        return {
+            'place': row['place'],
+            'user': {
+                'id': user.id,
+                'username': user.username,
+                'first_name': user.first_name,
+                'last_name': user.last_name,
+            },
+            'results': dict((pi.short_name,
+                             force_unicode(r.score)
+                             if r and r.score is not None else None)
+                            for (pi, _visible), r
+                            in zip(data['problem_instances'],
+                                   row['results'])),
+            'sum': force_unicode(row['sum']),
+        }
 
-        writer.writerow(map(force_unicode,
-                        self._get_csv_header(key, data)))
+    def _iter_json(self, key, data):
         for row in data['rows']:
-            writer.writerow(map(force_unicode,
-                            self._get_csv_row(key, row)))
+            yield json.dumps(self._get_json_row(key, data, row)) + '\n'
+
+    def render_ranking_to_json(self, request, partial_key):
+        """Streams the ranking stored by rankingsd as newline-delimited
+           JSON, one object per row.
+
+           If the stored ranking is not up to date, a message asking to
+           retry later is returned instead.
+        """
+        key = self.get_full_key(request, partial_key)
+        data = self._get_data_for_export(key)
+        if data is None:
+            return self._export_not_ready(request)
 
+        response = StreamingHttpResponse(self._iter_json(key, data),
+                                         content_type='application/x-ndjson')
+        response['Content-Disposition'] = \
+                make_content_disposition_header('attachment',
+                    u'%s-%s-%s.ndjson' % (_("ranking"), self.contest.id, key))
         return response
 
     def filter_users_for_ranking(self, key, queryset):
@@ -344,6 +472,25 @@ class DefaultRankingController(RankingController):
                     data.append(user_data)
         return data
 
+    def _insert_row(self, data, row, extractor):
+        """Inserts ``row`` into ``data`` sorted by :meth:`_assign_places`,
+           keeping the order in which :meth:`_get_users_results` returns
+           rows with equal values.
+        """
+        def precedes(a, b):
+            if extractor(a) != extractor(b):
+                return extractor(a) > extractor(b)
+            return _user_order_key(a['user']) < _user_order_key(b['user'])
+
+        lo, hi = 0, len(data)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if precedes(data[mid], row):
+                lo = mid + 1
+            else:
+                hi = mid
+        data.insert(lo, row)
+
     def _assign_places(self, data, extractor):
         """Assigns places to the serialized ranking ``data``.
 
@@ -373,22 +520,58 @@ class DefaultRankingController(RankingController):
         return [(pi, self._is_problem_statement_visible(key, pi, now))
                 for pi in pis]
 
-    def serialize_ranking(self, key):
+    def _get_rounds_and_pis(self, key):
         partial_key = self.get_partial_key(key)
         rounds = list(self._rounds_for_key(key))
         pis = list(self._filter_pis_for_ranking(partial_key,
             ProblemInstance.objects.filter(round__in=rounds)).
             select_related('problem').prefetch_related('round'))
-        users = self.filter_users_for_ranking(key, User.objects.all())
+        return rounds, pis
+
+    def _get_rows(self, key, rounds, pis, users):
         results = UserResultForProblem.objects \
                 .filter(problem_instance__in=pis, user__in=users) \
                 .prefetch_related('problem_instance__round') \
                 .select_related('submission_report', 'problem_instance',
                         'problem_instance__contest')
+        return self._get_users_results(pis, results, rounds, users)
 
-        data = self._get_users_results(pis, results, rounds, users)
+    def serialize_ranking(self, key):
+        rounds, pis = self._get_rounds_and_pis(key)
+        users = self.filter_users_for_ranking(key, User.objects.all())
+        data = self._get_rows(key, rounds, pis, users)
         self._assign_places(data, itemgetter('sum'))
         return {'rows': data,
                 'problem_instances': self._get_pis_with_visibility(key, pis),
                 'participants_on_page': getattr(settings,
                     'PARTICIPANTS_ON_PAGE', 100)}
+
+    def _can_update_incrementally(self, key):
+        """Determines if the ranking for given key may be patched by
+           :meth:`update_serialized_ranking`. Controllers which override
+           :meth:`serialize_ranking` in a way not reflected by
+           :meth:`_get_rows` should return ``False`` here.
+        """
+        return True
+
+    def update_serialized_ranking(self, key, data, user_ids):
+        if data is None or not self._can_update_incrementally(key):
+            return None
+        rounds, pis = self._get_rounds_and_pis(key)
+        pis_with_visibility = self._get_pis_with_visibility(key, pis)
+        if [(pi.id, visible) for pi, visible in pis_with_visibility] != \
+                [(pi.id, visible) for pi, visible
+                 in data['problem_instances']]:
+            # The displayed problems have changed, so every row and every
+            # page has to be rebuilt.
+            return None
+        users = self.filter_users_for_ranking(key,
+                User.objects.filter(id__in=user_ids))
+        rows = [row for row in data['rows']
+                if row['user'].id not in user_ids]
+        for row in self._get_rows(key, rounds, pis, users):
+            self._insert_row(rows, row, itemgetter('sum'))
+        self._assign_places(rows, itemgetter('sum'))
+        data['rows'] = rows
+        data['problem_instances'] = pis_with_visibility
+        return data
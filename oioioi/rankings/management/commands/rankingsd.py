@@ -1,11 +1,18 @@
+import logging
+import multiprocessing
+import optparse
 import time
 
 from django.core.management.base import BaseCommand
+from django.db import connections
 from oioioi.rankings.models import choose_for_recalculation, recalculate
 from django.utils.translation import ugettext as _
 from django.conf import settings
 
 
+logger = logging.getLogger(__name__)
+
+
 class Command(BaseCommand):
     help = _(
         "Daemon that rebuilds rankings. Ranking generation is quite a slow "
@@ -13,13 +20,59 @@ class Command(BaseCommand):
         "This allows gracefully handling both the biggest, busiest contests, "
         "and the stale ones."
         "Internally it uses explicit invalidation and eager recalculation "
-        "with cooldown."
+        "with cooldown. Multiple workers (and multiple instances of the "
+        "daemon) may run at the same time, each recalculating "
+        "a different ranking."
+    )
+    option_list = BaseCommand.option_list + (
+        optparse.make_option('-w', '--workers', action='store', type='int',
+                             dest='workers',
+                             default=settings.RANKINGSD_CONCURRENCY,
+                             help=_("Number of worker processes. "
+                                    "Default value is taken from "
+                                    "RANKINGSD_CONCURRENCY setting."),
+                             metavar=_("WORKERS")),
     )
 
+    def _worker(self):
+        while True:
+            try:
+                r = choose_for_recalculation()
+                if r:
+                    recalculate(r)
+                    continue
+            # pylint: disable=broad-except
+            except Exception:
+                # The failed ranking is claimed again after
+                # RANKING_RECALC_TIMEOUT, and fully rebuilt then.
+                logger.error("Ranking recalculation failed", exc_info=True)
+                # The connection may be unusable after a database error
+                for connection in connections.all():
+                    connection.close()
+            time.sleep(settings.RANKINGSD_POLLING_INTERVAL)
+
+    def _start_worker(self):
+        process = multiprocessing.Process(target=self._worker)
+        process.daemon = True
+        process.start()
+        return process
+
     def handle(self, *args, **options):
+        workers = options['workers']
+        if workers <= 1:
+            self._worker()
+            return
+
+        # Database connections must not be shared between the processes
+        for connection in connections.all():
+            connection.close()
+        processes = [self._start_worker() for _i in xrange(workers)]
         while True:
-            r = choose_for_recalculation()
-            if r:
-                recalculate(r)
-            else:
-                time.sleep(settings.RANKINGSD_POLLING_INTERVAL)
+            time.sleep(settings.RANKINGSD_POLLING_INTERVAL)
+            # Workers killed by anything not caught in _worker are replaced
+            for i, process in enumerate(processes):
+                if not process.is_alive():
+                    logger.error("Rankingsd worker %d exited with code %s, "
+                                 "restarting", process.pid,
+                                 process.exitcode)
+                    processes[i] = self._start_worker()
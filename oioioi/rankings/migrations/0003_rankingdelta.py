@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+from django.conf import settings
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('contests', '0007_auto_20161214_1411'),
+        ('rankings', '0002_auto_20160618_1855'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ranking',
+            name='needs_full_recalculation',
+            field=models.BooleanField(default=True),
+        ),
+        migrations.AddField(
+            model_name='rankingrecalc',
+            name='full_recalculation',
+            field=models.BooleanField(default=True),
+        ),
+        migrations.CreateModel(
+            name='RankingDelta',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('problem_instance', models.ForeignKey(to='contests.ProblemInstance')),
+                ('ranking', models.ForeignKey(related_name='deltas', to='rankings.Ranking')),
+                ('recalc', models.ForeignKey(related_name='deltas', to='rankings.RankingRecalc', null=True)),
+                ('user', models.ForeignKey(to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
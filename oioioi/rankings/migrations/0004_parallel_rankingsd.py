@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rankings', '0003_rankingdelta'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ranking',
+            name='last_view_date',
+            field=models.DateTimeField(null=True),
+        ),
+        migrations.AddField(
+            model_name='rankingrecalc',
+            name='start_date',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
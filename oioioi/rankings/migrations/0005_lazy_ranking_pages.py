@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+def mark_generated_rankings(apps, schema_editor):
+    Ranking = apps.get_model('rankings', 'Ranking')
+    Ranking.objects.filter(serialized_data__isnull=False).update(version=1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rankings', '0004_parallel_rankingsd'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ranking',
+            name='version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(mark_generated_rankings,
+                             migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='rankingpage',
+            name='ranking',
+        ),
+        migrations.DeleteModel(
+            name='RankingPage',
+        ),
+    ]
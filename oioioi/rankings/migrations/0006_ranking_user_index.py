@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rankings', '0005_lazy_ranking_pages'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ranking',
+            name='user_index',
+            field=models.BinaryField(null=True),
+        ),
+    ]
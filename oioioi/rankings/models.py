@@ -1,27 +1,32 @@
-import pickle
 from datetime import timedelta
 
 from django.db import models, transaction
+from django.db.models import Count, Q
 from django.utils import timezone
 from django.conf import settings
+from django.contrib.auth.models import User
 
-from oioioi.contests.models import Contest
+from oioioi.contests.models import Contest, ProblemInstance
+from oioioi.rankings import serialization
 
 
 class RankingRecalc(models.Model):
-    pass
+    start_date = models.DateTimeField(default=timezone.now)
+    # whether the ranking is rebuilt from scratch, or only patched with
+    # the deltas attached to this recalculation
+    full_recalculation = models.BooleanField(default=True)
 
 
 class Ranking(models.Model):
-    """Represents the state (i.e. is it up to date) and data (both in
-       serialized and html formats) for a single ranking.
+    """Represents the state (i.e. is it up to date) and serialized data
+       for a single ranking.
 
        For the purposes of this class, we identify the ranking by its contest
        and key. The generated ranking must NOT depend on the request or
        any other ranking.
 
        This class is responsible only for dealing with WHEN to recalculate
-       and to store the serialized data and html for the ranking. Anything
+       and to store the serialized data for the ranking. Anything
        beyond that should be delegated to RankingController.
 
        Invalidation is handled explicitly. We assume our ranking is valid,
@@ -64,6 +69,28 @@ class Ranking(models.Model):
        RANKING_MIN_COOLDOWN - minimum cooldown duration (safety limit)
        RANKING_MAX_COOLDOWN - maximum cooldown duration (safety limit)
 
+       Most invalidations come from a single user's result for a single
+       problem instance being changed. Such events are recorded as
+       :class:`RankingDelta` objects (see :meth:`invalidate_user_result`)
+       and, if the ranking controller supports it, the stored ranking is
+       only patched instead of being rebuilt from scratch. Any other
+       invalidation (:meth:`invalidate_queryset`) forces a full
+       recalculation. The incremental mode can be configured by setting:
+       RANKING_MAX_INCREMENTAL_USERS - maximum number of users with changed
+                                       results, for which the ranking is
+                                       patched (0 disables incremental mode)
+
+       Rankings may be recalculated by multiple rankingsd workers (processes
+       or even hosts) at once. Each of them claims a different ranking
+       in :func:`choose_for_recalculation`. It can be configured by setting:
+       RANKINGSD_MAX_WORKERS_PER_CONTEST - how many rankings of a single
+                                           contest may be recalculated
+                                           at the same time
+       RANKING_VIEW_PRIORITY_PERIOD - rankings viewed during that many
+                                      seconds are recalculated first
+       RANKING_RECALC_TIMEOUT - after how many seconds an unfinished
+                                recalculation is considered abandoned
+
        NOTE: We use the local time (and not the database time), for all time
        calculations, including the cooldowns, so be careful about drastic
        changes of system time on the generating machine.
@@ -74,16 +101,21 @@ class Ranking(models.Model):
     # advisory
     invalidation_date = models.DateTimeField(auto_now_add=True)
     last_recalculation_date = models.DateTimeField(null=True)
+    last_view_date = models.DateTimeField(null=True)
 
     # used to determine cooldown
     last_recalculation_duration = models.DurationField(default=timedelta(0))
 
-    # internal, use serialized instead
+    # internal, use serialized and find_user_position instead
     serialized_data = models.BinaryField(null=True)
+    user_index = models.BinaryField(null=True)
+    # incremented on every recalculation, used to invalidate cached pages
+    version = models.PositiveIntegerField(default=0)
 
     # internal to ranking recalculation mechanism
     # use invalidate_* and is_up_to_date instead
     needs_recalculation = models.BooleanField(default=True)
+    needs_full_recalculation = models.BooleanField(default=True)
     cooldown_date = models.DateTimeField(auto_now_add=True)
     recalc_in_progress = models.ForeignKey(RankingRecalc, null=True)
 
@@ -92,7 +124,29 @@ class Ranking(models.Model):
         """Serialized data of this ranking"""
         if not self.serialized_data:
             return None
-        return pickle.loads(self.serialized_data)
+        return serialization.loads(self.serialized_data, self.contest_id)
+
+    @classmethod
+    def find_user_position(cls, contest, key, user):
+        """Returns the 0-based position of the user in the stored ranking,
+           without loading the whole ranking if possible.
+
+           Returns ``None`` if the user is not in the ranking, or
+           the ranking hasn't been generated yet.
+        """
+        try:
+            ranking = cls.objects.only('id', 'contest', 'user_index') \
+                    .get(contest=contest, key=key)
+        except cls.DoesNotExist:
+            return None
+        if ranking.user_index is not None:
+            return serialization.find_in_user_index(ranking.user_index,
+                                                    user.id)
+        serialized = ranking.serialized or {}
+        for i, row in enumerate(serialized.get('rows') or []):
+            if row['user'] == user:
+                return i
+        return None
 
     def controller(self):
         """RankingController of the contest"""
@@ -102,6 +156,7 @@ class Ranking(models.Model):
     def invalidate_queryset(cls, qs):
         """Marks queryset of rankings as invalid"""
         qs.all().update(needs_recalculation=True,
+                        needs_full_recalculation=True,
                         invalidation_date=timezone.now())
 
     @classmethod
@@ -109,6 +164,52 @@ class Ranking(models.Model):
         """Marks all the keys in the constest as invalid"""
         return cls.invalidate_queryset(cls.objects.filter(contest=contest))
 
+    @classmethod
+    def invalidate_user_result(cls, user, problem_instance):
+        """Marks all the keys in the contest as invalid, because
+           the result of ``user`` for ``problem_instance`` has changed.
+
+           Unlike :meth:`invalidate_contest`, this allows the rankings
+           to be updated incrementally.
+        """
+        qs = cls.objects.filter(contest=problem_instance.contest_id)
+        RankingDelta.objects.bulk_create([
+            RankingDelta(ranking_id=ranking_id, user=user,
+                         problem_instance=problem_instance)
+            for ranking_id in qs.values_list('id', flat=True)])
+        qs.update(needs_recalculation=True, invalidation_date=timezone.now())
+
+    @classmethod
+    def invalidate_user_results(cls, contest, users, problem_instances):
+        """Like :meth:`invalidate_user_result`, but for results of many
+           users for many problem instances of the contest at once.
+        """
+        qs = cls.objects.filter(contest=contest)
+        max_users = getattr(settings, 'RANKING_MAX_INCREMENTAL_USERS', 0)
+        if len(users) > max_users:
+            # The rankings wouldn't be patched anyway
+            cls.invalidate_queryset(qs)
+            return
+        RankingDelta.objects.bulk_create([
+            RankingDelta(ranking_id=ranking_id, user=user,
+                         problem_instance=problem_instance)
+            for ranking_id in qs.values_list('id', flat=True)
+            for user in users
+            for problem_instance in problem_instances])
+        qs.update(needs_recalculation=True, invalidation_date=timezone.now())
+
+    def mark_viewed(self):
+        """Notes that someone is looking at this ranking, so that it gets
+           a priority in recalculation.
+        """
+        now = timezone.now()
+        period = timedelta(seconds=settings.RANKING_VIEW_PRIORITY_PERIOD)
+        # Avoid a database write on every single view
+        if self.last_view_date is None or \
+                self.last_view_date < now - period / 2:
+            self.last_view_date = now
+            Ranking.objects.filter(id=self.id).update(last_view_date=now)
+
     def is_up_to_date(self):
         """Is all the data for this contest up to date (i.e. not invalidated
            since the last recalculation succeeded)?
@@ -122,24 +223,61 @@ class Ranking(models.Model):
         unique_together = ('contest', 'key')
 
 
-class RankingPage(models.Model):
-    """Single page of a ranking"""
-    ranking = models.ForeignKey(Ranking, related_name='pages')
-    nr = models.IntegerField()
-    data = models.TextField()
+class RankingDelta(models.Model):
+    """Records that the result of a user for a problem instance has changed
+       since the last recalculation of the ranking.
+
+       Deltas which are not yet handled have ``recalc`` set to ``None``.
+       When a recalculation starts, they are attached to it and deleted
+       together with it, when it's done.
+    """
+    ranking = models.ForeignKey(Ranking, related_name='deltas')
+    recalc = models.ForeignKey(RankingRecalc, null=True,
+                               related_name='deltas')
+    user = models.ForeignKey(User)
+    problem_instance = models.ForeignKey(ProblemInstance)
 
 
 def clamp(minimum, x, maximum):
     return max(minimum, min(x, maximum))
 
 
+def _rankings_to_recalculate(now):
+    abandoned = now - \
+            timedelta(seconds=settings.RANKING_RECALC_TIMEOUT)
+    abandoned_recalcs = list(RankingRecalc.objects
+            .filter(start_date__lt=abandoned).values_list('id', flat=True))
+    qs = Ranking.objects.filter(needs_recalculation=True,
+                                cooldown_date__lt=now) \
+            .filter(Q(recalc_in_progress__isnull=True) |
+                    Q(recalc_in_progress__in=abandoned_recalcs))
+
+    max_workers = settings.RANKINGSD_MAX_WORKERS_PER_CONTEST
+    if max_workers:
+        busy_contests = Ranking.objects \
+                .filter(recalc_in_progress__isnull=False) \
+                .exclude(recalc_in_progress__in=abandoned_recalcs) \
+                .values('contest').annotate(workers=Count('id')) \
+                .filter(workers__gte=max_workers)
+        qs = qs.exclude(contest__in=[c['contest'] for c in busy_contests])
+    return qs
+
+
 @transaction.atomic
 def choose_for_recalculation():
+    """Claims a ranking for recalculation and returns
+       a :class:`RankingRecalc` object representing it, or ``None`` if
+       no ranking needs to be recalculated now.
+
+       Rankings viewed recently come first, then the ones which were not
+       recalculated for the longest time.
+    """
     now = timezone.now()
-    r = Ranking.objects.filter(
-        needs_recalculation=True,
-        cooldown_date__lt=now
-    ).order_by('last_recalculation_date').select_for_update().first()
+    qs = _rankings_to_recalculate(now).order_by('last_recalculation_date')
+    viewed = now - timedelta(seconds=settings.RANKING_VIEW_PRIORITY_PERIOD)
+    r = qs.filter(last_view_date__gte=viewed).select_for_update().first()
+    if r is None:
+        r = qs.select_for_update().first()
     if r is None:
         return None
     cooldown_duration = clamp(
@@ -148,32 +286,43 @@ def choose_for_recalculation():
         timedelta(seconds=settings.RANKING_MAX_COOLDOWN)
     )
     r.cooldown_date = now + cooldown_duration
-    r.needs_recalculation = False
-    recalc = RankingRecalc()
+    # Deltas of an abandoned recalculation may have been lost, so we
+    # rebuild the ranking from scratch in such case.
+    recalc = RankingRecalc(start_date=now,
+                           full_recalculation=r.needs_full_recalculation
+                           or not r.serialized_data
+                           or r.recalc_in_progress_id is not None)
     recalc.save()
+    if not recalc.full_recalculation:
+        RankingDelta.objects.filter(ranking=r, recalc=None) \
+                .update(recalc=recalc)
+        max_users = getattr(settings, 'RANKING_MAX_INCREMENTAL_USERS', 0)
+        if recalc.deltas.values('user').distinct().count() > max_users:
+            recalc.full_recalculation = True
+            recalc.save()
+    if recalc.full_recalculation:
+        # A full recalculation handles all the pending deltas anyway
+        RankingDelta.objects.filter(ranking=r).delete()
+    r.needs_recalculation = False
+    r.needs_full_recalculation = False
+    old_recalc = r.recalc_in_progress
     r.recalc_in_progress = recalc
     r.save()
+    if old_recalc is not None:
+        # The previous recalculation has been abandoned
+        old_recalc.delete()
     return recalc
 
 
 @transaction.atomic
-def save_pages(ranking, pages_list):
-    ranking.pages.all().delete()
-    for nr, page_data in enumerate(pages_list, 1):
-        page = RankingPage(ranking=ranking, nr=nr, data=page_data)
-        page.save()
-
-
-@transaction.atomic
-def save_recalc_results(recalc, date_before, date_after, serialized,
-                        pages_list):
+def save_recalc_results(recalc, date_before, date_after, serialized):
     try:
         r = Ranking.objects.filter(recalc_in_progress=recalc). \
             select_for_update().get()
     except Ranking.DoesNotExist:
         return
-    r.serialized_data = pickle.dumps(serialized)
-    save_pages(r, pages_list)
+    r.serialized_data, r.user_index = serialization.dumps(serialized)
+    r.version += 1
     r.last_recalculation_date = date_before
     r.last_recalculation_duration = date_after - date_before
     old_recalc = r.recalc_in_progress
@@ -190,7 +339,15 @@ def recalculate(recalc):
     except Ranking.DoesNotExist:
         return
     ranking_controller = r.controller()
-    serialized, pages_list = ranking_controller.build_ranking(r.key)
+    serialized = None
+    if not recalc.full_recalculation:
+        # None if the problem instances of the ranking have been deleted
+        old_serialized = r.serialized
+        if old_serialized is not None:
+            user_ids = set(recalc.deltas.values_list('user_id', flat=True))
+            serialized = ranking_controller.update_serialized_ranking(r.key,
+                    old_serialized, user_ids)
+    if serialized is None:
+        serialized = ranking_controller.build_ranking(r.key)
     date_after = timezone.now()
-    save_recalc_results(recalc, date_before, date_after, serialized,
-                        pages_list)
+    save_recalc_results(recalc, date_before, date_after, serialized)
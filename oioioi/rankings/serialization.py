@@ -0,0 +1,254 @@
+"""Storage format of the serialized rankings.
+
+   The data returned by
+   :meth:`~oioioi.rankings.controllers.RankingController.serialize_ranking`
+   contains model instances, so pickling it as a whole is both slow and
+   wasteful. Rankings in the usual format (see
+   :meth:`~oioioi.rankings.controllers.DefaultRankingController.serialize_ranking`)
+   are therefore stored as compressed columns of primitive values: user ids,
+   places, serialized scores of every problem and sums. The rows are turned
+   back into dictionaries with users and results only when they are
+   accessed (see :class:`LazyRankingRows`).
+
+   Additionally, a separate index mapping user ids to positions in the
+   ranking is built, so that searching for a user requires neither
+   loading the whole ranking nor a linear scan.
+
+   Any other data is stored as a pickle, so that ranking controllers
+   are free to use their own format.
+"""
+
+import json
+import pickle
+import struct
+import zlib
+
+from django.contrib.auth.models import User
+from django.core.urlresolvers import reverse
+
+from oioioi.contests.models import ProblemInstance
+from oioioi.contests.scores import ScoreValue
+
+
+MAGIC = 'RNKG'
+PICKLE_FORMAT = 0
+COLUMNAR_FORMAT = 1
+
+_HEADER = struct.Struct('<4sB')
+_INDEX_ENTRY = struct.Struct('<ii')
+
+_ROW_KEYS = frozenset(['user', 'place', 'sum', 'results'])
+_PRIMITIVE_TYPES = (type(None), bool, int, long, float, str, unicode)
+
+# Users are fetched in chunks of that size, when all rows are accessed.
+HYDRATION_CHUNK_SIZE = 500
+
+
+class RankingResult(object):
+    """A result of a user for a problem instance, restored from the columnar
+       format. It provides the attributes of
+       :class:`~oioioi.contests.models.UserResultForProblem` used when
+       displaying the ranking.
+    """
+    def __init__(self, problem_instance, score, submission_id=None,
+                 url=None):
+        self.problem_instance = problem_instance
+        self.score = score
+        self.submission_id = submission_id
+        if url is not None:
+            self.url = url
+
+    @property
+    def problem_instance_id(self):
+        return self.problem_instance.id
+
+
+def _serialize_score(score):
+    return score.serialize() if score is not None else ''
+
+
+def _submission_id(result):
+    if isinstance(result, RankingResult):
+        return result.submission_id
+    report = getattr(result, 'submission_report', None)
+    return getattr(report, 'submission_id', None)
+
+
+def _is_primitive(value):
+    return isinstance(value, _PRIMITIVE_TYPES)
+
+
+def _can_store_columns(data):
+    if not isinstance(data, dict) or \
+            not isinstance(data.get('rows'), (list, LazyRankingRows)) or \
+            'problem_instances' not in data:
+        return False
+    if not all(_is_primitive(v) for k, v in data.iteritems()
+               if k not in ('rows', 'problem_instances')):
+        return False
+    for row in data['rows']:
+        if not all(_is_primitive(v) for k, v in row.iteritems()
+                   if k not in _ROW_KEYS):
+            return False
+    return True
+
+
+def _to_columns(data):
+    rows = data['rows']
+    pis = data['problem_instances']
+    extra_keys = sorted(set(k for row in rows for k in row
+                            if k not in _ROW_KEYS))
+    columns = {
+        'problem_instances': [[pi.id, bool(visible)]
+                              for pi, visible in pis],
+        'meta': dict((k, v) for k, v in data.iteritems()
+                     if k not in ('rows', 'problem_instances')),
+        'user_ids': [row['user'].id for row in rows],
+        'places': [row['place'] for row in rows],
+        'sums': [_serialize_score(row['sum']) for row in rows],
+        # None means no result at all, while '' -- no score
+        'scores': [[_serialize_score(row['results'][i].score)
+                    if row['results'][i] is not None else None
+                    for row in rows] for i in xrange(len(pis))],
+        'submissions': [[_submission_id(row['results'][i])
+                         for row in rows] for i in xrange(len(pis))],
+        'extra': dict((k, [row.get(k) for row in rows]) for k in extra_keys),
+    }
+    return columns
+
+
+def build_user_index(user_ids):
+    """Returns a packed, sorted list of ``(user_id, position)`` pairs."""
+    entries = sorted((user_id, position)
+                     for position, user_id in enumerate(user_ids))
+    return ''.join(_INDEX_ENTRY.pack(*entry) for entry in entries)
+
+
+def find_in_user_index(index, user_id):
+    """Returns the 0-based position of the user in the ranking, using
+       the index built by :func:`build_user_index`, or ``None`` if
+       the user is not in the ranking.
+    """
+    index = str(index)
+    lo, hi = 0, len(index) // _INDEX_ENTRY.size
+    while lo < hi:
+        mid = (lo + hi) // 2
+        entry_user_id, position = \
+                _INDEX_ENTRY.unpack_from(index, mid * _INDEX_ENTRY.size)
+        if entry_user_id == user_id:
+            return position
+        elif entry_user_id < user_id:
+            lo = mid + 1
+        else:
+            hi = mid
+    return None
+
+
+def dumps(data):
+    """Serializes ranking data. Returns a pair consisting of the serialized
+       data and the user index (or ``None`` if the data is not in the
+       usual format).
+    """
+    if not _can_store_columns(data):
+        return _HEADER.pack(MAGIC, PICKLE_FORMAT) + pickle.dumps(data), None
+    columns = _to_columns(data)
+    blob = _HEADER.pack(MAGIC, COLUMNAR_FORMAT) + \
+            zlib.compress(json.dumps(columns, separators=(',', ':')))
+    return blob, build_user_index(columns['user_ids'])
+
+
+def loads(blob, contest_id):
+    """Inverts the operation of :func:`dumps`.
+
+       Returns ``None`` if the problem instances the ranking refers to
+       no longer exist.
+    """
+    blob = str(blob)
+    if not blob.startswith(MAGIC):
+        # Stored before the format was versioned
+        return pickle.loads(blob)
+    _magic, version = _HEADER.unpack_from(blob)
+    payload = blob[_HEADER.size:]
+    if version == PICKLE_FORMAT:
+        return pickle.loads(payload)
+    elif version == COLUMNAR_FORMAT:
+        return _from_columns(json.loads(zlib.decompress(payload)),
+                             contest_id)
+    raise ValueError("Unknown ranking format version %d" % (version,))
+
+
+def _from_columns(columns, contest_id):
+    pi_ids = [pi_id for pi_id, _visible in columns['problem_instances']]
+    pis = ProblemInstance.objects.select_related('problem', 'round') \
+            .in_bulk(pi_ids)
+    if len(pis) != len(pi_ids):
+        return None
+    data = dict(columns['meta'])
+    data['problem_instances'] = [(pis[pi_id], visible) for pi_id, visible
+                                 in columns['problem_instances']]
+    data['rows'] = LazyRankingRows(columns,
+                                   [pis[pi_id] for pi_id in pi_ids],
+                                   contest_id)
+    return data
+
+
+class LazyRankingRows(object):
+    """A read-only sequence of ranking rows, restored from columns only when
+       accessed. Slicing it (as done by the pagination) fetches only users
+       from the requested rows.
+    """
+    def __init__(self, columns, pis, contest_id):
+        self._columns = columns
+        self._pis = pis
+        self._contest_id = contest_id
+
+    def __len__(self):
+        return len(self._columns['user_ids'])
+
+    def __nonzero__(self):
+        return len(self) > 0
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return self._hydrate(xrange(*key.indices(len(self))))
+        if key < 0:
+            key += len(self)
+        if not 0 <= key < len(self):
+            raise IndexError(key)
+        return self._hydrate([key])[0]
+
+    def __iter__(self):
+        for start in xrange(0, len(self), HYDRATION_CHUNK_SIZE):
+            for row in self[start:start + HYDRATION_CHUNK_SIZE]:
+                yield row
+
+    def _result(self, pi, score, submission_id):
+        if score is None:
+            return None
+        url = None
+        if submission_id is not None:
+            url = reverse('submission', kwargs={
+                'contest_id': self._contest_id,
+                'submission_id': submission_id})
+        return RankingResult(pi, ScoreValue.deserialize(score),
+                             submission_id, url)
+
+    def _hydrate(self, positions):
+        columns = self._columns
+        user_ids = [columns['user_ids'][i] for i in positions]
+        users = User.objects.in_bulk(user_ids)
+        rows = []
+        for i, user_id in zip(positions, user_ids):
+            row = {
+                # Users removed since the recalculation are shown as empty
+                'user': users.get(user_id) or User(id=user_id),
+                'place': columns['places'][i],
+                'sum': ScoreValue.deserialize(columns['sums'][i]),
+                'results': [self._result(pi, columns['scores'][j][i],
+                                         columns['submissions'][j][i])
+                            for j, pi in enumerate(self._pis)],
+            }
+            for key, values in columns['extra'].iteritems():
+                row[key] = values[i]
+            rows.append(row)
+        return rows
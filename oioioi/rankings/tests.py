@@ -1,18 +1,23 @@
-from datetime import datetime
+import json
+import pickle
+from datetime import datetime, timedelta
 
 from django.test.utils import override_settings
 from django.core.urlresolvers import reverse
+from django.utils import timezone
 from django.utils.timezone import utc
 from django.contrib.auth.models import User
 from django.http import QueryDict
 from django.conf import settings
+from django.core.cache import cache
 
 from oioioi.base.tests import TestCase, fake_time, fake_timezone_now, \
         check_not_accessible
 from oioioi.contests.models import Contest, UserResultForProblem, \
         ProblemInstance
+from oioioi.rankings import serialization
 from oioioi.rankings.controllers import DefaultRankingController
-from oioioi.rankings.models import Ranking, RankingPage, recalculate, \
+from oioioi.rankings.models import Ranking, RankingRecalc, recalculate, \
         choose_for_recalculation
 from oioioi.programs.controllers import ProgrammingContestController
 
@@ -207,22 +212,25 @@ class TestRankingViews(TestCase):
         self.client.login(username='test_admin')
         with fake_time(datetime(2012, 8, 5, tzinfo=utc)):
             response = self.client.get(url)
-            self.assertContains(response, 'User,')
+            self.assertEqual(response.status_code, 200)
+            self.assertTrue(response.streaming)
+            content = ''.join(response.streaming_content)
+            self.assertIn('User,', content)
             # Check that Admin is filtered out.
-            self.assertNotContains(response, 'Admin')
+            self.assertNotIn('Admin', content)
 
             expected_order = ['Test,User', 'Test,User 2']
             prev_pos = 0
             for user in expected_order:
                 pattern = '%s,' % (user,)
-                self.assertIn(user, response.content)
-                pos = response.content.find(pattern)
+                self.assertIn(user, content)
+                pos = content.find(pattern)
                 self.assertGreater(pos, prev_pos, msg=('User %s has incorrect '
                        'position' % (user,)))
                 prev_pos = pos
 
             for task in ['zad1', 'zad2', 'zad3', 'zad3']:
-                self.assertContains(response, task)
+                self.assertIn(task, content)
 
             response = self.client.get(reverse('ranking',
                 kwargs={'contest_id': contest.id, 'key': '1'}))
@@ -231,8 +239,58 @@ class TestRankingViews(TestCase):
                 self.assertNotContains(response, task)
 
 
+    def test_ranking_json_view(self):
+        contest = Contest.objects.get()
+        url = reverse('ranking_json', kwargs={'contest_id': contest.id,
+                                              'key': 'c'})
+
+        self.client.login(username='test_user')
+        with fake_time(datetime(2015, 8, 5, tzinfo=utc)):
+            check_not_accessible(self, url)
+
+        self.client.login(username='test_admin')
+        with fake_time(datetime(2012, 8, 5, tzinfo=utc)):
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            rows = [json.loads(line) for line
+                    in ''.join(response.streaming_content).splitlines()]
+            self.assertEqual([row['user']['username'] for row in rows],
+                             ['test_user', 'test_user2'])
+            self.assertEqual([row['place'] for row in rows], [1, 2])
+            self.assertEqual(sorted(rows[0]['results'].keys()),
+                             ['zad1', 'zad2', 'zad3', 'zad4'])
+
+    @override_settings(MOCK_RANKINGSD=False)
+    def test_export_from_rankingsd(self):
+        contest = Contest.objects.get()
+        url = reverse('ranking_csv', kwargs={'contest_id': contest.id,
+                                            'key': 'c'})
+
+        self.client.login(username='test_admin')
+        with fake_time(datetime(2012, 8, 5, tzinfo=utc)):
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 202)
+            self.assertContains(response, "We're generating the ranking",
+                                status_code=202)
+
+            ranking = Ranking.objects.get(contest=contest)
+            self.assertIsNotNone(ranking.last_view_date)
+            recalculate(choose_for_recalculation())
+
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            content = ''.join(response.streaming_content)
+            self.assertIn('Test,User', content)
+
+            # The last generated ranking is exported until it's recalculated
+            Ranking.invalidate_contest(contest)
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(''.join(response.streaming_content), content)
+
+
 class MockRankingController(DefaultRankingController):
-    recalculation_result = ('serialized', ['1st', '2nd', '3rd'])
+    recalculation_result = 'serialized'
 
     def build_ranking(self, key):
         assert key == "key"
@@ -274,10 +332,7 @@ class TestRecalc(TestCase):
         ranking.refresh_from_db()
         self.assertTrue(ranking.is_up_to_date())
         self.assertEqual(ranking.serialized, 'serialized')
-        self.assertEqual([page.data for page in ranking.pages.all()],
-                         ['1st', '2nd', '3rd'])
-        self.assertEqual([page.nr for page in ranking.pages.all()],
-                         [1, 2, 3])
+        self.assertEqual(ranking.version, 1)
 
     def test_simple_invalidate(self):
         contest = Contest.objects.get()
@@ -296,12 +351,234 @@ class TestRecalc(TestCase):
         recalc = choose_for_recalculation()
         self.assertIsNotNone(recalc)
 
+    def _recalculate_after_cooldown(self, ranking):
+        Ranking.objects.filter(id=ranking.id) \
+                .update(cooldown_date=timezone.now() - timedelta(minutes=1))
+        recalc = choose_for_recalculation()
+        self.assertIsNotNone(recalc)
+        recalculate(recalc)
+        ranking.refresh_from_db()
+        return recalc
+
+    @override_settings(RANKING_MAX_INCREMENTAL_USERS=10)
+    def test_incremental_update(self):
+        contest = Contest.objects.get()
+        controller = contest.controller.ranking_controller()
+        pi = ProblemInstance.objects.get(id=3)
+        UserResultForProblem.objects.create(
+                user=User.objects.get(username='test_user3'),
+                problem_instance=pi, status='OK', score='int:1')
+        ranking = Ranking.objects.create(contest=contest, key='admin#c')
+        recalc = self._recalculate_after_cooldown(ranking)
+        self.assertTrue(recalc.full_recalculation)
+        self.assertTrue(ranking.is_up_to_date())
+
+        user = User.objects.get(username='test_user2')
+        old_position = [row['user'] for row
+                        in ranking.serialized['rows']].index(user)
+        self.assertEqual(old_position, 1)
+
+        result = UserResultForProblem.objects.get(user=user,
+                                                  problem_instance=pi)
+        result.score = 'int:1000'
+        result.save()
+        Ranking.invalidate_user_result(user, pi)
+
+        ranking.refresh_from_db()
+        self.assertFalse(ranking.is_up_to_date())
+        self.assertFalse(ranking.needs_full_recalculation)
+        self.assertEqual(ranking.deltas.count(), 1)
+
+        recalc = self._recalculate_after_cooldown(ranking)
+        self.assertFalse(recalc.full_recalculation)
+        self.assertTrue(ranking.is_up_to_date())
+        self.assertEqual(ranking.deltas.count(), 0)
+
+        expected = controller.serialize_ranking('admin#c')['rows']
+        rows = ranking.serialized['rows']
+        self.assertEqual([(row['user'].id, row['place']) for row in rows],
+                         [(row['user'].id, row['place'])
+                          for row in expected])
+        self.assertEqual(rows[0]['user'], user)
+        self.assertEqual(ranking.version, 2)
+
+    @override_settings(RANKING_MAX_INCREMENTAL_USERS=10)
+    def test_incremental_update_after_deleting_problem(self):
+        contest = Contest.objects.get()
+        ranking = Ranking.objects.create(contest=contest, key='admin#c')
+        self._recalculate_after_cooldown(ranking)
+
+        user = User.objects.get(username='test_user')
+        pi = ProblemInstance.objects.get(id=3)
+        Ranking.invalidate_user_result(user, pi)
+        pi.delete()
+        self.assertIsNone(ranking.serialized)
+
+        recalc = self._recalculate_after_cooldown(ranking)
+        self.assertFalse(recalc.full_recalculation)
+        self.assertTrue(ranking.is_up_to_date())
+        self.assertNotIn(3, [pi.id for pi, _visible
+                             in ranking.serialized['problem_instances']])
+
+    def test_one_worker_per_contest(self):
+        contest = Contest.objects.get()
+        Ranking.objects.create(contest=contest, key='admin#c')
+        Ranking.objects.create(contest=contest, key='regular#c')
+        recalc = choose_for_recalculation()
+        self.assertIsNotNone(recalc)
+        self.assertIsNone(choose_for_recalculation())
+
+        with override_settings(RANKINGSD_MAX_WORKERS_PER_CONTEST=2):
+            other_recalc = choose_for_recalculation()
+            self.assertIsNotNone(other_recalc)
+            self.assertNotEqual(
+                Ranking.objects.get(recalc_in_progress=recalc),
+                Ranking.objects.get(recalc_in_progress=other_recalc))
+
+            # A ranking being recalculated is not claimed twice.
+            Ranking.invalidate_contest(contest)
+            Ranking.objects.update(cooldown_date=timezone.now()
+                                   - timedelta(minutes=1))
+            self.assertIsNone(choose_for_recalculation())
+
+    def test_abandoned_recalculation(self):
+        contest = Contest.objects.get()
+        ranking = Ranking.objects.create(contest=contest, key='admin#c')
+        recalc = choose_for_recalculation()
+        self.assertIsNotNone(recalc)
+        Ranking.invalidate_contest(contest)
+        Ranking.objects.update(cooldown_date=timezone.now()
+                               - timedelta(minutes=1))
+        self.assertIsNone(choose_for_recalculation())
+
+        RankingRecalc.objects.filter(id=recalc.id).update(
+                start_date=timezone.now() - timedelta(
+                    seconds=settings.RANKING_RECALC_TIMEOUT + 1))
+        new_recalc = choose_for_recalculation()
+        self.assertIsNotNone(new_recalc)
+        self.assertTrue(new_recalc.full_recalculation)
+        self.assertFalse(RankingRecalc.objects.filter(id=recalc.id).exists())
+        ranking.refresh_from_db()
+        self.assertEqual(ranking.recalc_in_progress, new_recalc)
+
+        # The abandoned worker can't overwrite the results.
+        recalculate(recalc)
+        ranking.refresh_from_db()
+        self.assertEqual(ranking.recalc_in_progress, new_recalc)
+
+    @override_settings(MOCK_RANKINGSD=False)
+    def test_viewed_rankings_first(self):
+        contest = Contest.objects.get()
+        Ranking.objects.create(contest=contest, key='admin#c')
+        Ranking.objects.create(contest=contest, key='regular#1')
+        self.client.get(reverse('ranking',
+            kwargs={'contest_id': contest.id, 'key': '1'}))
+
+        recalc = choose_for_recalculation()
+        self.assertEqual(Ranking.objects.get(recalc_in_progress=recalc).key,
+                         'regular#1')
+
+    @override_settings(RANKING_MAX_INCREMENTAL_USERS=0)
+    def test_incremental_update_disabled(self):
+        contest = Contest.objects.get()
+        ranking = Ranking.objects.create(contest=contest, key='admin#c')
+        self._recalculate_after_cooldown(ranking)
+
+        user = User.objects.get(username='test_user')
+        pi = ProblemInstance.objects.get(id=3)
+        Ranking.invalidate_user_result(user, pi)
+        recalc = self._recalculate_after_cooldown(ranking)
+        self.assertTrue(recalc.full_recalculation)
+        self.assertEqual(ranking.deltas.count(), 0)
+
+
+class TestRankingSerialization(TestCase):
+    fixtures = ['test_users', 'test_contest', 'test_full_package',
+            'test_problem_instance', 'test_submission', 'test_extra_rounds',
+            'test_ranking_data', 'test_permissions']
+
+    def test_columnar_format(self):
+        contest = Contest.objects.get()
+        controller = contest.controller.ranking_controller()
+        data = controller.serialize_ranking('admin#c')
+        self.assertGreater(len(data['rows']), 1)
+
+        blob, index = serialization.dumps(data)
+        self.assertIsNotNone(index)
+        self.assertLess(len(blob), len(pickle.dumps(data)) / 5)
+
+        loaded = serialization.loads(blob, contest.id)
+        self.assertEqual(loaded['participants_on_page'],
+                         data['participants_on_page'])
+        self.assertEqual(loaded['problem_instances'],
+                         data['problem_instances'])
+        self.assertEqual(len(loaded['rows']), len(data['rows']))
+        for row, loaded_row in zip(data['rows'], loaded['rows']):
+            self.assertEqual(row['user'], loaded_row['user'])
+            self.assertEqual(row['place'], loaded_row['place'])
+            self.assertEqual(row['sum'], loaded_row['sum'])
+            for result, loaded_result in zip(row['results'],
+                                             loaded_row['results']):
+                if result is None:
+                    self.assertIsNone(loaded_result)
+                    continue
+                self.assertEqual(result.score, loaded_result.score)
+                self.assertEqual(getattr(result, 'url', None),
+                                 getattr(loaded_result, 'url', None))
+        self.assertEqual([row['user'] for row in loaded['rows'][1:]],
+                         [row['user'] for row in data['rows'][1:]])
+
+        for i, row in enumerate(data['rows']):
+            self.assertEqual(
+                    serialization.find_in_user_index(index, row['user'].id),
+                    i)
+        admin = User.objects.get(username='test_admin')
+        self.assertIsNone(serialization.find_in_user_index(index, admin.id))
+
+        # Restored data can be stored again
+        blob, index = serialization.dumps(loaded)
+        reloaded = serialization.loads(blob, contest.id)
+        self.assertEqual([(row['user'], row['place'], row['sum'])
+                          for row in reloaded['rows']],
+                         [(row['user'], row['place'], row['sum'])
+                          for row in data['rows']])
+        self.assertEqual(serialization.find_in_user_index(index,
+                data['rows'][1]['user'].id), 1)
+
+    def test_other_formats(self):
+        blob, index = serialization.dumps('serialized')
+        self.assertIsNone(index)
+        self.assertEqual(serialization.loads(blob, 'c'), 'serialized')
+        # Data stored before the format was versioned
+        self.assertEqual(serialization.loads(pickle.dumps({'a': 1}), 'c'),
+                         {'a': 1})
+
+
+class PageContentRankingController(DefaultRankingController):
+    page_content = '<b>Some</b> <br/> <i>data</i>'
+
+    def _render_ranking_page(self, key, data, page):
+        return '%s %s' % (self.page_content, page)
+
+
+class PageContentRankingContestController(ProgrammingContestController):
+
+    def ranking_controller(self):
+        return PageContentRankingController(self.contest)
+
 
 class TestRankingsdFrontend(TestCase):
     fixtures = ['test_users', 'test_contest', 'test_full_package',
             'test_problem_instance', 'test_submission', 'test_extra_rounds',
             'test_ranking_data', 'test_permissions']
 
+    def setUp(self):
+        cache.clear()
+        contest = Contest.objects.get()
+        contest.controller_name = \
+            'oioioi.rankings.tests.PageContentRankingContestController'
+        contest.save()
+
     @override_settings(MOCK_RANKINGSD=False)
     def test_first_ranking_view(self):
         contest = Contest.objects.get()
@@ -319,6 +596,15 @@ class TestRankingsdFrontend(TestCase):
         self.assertContains(response,
                 "You have requested a non-existent ranking page")
 
+    def _set_ranking_pages(self, ranking, num_pages):
+        """Makes the ranking consist of ``num_pages`` pages."""
+        ranking.serialized_data = pickle.dumps({
+            'rows': [{}] * num_pages,
+            'participants_on_page': 1,
+        })
+        ranking.version += 1
+        ranking.save()
+
     @override_settings(MOCK_RANKINGSD=False)
     def test_display_ranking(self):
         contest = Contest.objects.get()
@@ -327,13 +613,11 @@ class TestRankingsdFrontend(TestCase):
         response = self.client.get(ranking_url)
 
         ranking = Ranking.objects.get(key='regular#1')
-        page_content = '<b>Some</b> <br/> <i>data</i>'
-        RankingPage(ranking=ranking, nr=1, data=page_content + " 1").save()
-        RankingPage(ranking=ranking, nr=2, data=page_content + " 2").save()
-        self.assertTrue(ranking.pages.count(), 2)
+        self._set_ranking_pages(ranking, 2)
 
         # Make sure the page includes our rendered data and that HTML
         # hasn't been escaped
+        page_content = PageContentRankingController.page_content
         response = self.client.get(ranking_url)
         self.assertContains(response, page_content + " 1")
         response = self.client.get(ranking_url + '?page=2')
@@ -343,6 +627,34 @@ class TestRankingsdFrontend(TestCase):
         response = self.client.get(ranking_url + '?page=3')
         self.assertContains(response,
                 "You have requested a non-existent ranking page")
+        response = self.client.get(ranking_url + '?page=foo')
+        self.assertContains(response,
+                "You have requested a non-existent ranking page")
+
+    @override_settings(MOCK_RANKINGSD=False)
+    def test_page_cache(self):
+        contest = Contest.objects.get()
+        ranking_url = reverse('ranking',
+            kwargs={'contest_id': contest.id, 'key': '1'})
+        self.client.get(ranking_url)
+        ranking = Ranking.objects.get(key='regular#1')
+        self._set_ranking_pages(ranking, 1)
+        page_content = PageContentRankingController.page_content
+
+        response = self.client.get(ranking_url)
+        self.assertContains(response, page_content + " 1")
+
+        # Rendered pages are cached for the same version of the ranking
+        PageContentRankingController.page_content = 'changed'
+        try:
+            response = self.client.get(ranking_url)
+            self.assertContains(response, page_content + " 1")
+
+            self._set_ranking_pages(ranking, 1)
+            response = self.client.get(ranking_url)
+            self.assertContains(response, "changed 1")
+        finally:
+            PageContentRankingController.page_content = page_content
 
     @override_settings(MOCK_RANKINGSD=False)
     def test_display_outdated(self):
@@ -354,10 +666,8 @@ class TestRankingsdFrontend(TestCase):
         # Add a page to the ranking
         ranking = Ranking.objects.get(key='regular#1')
         ranking.needs_recalculation = False
-        ranking.save()
-        page_content = '<b>Some</b> <br/> <i>data</i>'
-        RankingPage(ranking=ranking, nr=1, data=page_content).save()
-        self.assertTrue(ranking.pages.count(), 1)
+        self._set_ranking_pages(ranking, 1)
+        page_content = PageContentRankingController.page_content
 
         outdated_msg = "The data shown in here can be slightly outdated"
         # We shouldn't tell the ranking is outdated, when it isn't
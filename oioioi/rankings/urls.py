@@ -7,4 +7,6 @@ contest_patterns = patterns('oioioi.rankings.views',
     url(r'^ranking/(?P<key>[a-z0-9_-]+)/$', 'ranking_view', name='ranking'),
     url(r'^ranking/(?P<key>[a-z0-9_-]+)/csv/$', 'ranking_csv_view',
             name='ranking_csv'),
+    url(r'^ranking/(?P<key>[a-z0-9_-]+)/json/$', 'ranking_json_view',
+            name='ranking_json'),
 )
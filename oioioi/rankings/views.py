@@ -108,11 +108,21 @@ def ranking_view(request, key=None):
     return TemplateResponse(request, 'rankings/ranking_view.html', context)
 
 
-@enforce_condition(contest_exists & is_contest_admin)
-def ranking_csv_view(request, key):
+def _get_ranking_controller_for_export(request, key):
     rcontroller = request.contest.controller.ranking_controller()
     choices = rcontroller.available_rankings(request)
     if not choices or key not in zip(*choices)[0]:
         raise Http404
+    return rcontroller
 
+
+@enforce_condition(contest_exists & is_contest_admin)
+def ranking_csv_view(request, key):
+    rcontroller = _get_ranking_controller_for_export(request, key)
     return rcontroller.render_ranking_to_csv(request, key)
+
+
+@enforce_condition(contest_exists & is_contest_admin)
+def ranking_json_view(request, key):
+    rcontroller = _get_ranking_controller_for_export(request, key)
+    return rcontroller.render_ranking_to_json(request, key)
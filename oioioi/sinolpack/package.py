@@ -3,9 +3,11 @@ import logging
 import re
 import shutil
 import tempfile
+import time
 import os
 import zipfile
 import chardet
+from multiprocessing.pool import ThreadPool
 
 from django.conf import settings
 from django.core.exceptions import ValidationError
@@ -26,7 +28,7 @@ from oioioi.programs.models import Test, OutputChecker, ModelSolution, \
 from oioioi.sinolpack.models import ExtraConfig, ExtraFile, OriginalPackage
 from oioioi.sinolpack.utils import add_extra_files
 from oioioi.filetracker.utils import stream_file, django_to_filetracker_path, \
-    filetracker_to_django_file
+    filetracker_to_django_file, save_content_addressed
 from oioioi.filetracker.client import get_client
 from oioioi.sioworkers.jobs import run_sioworkers_job, run_sioworkers_jobs
 
@@ -114,6 +116,9 @@ class SinolPackage(object):
                 {'c': C_EXTRA_ARGS, 'cpp': C_EXTRA_ARGS, 'pas': PAS_EXTRA_ARGS}
         self.use_make = settings.USE_SINOLPACK_MAKEFILES
         self.use_sandboxes = not settings.USE_UNSAFE_EXEC
+        # Programs compiled by _compile_programs, by their suffixes
+        self.compiled_programs = {}
+        self.stage_times = []
 
     def identify(self):
         return self._find_main_folder() is not None
@@ -212,7 +217,7 @@ class SinolPackage(object):
                 not_found.append(filename)
             else:
                 instance = ExtraFile(problem=self.problem, name=filename)
-                instance.file.save(filename, File(open(fn, 'rb')))
+                self._save_file(instance.file, fn)
         return not_found
 
     def _process_extra_files(self):
@@ -224,13 +229,68 @@ class SinolPackage(object):
                     _("Expected extra files %r not found in prog/")
                     % (not_found))
 
+    def _save_file(self, field, path, name=None):
+        """Stores the local file in the file field and saves the model
+           instance.
+
+           Package files are stored content-addressed (see
+           :func:`~oioioi.filetracker.utils.save_content_addressed`), so that
+           files which didn't change since the previous upload of
+           the package are not uploaded again.
+        """
+        setattr(field.instance, field.field.name,
+                save_content_addressed(path, name, storage=field.storage))
+        field.instance.save()
+
     def _save_to_field(self, field, file):
         basename = os.path.basename(filetracker_to_django_file(file).name)
         filename = os.path.join(self.rootdir, basename)
         get_client().get_file(file, filename)
-        field.save(os.path.basename(filename), File(open(filename, 'rb')))
+        self._save_file(field, filename)
         get_client().delete_file(file)
 
+    def _upload_files(self, uploads):
+        """Stores files in file fields, without saving the model instances.
+
+           ``uploads`` is a list of tuples ``(field_file, path, ft_file)``.
+           The file is taken either from the local ``path`` or, if it is
+           ``None``, from the temporary Filetracker file ``ft_file``, which
+           is then deleted.
+
+           The files are stored content-addressed, like in
+           :meth:`_save_file`, by a pool of
+           ``settings.SINOLPACK_UPLOAD_CONCURRENCY`` threads.
+        """
+        client = get_client()
+        tasks = []
+        for field_file, path, ft_file in uploads:
+            if path is None:
+                path = os.path.join(self.rootdir, os.path.basename(
+                        filetracker_to_django_file(ft_file).name))
+            tasks.append((field_file, path, ft_file))
+
+        def upload(task):
+            field_file, path, ft_file = task
+            if ft_file is not None:
+                client.get_file(ft_file, path)
+            name = save_content_addressed(path, storage=field_file.storage)
+            if ft_file is not None:
+                client.delete_file(ft_file)
+            return name
+
+        concurrency = min(settings.SINOLPACK_UPLOAD_CONCURRENCY, len(tasks))
+        if concurrency > 1:
+            pool = ThreadPool(concurrency)
+            try:
+                names = pool.map(upload, tasks)
+            finally:
+                pool.terminate()
+        else:
+            names = map(upload, tasks)
+
+        for (field_file, _path, _ft_file), name in zip(tasks, names):
+            setattr(field_file.instance, field_file.field.name, name)
+
     def _extract_makefiles(self):
         sinol_makefiles_tgz = os.path.join(os.path.dirname(__file__),
                 'files', 'sinol-makefiles.tgz')
@@ -299,8 +359,8 @@ class SinolPackage(object):
                         new_archive.writestr('index.html', data)
 
             statement = ProblemStatement(problem=self.problem)
-            statement.content.save(self.short_name + '.html.zip',
-                    File(open(htmlzipfile, 'rb')))
+            self._save_file(statement.content, htmlzipfile,
+                    self.short_name + '.html.zip')
 
         pdffile = os.path.join(docdir, self.short_name + 'zad.pdf')
 
@@ -309,12 +369,12 @@ class SinolPackage(object):
 
         if os.path.isfile(pdffile):
             statement = ProblemStatement(problem=self.problem)
-            statement.content.save(self.short_name + '.pdf',
-                    File(open(pdffile, 'rb')))
+            self._save_file(statement.content, pdffile,
+                    self.short_name + '.pdf')
         else:
             logger.warning("%s: no problem statement", self.filename)
 
-    def _compile(self, filename, prog_name, ext, out_name=None):
+    def _make_compilation_job(self, filename, prog_name, ext, out_name=None):
         client = get_client()
         source_name = '%s.%s' % (prog_name, ext)
         ft_source_name = client.put_file(_make_filename(self.env, source_name),
@@ -339,8 +399,10 @@ class SinolPackage(object):
 
         add_extra_files(compilation_job, self.problem,
                 additional_args=self.extra_compilation_args)
-        new_env = run_sioworkers_job(compilation_job)
-        client.delete_file(ft_source_name)
+        return compilation_job
+
+    def _check_compilation_result(self, filename, ft_source_name, new_env):
+        get_client().delete_file(ft_source_name)
 
         compilation_message = new_env.get('compiler_output', '')
         compilation_result = new_env.get('result_code', 'CE')
@@ -358,12 +420,71 @@ class SinolPackage(object):
         new_env['compiled_file'] = new_env['out_file']
         return new_env
 
+    def _compile(self, filename, prog_name, ext, out_name=None):
+        compilation_job = self._make_compilation_job(filename, prog_name, ext,
+                out_name)
+        new_env = run_sioworkers_job(compilation_job)
+        return self._check_compilation_result(filename,
+                compilation_job['source_file'], new_env)
+
+    def _find_source(self, suffix):
+        """Returns a tuple ``(path, name, extension)`` describing the source
+           of the program with the given suffix in ``prog/``, or ``None``.
+        """
+        name = self.short_name + suffix
+        choices = (getattr(settings, 'SUBMITTABLE_EXTENSIONS', {})). \
+                values()
+        lang_exts = []
+        for ch in choices:
+            lang_exts.extend(ch)
+
+        for ext in lang_exts:
+            src = os.path.join(self.rootdir, 'prog', '%s.%s' % (name, ext))
+            if os.path.isfile(src):
+                return src, name, ext
+        return None
+
+    def _compile_programs(self):
+        """Compiles ingen, inwer, outgen and the checker at once, so that
+           the compilations may run in parallel.
+
+           The results are used by :meth:`_find_and_compile` later.
+        """
+        jobs = {}
+        sources = {}
+        for suffix in ('ingen', 'inwer', '', 'chk'):
+            found = self._find_source(suffix)
+            if found is None:
+                continue
+            source, name, extension = found
+            out_name = None
+            if suffix == 'chk':
+                out_name = _make_filename(self.env, '%s.e' % name)
+            jobs[suffix] = self._make_compilation_job(source, name, extension,
+                    out_name)
+            sources[suffix] = source
+
+        results = run_sioworkers_jobs(jobs) if jobs else {}
+        failed = None
+        for suffix, new_env in sorted(results.iteritems()):
+            try:
+                self.compiled_programs[suffix] = \
+                        self._check_compilation_result(sources[suffix],
+                                jobs[suffix]['source_file'], new_env)
+            except ProblemPackageError as e:
+                failed = failed or e
+        if failed:
+            raise failed
+
     def _find_and_compile(self, suffix, command=None, cwd=None,
             log_on_failure=True, out_name=None):
         renv = None
         if not command:
             command = suffix
-        if self.use_make:
+        if not self.use_make and suffix in self.compiled_programs:
+            renv = self.compiled_programs.pop(suffix)
+            logger.info("%s: %s", self.filename, command)
+        elif self.use_make:
             if glob.glob(os.path.join(self.rootdir, 'prog',
                     '%s%s.*' % (self.short_name, suffix))):
                 logger.info("%s: %s", self.filename, command)
@@ -373,22 +494,9 @@ class SinolPackage(object):
                 renv['stdout'] = execute('make %s' % (command), cwd=cwd)
                 logger.info(renv['stdout'])
         else:
-            name = self.short_name + suffix
-            choices = (getattr(settings, 'SUBMITTABLE_EXTENSIONS', {})). \
-                    values()
-            lang_exts = []
-            for ch in choices:
-                lang_exts.extend(ch)
-
-            source = None
-            for ext in lang_exts:
-                src = os.path.join(self.rootdir, 'prog', '%s.%s' % (name, ext))
-                if os.path.isfile(src):
-                    source = src
-                    extension = ext
-                    break
-
-            if source:
+            found = self._find_source(suffix)
+            if found:
+                source, name, extension = found
                 renv = self._compile(source, name, extension, out_name)
                 logger.info("%s: %s", self.filename, command)
 
@@ -470,7 +578,8 @@ class SinolPackage(object):
                     group=group).update(max_score=score)
 
     def _process_test(self, test, order, names_re, indir, outdir,
-            collected_ins, scored_groups, outs_to_make):
+            collected_ins, scored_groups, outs_to_make, existing_tests,
+            uploads):
         match = names_re.match(test)
         if not match:
             if test.endswith('.in'):
@@ -484,8 +593,11 @@ class SinolPackage(object):
         group = match.group(3)       # 0
         suffix = match.group(4)      # ocen
 
-        instance, created = Test.objects.get_or_create(
-                problem_instance=self.main_problem_instance, name=name)
+        instance = existing_tests.get(name)
+        created = instance is None
+        if created:
+            instance = Test(problem_instance=self.main_problem_instance,
+                    name=name)
 
         inname_base = basename + '.in'
         inname = os.path.join(indir, inname_base)
@@ -493,12 +605,12 @@ class SinolPackage(object):
         outname = os.path.join(outdir, outname_base)
 
         if test in collected_ins:
-            self._save_to_field(instance.input_file, collected_ins[test])
+            uploads.append((instance.input_file, None, collected_ins[test]))
         else:
-            instance.input_file.save(inname_base, File(open(inname, 'rb')))
+            uploads.append((instance.input_file, inname, None))
 
         if os.path.isfile(outname):
-            instance.output_file.save(outname_base, File(open(outname), 'rb'))
+            uploads.append((instance.output_file, outname, None))
         outs_to_make.append((_make_filename(self.env,
                 'out/%s' % (outname_base)), instance))
 
@@ -530,9 +642,26 @@ class SinolPackage(object):
             instance.memory_limit = DEFAULT_MEMORY_LIMIT
 
         instance.order = order
-        instance.save()
         return instance
 
+    def _save_tests(self, tests):
+        """Saves the processed tests, creating the new ones in bulk, and
+           deletes tests which are not in the package anymore.
+        """
+        new_tests = []
+        for test in tests:
+            if test.pk is None:
+                new_tests.append(test)
+            else:
+                test.save()
+        Test.objects.bulk_create(new_tests)
+
+        for test in Test.objects.filter(
+                problem_instance=self.main_problem_instance) \
+                .exclude(name__in=[test.name for test in tests]):
+            logger.info("%s: deleting test %s", self.filename, test.name)
+            test.delete()
+
     def _generate_tests(self, total_score=100):
 
         indir = os.path.join(self.rootdir, 'in')
@@ -550,6 +679,10 @@ class SinolPackage(object):
 
         outs_to_make = []
         created_tests = []
+        uploads = []
+        existing_tests = dict((test.name, test) for test in
+                Test.objects.filter(
+                    problem_instance=self.main_problem_instance))
         collected_ins = self._make_ins(re_string)
         all_items = list(set(os.listdir(indir)) | set(collected_ins.keys()))
         if self.use_make:
@@ -558,9 +691,11 @@ class SinolPackage(object):
         # Find tests and create objects
         for order, test in enumerate(sorted(all_items, key=naturalsort_key)):
             instance = self._process_test(test, order, names_re, indir, outdir,
-                    collected_ins, scored_groups, outs_to_make)
+                    collected_ins, scored_groups, outs_to_make, existing_tests,
+                    uploads)
             if instance:
                 created_tests.append(instance)
+        self._upload_files(uploads)
 
         time_limit_sum = 0
         for test in created_tests:
@@ -580,11 +715,10 @@ class SinolPackage(object):
         # Generate outputs (safe upload only)
         if not self.use_make:
             outs = self._make_outs(outs_to_make)
-            for instance in created_tests:
-                if instance.name in outs:
-                    generated_out = outs[instance.name]
-                    self._save_to_field(instance.output_file,
-                            generated_out['out_file'])
+            self._upload_files([(instance.output_file, None,
+                                 outs[instance.name]['out_file'])
+                                for instance in created_tests
+                                if instance.name in outs])
 
         # Validate tests
         for instance in created_tests:
@@ -592,16 +726,13 @@ class SinolPackage(object):
                 raise ProblemPackageError(_("Missing out file for test %s") %
                         instance.name)
             try:
-                instance.full_clean()
+                # Names of the tests are unique, as they come from names
+                # of the files.
+                instance.full_clean(validate_unique=False)
             except ValidationError as e:
                 raise ProblemPackageError(e.messages[0])
 
-        # Delete nonexistent tests
-        for test in Test.objects.filter(
-                problem_instance=self.main_problem_instance) \
-                .exclude(id__in=[instance.id for instance in created_tests]):
-            logger.info("%s: deleting test %s", self.filename, test.name)
-            test.delete()
+        self._save_tests(created_tests)
 
         # Assign scores
         if scored_groups:
@@ -646,9 +777,8 @@ class SinolPackage(object):
                 ]
             for exe in exe_candidates:
                 if os.path.isfile(exe):
-                    checker = File(open(exe, 'rb'))
-                    instance.exe_file = checker
-                    instance.save()
+                    checker = exe
+                    self._save_file(instance.exe_file, exe)
                     break
             if not checker:
                 instance.exe_file = None
@@ -688,7 +818,7 @@ class SinolPackage(object):
                                      order_key=order,
                                      kind=kinds[short_kind][1])
 
-            instance.source_file.save(name, File(open(path, 'rb')))
+            self._save_file(instance.source_file, path)
             logger.info('%s: model solution: %s', self.filename, name)
 
     def _process_attachments(self):
@@ -710,7 +840,7 @@ class SinolPackage(object):
             path = os.path.join(attachments_dir, attachment)
             instance = ProblemAttachment(problem=self.problem,
                     description=attachment)
-            instance.content.save(attachment, File(open(path, 'rb')))
+            self._save_file(instance.content, path)
             logger.info('%s: attachment: %s', path, attachment)
 
     def _save_original_package(self):
@@ -719,21 +849,34 @@ class SinolPackage(object):
         original_package.problem_package = self.package
         original_package.save()
 
+    def _run_stage(self, stage, fn):
+        start = time.time()
+        fn()
+        self.stage_times.append((stage, time.time() - start))
+
+    def _log_stage_times(self):
+        logger.info("%s: processing time: %s", self.filename, ', '.join(
+                '%s %.1fs' % (stage, seconds)
+                for stage, seconds in self.stage_times))
+
     def process_package(self):
-        self._process_config_yml()
-        self._detect_full_name()
-        self._detect_library()
-        self._process_extra_files()
+        self._run_stage('config', self._process_config_yml)
+        self._run_stage('name', self._detect_full_name)
+        self._run_stage('library', self._detect_library)
+        self._run_stage('extra files', self._process_extra_files)
         if self.use_make:
-            self._extract_makefiles()
+            self._run_stage('makefiles', self._extract_makefiles)
         else:
-            self._save_prog_dir()
-        self._process_statements()
-        self._generate_tests()
-        self._process_checkers()
-        self._process_model_solutions()
-        self._process_attachments()
-        self._save_original_package()
+            self._run_stage('prog', self._save_prog_dir)
+        self._run_stage('statements', self._process_statements)
+        if not self.use_make:
+            self._run_stage('compilation', self._compile_programs)
+        self._run_stage('tests', self._generate_tests)
+        self._run_stage('checker', self._process_checkers)
+        self._run_stage('model solutions', self._process_model_solutions)
+        self._run_stage('attachments', self._process_attachments)
+        self._run_stage('original package', self._save_original_package)
+        self._log_stage_times()
 
     def unpack(self, env, package):
         self.short_name = self._find_main_folder()
@@ -783,6 +926,9 @@ class SinolPackage(object):
             shutil.rmtree(tmpdir)
             if self.prog_archive:
                 get_client().delete_file(self.prog_archive)
+            # Programs left unused, e.g. when processing failed
+            for env in self.compiled_programs.itervalues():
+                get_client().delete_file(env['compiled_file'])
 
 
 class SinolPackageCreator(object):
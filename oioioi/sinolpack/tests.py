@@ -214,11 +214,21 @@ class TestSinolPackage(TestCase):
         call_command('addproblem', filename)
         problem = Problem.objects.get()
         self._check_no_ingen_package(problem)
+        package = ProblemPackage.objects.get()
+        self.assertEqual(package.status, 'OK')
+        test_files = sorted((t.input_file.name.versioned_name,
+                             t.output_file.name.versioned_name)
+                            for t in Test.objects.all())
 
         # Rudimentary test of package updating
         call_command('updateproblem', str(problem.id), filename)
         problem = Problem.objects.get()
         self._check_no_ingen_package(problem)
+        # Unchanged test files are shared, not uploaded again
+        self.assertEqual(test_files,
+                         sorted((t.input_file.name.versioned_name,
+                                 t.output_file.name.versioned_name)
+                                for t in Test.objects.all()))
 
     def _check_full_package(self, problem, doc=True):
         self.assertEqual(problem.short_name, 'sum')
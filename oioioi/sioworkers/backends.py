@@ -1,7 +1,14 @@
 import json
+import multiprocessing
+import os
+import shutil
+import tempfile
 import sio.workers.runner
 import sio.celery.job
 import oioioi
+from celery import chord
+from celery.result import AsyncResult
+from celery.task import task
 from django.conf import settings
 from xmlrpclib import Server
 
@@ -10,15 +17,47 @@ from xmlrpclib import Server
 # do not rely on particular directory being the current directory. Without
 # this assumption, even a single call to LocalClient.build would break that
 # code.
+#
+# The lock is needed only for jobs run in the calling process. Jobs run in
+# the pool (see LocalBackend) have a separate current directory each.
 from threading import Lock
 _local_backend_lock = Lock()
 
+_local_pool = None
+_local_pool_lock = Lock()
+
+
+def _get_local_pool():
+    # pylint: disable=global-statement
+    global _local_pool
+    with _local_pool_lock:
+        if _local_pool is None:
+            _local_pool = multiprocessing.Pool(
+                    settings.SIOWORKERS_LOCAL_CONCURRENCY)
+        return _local_pool
+
+
+def _run_job_in_pool(job):
+    """Runs a job in a pool process, in a fresh working directory."""
+    workdir = tempfile.mkdtemp(prefix='oioioi-sioworkers-')
+    old_cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        return sio.workers.runner.run(job)
+    finally:
+        os.chdir(old_cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
 
 class LocalBackend(object):
     """A simple sioworkers backend which executes the work in the calling
        process.
 
        Perfect for tests or a single-machine OIOIOI setup.
+
+       If ``settings.SIOWORKERS_LOCAL_CONCURRENCY`` is greater than 1,
+       independent jobs passed to :meth:`run_jobs` are executed in parallel
+       in a pool of that many processes.
     """
 
     def run_job(self, job, **kwargs):
@@ -26,6 +65,12 @@ class LocalBackend(object):
             return sio.workers.runner.run(job)
 
     def run_jobs(self, dict_of_jobs, **kwargs):
+        if settings.SIOWORKERS_LOCAL_CONCURRENCY > 1 \
+                and len(dict_of_jobs) > 1:
+            keys = list(dict_of_jobs.iterkeys())
+            jobs = [dict_of_jobs[key] for key in keys]
+            return dict(zip(keys,
+                            _get_local_pool().map(_run_job_in_pool, jobs)))
         results = {}
         for key, value in dict_of_jobs.iteritems():
             results[key] = self.run_job(value, **kwargs)
@@ -41,6 +86,36 @@ class LocalBackend(object):
         oioioi.evalmgr.evalmgr_job.delay(env)
 
 
+@task
+def celery_jobs_finished(results, env, keys):
+    """Called by Celery when all jobs sent by
+       :meth:`CeleryBackend.send_async_jobs` have finished. Resumes the
+       evaluation of the environment.
+    """
+    env['workers_jobs.results'] = dict(zip(keys, results))
+    oioioi.evalmgr.evalmgr_job.delay(env)
+
+
+@task
+def celery_jobs_failed(task_id, env, job_ids):
+    """Called by Celery when any of the jobs sent by
+       :meth:`CeleryBackend.send_async_jobs` (with ids ``job_ids``)
+       or :func:`celery_jobs_finished` has failed. The error is passed
+       to the evaluation, as it's done for errors reported by sioworkersd.
+    """
+    # The failure of the chord callback (with id task_id) is not stored yet
+    # when the errback is called, so the error of the failed job is used.
+    for job_id in job_ids:
+        result = AsyncResult(job_id)
+        if result.failed():
+            break
+    else:
+        result = AsyncResult(task_id)
+    env['error'] = {'message': repr(result.result),
+                    'traceback': result.traceback}
+    oioioi.evalmgr.evalmgr_job.delay(env)
+
+
 class CeleryBackend(object):
     """A backend which uses Celery for sioworkers jobs."""
 
@@ -61,13 +136,22 @@ class CeleryBackend(object):
         return results
 
     def send_async_jobs(self, env, **kwargs):
-        res = self.run_jobs(env['workers_jobs'],
-            **(env.get('workers_jobs.extra_args', dict())))
-        env['workers_jobs.results'] = res
-        del env["workers_jobs"]
-        if 'workers_jobs.extra_args' in env:
-            del env['workers_jobs.extra_args']
-        oioioi.evalmgr.evalmgr_job.delay(env)
+        """Sends the jobs as a chord, without waiting for them.
+
+           The evaluation is resumed by :func:`celery_jobs_finished` once
+           all the jobs are done, so that the calling worker is free to
+           evaluate other submissions in the meantime.
+        """
+        jobs = env.pop('workers_jobs')
+        extra_args = env.pop('workers_jobs.extra_args', dict())
+        keys = list(jobs.iterkeys())
+        header = [sio.celery.job.sioworkers_job.subtask(args=[jobs[key]],
+                                                        options=extra_args)
+                  for key in keys]
+        job_ids = [job.freeze().id for job in header]
+        callback = celery_jobs_finished.subtask(args=[env, keys])
+        callback.link_error(celery_jobs_failed.subtask(args=[env, job_ids]))
+        chord(header)(callback)
 
 
 class SioworkersdBackend(object):
@@ -0,0 +1,20 @@
+from oioioi.sioworkers.backends import celery_jobs_finished
+
+
+class ChordUnlockRouter(object):
+    """Celery router sending ``celery.chord_unlock`` of the chords sent by
+       :meth:`~oioioi.sioworkers.backends.CeleryBackend.send_async_jobs`
+       to the ``evalmgr`` queue, as their callbacks need the OIOIOI code.
+
+       Celery 3.1 doesn't pass the options of a chord to its
+       ``celery.chord_unlock`` task, so it can't be routed otherwise without
+       affecting all chords.
+    """
+
+    def route_for_task(self, task, args=None, kwargs=None):
+        if task != 'celery.chord_unlock' or not args or len(args) < 2:
+            return None
+        callback = args[1]
+        if callback.get('task') == celery_jobs_finished.name:
+            return {'queue': 'evalmgr'}
+        return None
@@ -1,5 +1,10 @@
+from django.test.utils import override_settings
 from django.utils import unittest
 
+from oioioi.sioworkers.backends import LocalBackend, CeleryBackend, \
+        celery_jobs_finished
+from oioioi.sioworkers.routers import ChordUnlockRouter
+
 from oioioi.sioworkers.jobs import run_sioworkers_job, run_sioworkers_jobs
 
 
@@ -13,3 +18,51 @@ class TestSioworkersBindings(unittest.TestCase):
         self.assertEqual(envs['key1'].get('pong'), 'e1')
         self.assertEqual(envs['key2'].get('pong'), 'e2')
         self.assertEqual(len(envs), 2)
+
+
+class TestLocalBackend(unittest.TestCase):
+    @override_settings(SIOWORKERS_LOCAL_CONCURRENCY=2)
+    def test_parallel_jobs(self):
+        jobs = dict(('key%d' % i, dict(job_type='ping', ping='e%d' % i))
+                    for i in xrange(5))
+        results = LocalBackend().run_jobs(jobs)
+        self.assertEqual(len(results), 5)
+        for i in xrange(5):
+            self.assertEqual(results['key%d' % i].get('pong'), 'e%d' % i)
+
+
+_collected_results = []
+
+
+def collect_results(env, **kwargs):
+    _collected_results.append(env['workers_jobs.results'])
+    return env
+
+
+class TestCeleryBackend(unittest.TestCase):
+    def test_send_async_jobs(self):
+        env = {
+            'recipe': [('collect',
+                        'oioioi.sioworkers.tests.collect_results')],
+            'workers_jobs': dict(key1=dict(job_type='ping', ping='e1'),
+                                 key2=dict(job_type='ping', ping='e2')),
+        }
+        del _collected_results[:]
+        CeleryBackend().send_async_jobs(env)
+        self.assertEqual(len(_collected_results), 1)
+        results = _collected_results[0]
+        self.assertEqual(results['key1'].get('pong'), 'e1')
+        self.assertEqual(results['key2'].get('pong'), 'e2')
+
+    def test_chord_unlock_router(self):
+        router = ChordUnlockRouter()
+        callback = celery_jobs_finished.subtask(args=[{}, []])
+        self.assertEqual(router.route_for_task('celery.chord_unlock',
+                                               ('group', callback)),
+                         {'queue': 'evalmgr'})
+        other_callback = celery_jobs_finished.subtask()
+        other_callback['task'] = 'other.task'
+        self.assertIsNone(router.route_for_task('celery.chord_unlock',
+                                                ('group', other_callback)))
+        self.assertIsNone(router.route_for_task('other.task',
+                                                ('group', callback)))
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.translation import ugettext as _
+
+from oioioi.contests.models import Contest
+from oioioi.statistics.models import recalculate_aggregates
+
+
+class Command(BaseCommand):
+    args = _("[contest_id ...]")
+    help = _("Recalculates the aggregates used by the statistics plots of "
+             "the given contests (all contests by default). Until this is "
+             "done, statistics of contests created before the aggregates "
+             "were introduced are computed from the submissions on each "
+             "request.")
+
+    def handle(self, *args, **options):
+        if args:
+            contests = list(Contest.objects.filter(id__in=args))
+            missing = set(args) - set(contest.id for contest in contests)
+            if missing:
+                raise CommandError(_("Contests not found: %s")
+                                   % ', '.join(sorted(missing)))
+        else:
+            contests = Contest.objects.order_by('id')
+
+        verbosity = int(options['verbosity'])
+        for contest in contests:
+            recalculate_aggregates(contest)
+            if verbosity > 0:
+                print _("Recalculated statistics of %s") % contest.id
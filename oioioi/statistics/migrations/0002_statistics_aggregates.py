@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contests', '0007_auto_20161214_1411'),
+        ('programs', '0004_auto_20161214_1411'),
+        ('statistics', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ContestScoreCount',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('score', models.IntegerField()),
+                ('count', models.IntegerField(default=0)),
+                ('contest', models.ForeignKey(to='contests.Contest')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ProblemScoreCount',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('score', models.IntegerField()),
+                ('count', models.IntegerField(default=0)),
+                ('problem_instance', models.ForeignKey(to='contests.ProblemInstance')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='StatisticsAggregatesState',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('is_ready', models.BooleanField(default=False)),
+                ('contest', models.OneToOneField(related_name='statistics_aggregates_state', to='contests.Contest')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='SubmissionStatusCount',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('status', models.CharField(max_length=64)),
+                ('count', models.IntegerField(default=0)),
+                ('problem_instance', models.ForeignKey(to='contests.ProblemInstance')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='TestStatusCount',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('test_name', models.CharField(max_length=30)),
+                ('status', models.CharField(max_length=64)),
+                ('count', models.IntegerField(default=0)),
+                ('problem_instance', models.ForeignKey(to='contests.ProblemInstance')),
+                ('test', models.ForeignKey(on_delete=django.db.models.deletion.SET_NULL, to='programs.Test', null=True)),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='contestscorecount',
+            unique_together=set([('contest', 'score')]),
+        ),
+        migrations.AlterUniqueTogether(
+            name='problemscorecount',
+            unique_together=set([('problem_instance', 'score')]),
+        ),
+        migrations.AlterUniqueTogether(
+            name='submissionstatuscount',
+            unique_together=set([('problem_instance', 'status')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='teststatuscount',
+            index_together=set([('problem_instance', 'test_name', 'status')]),
+        ),
+    ]
@@ -1,6 +1,15 @@
-from django.db import models
+from collections import Counter, defaultdict
+
+from django.db import models, transaction, IntegrityError
+from django.db.models import Count, F
+from django.db.models.signals import pre_save, post_save, pre_delete, \
+        post_delete, class_prepared
+from django.dispatch import receiver
 from django.utils.translation import ugettext_lazy as _
-from oioioi.contests.models import Contest
+from oioioi.contests.models import Contest, ProblemInstance, Submission, \
+        UserResultForContest, UserResultForProblem, pre_bulk_save, \
+        bulk_saved, pre_queryset_update
+from oioioi.programs.models import Test, TestReport
 from oioioi.contests.date_registration import date_registry
 
 
@@ -16,3 +25,345 @@ class StatisticsConfig(models.Model):
     class Meta(object):
         verbose_name = _("statistics configuration")
         verbose_name_plural = _("statistics configurations")
+
+
+# Aggregates of the data shown on the plots. They are updated as results and
+# submissions are saved, so that the plots don't have to scan whole tables.
+# The aggregates of a contest are used only if they are complete, i.e. they
+# have been collected since the contest was created or recalculated with
+# the ``backfill_statistics`` command (see StatisticsAggregatesState).
+
+class StatisticsAggregatesState(models.Model):
+    contest = models.OneToOneField(Contest,
+            related_name='statistics_aggregates_state')
+    is_ready = models.BooleanField(default=False)
+
+
+class ContestScoreCount(models.Model):
+    """The number of users with the given result of the contest."""
+    contest = models.ForeignKey(Contest)
+    score = models.IntegerField()
+    count = models.IntegerField(default=0)
+
+    class Meta(object):
+        unique_together = ('contest', 'score')
+
+
+class ProblemScoreCount(models.Model):
+    """The number of users with the given result of the problem."""
+    problem_instance = models.ForeignKey(ProblemInstance)
+    score = models.IntegerField()
+    count = models.IntegerField(default=0)
+
+    class Meta(object):
+        unique_together = ('problem_instance', 'score')
+
+
+class SubmissionStatusCount(models.Model):
+    """The number of normal submissions to the problem with the given
+       status.
+    """
+    problem_instance = models.ForeignKey(ProblemInstance)
+    status = models.CharField(max_length=64)
+    count = models.IntegerField(default=0)
+
+    class Meta(object):
+        unique_together = ('problem_instance', 'status')
+
+
+class TestStatusCount(models.Model):
+    """The number of users' results of the problem with the given status of
+       the test.
+    """
+    problem_instance = models.ForeignKey(ProblemInstance)
+    test = models.ForeignKey(Test, null=True, on_delete=models.SET_NULL)
+    test_name = models.CharField(max_length=30)
+    status = models.CharField(max_length=64)
+    count = models.IntegerField(default=0)
+
+    class Meta(object):
+        index_together = [('problem_instance', 'test_name', 'status')]
+
+
+def int_score(score, default=0):
+    return score.to_int() if callable(getattr(score, 'to_int', None)) \
+            else default
+
+
+def add_to_count(model, delta, **key):
+    """Adds ``delta`` to the ``count`` of the aggregate identified by
+       ``key``, creating it if needed.
+    """
+    if not delta:
+        return
+    if model.objects.filter(**key).update(count=F('count') + delta):
+        return
+    try:
+        with transaction.atomic():
+            model.objects.create(count=delta, **key)
+    except IntegrityError:
+        # Created concurrently
+        model.objects.filter(**key).update(count=F('count') + delta)
+
+
+def record_bulk_status_change(queryset, status):
+    """Updates the aggregates before ``queryset.update(status=status)``
+       is run on submissions, as it doesn't send any signals.
+    """
+    for row in queryset.filter(kind='NORMAL') \
+            .values('problem_instance', 'status') \
+            .annotate(count=Count('id')).order_by():
+        if row['status'] == status:
+            continue
+        add_to_count(SubmissionStatusCount, -row['count'],
+                     problem_instance_id=row['problem_instance'],
+                     status=row['status'])
+        add_to_count(SubmissionStatusCount, row['count'],
+                     problem_instance_id=row['problem_instance'],
+                     status=status)
+
+
+@receiver(pre_queryset_update, sender=Submission)
+def _update_statistics_on_queryset_update(sender, queryset, values,
+                                          **kwargs):
+    if 'status' in values:
+        record_bulk_status_change(queryset, values['status'])
+
+
+_STATE_FIELDS = (
+    (UserResultForContest, ('contest_id', 'score')),
+    (UserResultForProblem, ('problem_instance_id', 'score',
+                            'submission_report_id')),
+    (Submission, ('problem_instance_id', 'kind', 'status')),
+)
+
+
+def _state_fields(instance):
+    for model, fields in _STATE_FIELDS:
+        if isinstance(instance, model):
+            return fields
+    return None
+
+
+def _state_value(field, value):
+    # Scores are compared as integers, as this is how they are aggregated
+    # and not all score types can be compared with None.
+    return int_score(value) if field == 'score' else value
+
+
+def _state_changes(instance, old_state, new_state):
+    """Yields triples ``(model, key, delta)`` describing changes of
+       the aggregates, or ``(TestReport, (problem_instance_id,
+       submission_report_id), delta)`` for changes of test status counts.
+    """
+    if old_state == new_state:
+        return
+    for state, delta in ((old_state, -1), (new_state, 1)):
+        if state is None:
+            continue
+        if isinstance(instance, UserResultForContest):
+            contest_id, score = state
+            yield ContestScoreCount, (('contest_id', contest_id),
+                                      ('score', score)), delta
+        elif isinstance(instance, UserResultForProblem):
+            pi_id, score, report_id = state
+            yield ProblemScoreCount, (('problem_instance_id', pi_id),
+                                      ('score', score)), delta
+            if report_id is not None:
+                yield TestReport, (pi_id, report_id), delta
+        elif isinstance(instance, Submission):
+            pi_id, kind, status = state
+            if kind == 'NORMAL':
+                yield SubmissionStatusCount, (('problem_instance_id', pi_id),
+                                              ('status', status)), delta
+
+
+def _update_aggregates(changes):
+    """Applies the changes yielded by :func:`_state_changes`, summing up
+       deltas of the same aggregates first.
+    """
+    deltas = Counter()
+    report_deltas = defaultdict(Counter)
+    for model, key, delta in changes:
+        if model is TestReport:
+            pi_id, report_id = key
+            report_deltas[report_id][pi_id] += delta
+        else:
+            deltas[model, key] += delta
+    if report_deltas:
+        for report_id, test_id, test_name, status in TestReport.objects \
+                .filter(submission_report_id__in=list(report_deltas)) \
+                .values_list('submission_report', 'test', 'test_name',
+                             'status'):
+            for pi_id, delta in report_deltas[report_id].iteritems():
+                key = (('problem_instance_id', pi_id), ('test_id', test_id),
+                       ('test_name', test_name), ('status', status))
+                deltas[TestStatusCount, key] += delta
+    for (model, key), delta in deltas.iteritems():
+        add_to_count(model, delta, **dict(key))
+
+
+def _fetch_states(model, instances, fields):
+    """Sets ``_statistics_state`` of the instances to their state saved in
+       the database, using one query.
+    """
+    instances = [instance for instance in instances if instance.pk is not None]
+    if not instances:
+        return
+    names = [field[:-3] if field.endswith('_id') else field
+             for field in fields]
+    states = dict((row[0], row[1:]) for row in model._base_manager
+                  .filter(pk__in=[instance.pk for instance in instances])
+                  .values_list('pk', *names))
+    for instance in instances:
+        state = states.get(instance.pk)
+        if state is not None:
+            instance._statistics_state = tuple(_state_value(name,
+                    instance._meta.get_field(name).to_python(value))
+                    for name, value in zip(names, state))
+
+
+def _fetch_statistics_state(sender, instance, raw=False, **kwargs):
+    fields = _state_fields(instance)
+    if fields is None or raw:
+        return
+    _fetch_states(type(instance), [instance], fields)
+
+
+def _pop_state_changes(instance, fields, deleted=False):
+    old_state = instance.__dict__.pop('_statistics_state', None)
+    new_state = None
+    if not deleted:
+        new_state = tuple(_state_value(field, getattr(instance, field))
+                          for field in fields)
+    return _state_changes(instance, old_state, new_state)
+
+
+def _update_statistics_on_save(sender, instance, raw, **kwargs):
+    fields = _state_fields(instance)
+    if fields is None or raw:
+        return
+    _update_aggregates(_pop_state_changes(instance, fields))
+
+
+def _update_statistics_on_delete(sender, instance, **kwargs):
+    fields = _state_fields(instance)
+    if fields is None:
+        return
+    _update_aggregates(_pop_state_changes(instance, fields, deleted=True))
+
+
+_STATISTICS_MODELS = (UserResultForContest, UserResultForProblem, Submission)
+
+
+def _connect_statistics_receivers(model):
+    # Connecting the receivers to all senders would disable fast deletes
+    # of every model
+    pre_save.connect(_fetch_statistics_state, sender=model)
+    pre_delete.connect(_fetch_statistics_state, sender=model)
+    post_save.connect(_update_statistics_on_save, sender=model)
+    post_delete.connect(_update_statistics_on_delete, sender=model)
+
+
+def _all_subclasses(cls):
+    yield cls
+    for subclass in cls.__subclasses__():
+        for model in _all_subclasses(subclass):
+            yield model
+
+
+# Submissions are saved as instances of their subclasses, so the receivers
+# are connected to the subclasses defined so far and to those prepared
+# later.
+for _model in _STATISTICS_MODELS:
+    for _subclass in _all_subclasses(_model):
+        _connect_statistics_receivers(_subclass)
+
+
+@receiver(class_prepared)
+def _connect_statistics_receivers_on_prepare(sender, **kwargs):
+    if issubclass(sender, _STATISTICS_MODELS):
+        _connect_statistics_receivers(sender)
+
+
+@receiver(pre_bulk_save)
+def _fetch_statistics_state_on_bulk_save(sender, instances, **kwargs):
+    fields = _state_fields(instances[0]) if instances else None
+    if fields is not None:
+        _fetch_states(sender, instances, fields)
+
+
+@receiver(bulk_saved)
+def _update_statistics_on_bulk_save(sender, instances, **kwargs):
+    changes = []
+    for instance in instances:
+        fields = _state_fields(instance)
+        if fields is not None:
+            changes.extend(_pop_state_changes(instance, fields))
+    _update_aggregates(changes)
+
+
+@receiver(post_save, sender=Contest)
+def _init_statistics_aggregates(sender, instance, created, raw, **kwargs):
+    # A new contest has no results, so its aggregates are complete
+    if created and not raw:
+        StatisticsAggregatesState.objects.create(contest=instance,
+                                                 is_ready=True)
+
+
+def recalculate_aggregates(contest):
+    """Computes the aggregates of the contest from scratch and marks them
+       as ready to use.
+    """
+    with transaction.atomic():
+        state, _created = StatisticsAggregatesState.objects \
+                .select_for_update().get_or_create(contest=contest)
+
+        ContestScoreCount.objects.filter(contest=contest).delete()
+        ProblemScoreCount.objects \
+                .filter(problem_instance__contest=contest).delete()
+        SubmissionStatusCount.objects \
+                .filter(problem_instance__contest=contest).delete()
+        TestStatusCount.objects \
+                .filter(problem_instance__contest=contest).delete()
+
+        contest_scores = Counter(int_score(result.score) for result in
+                UserResultForContest.objects.filter(contest=contest)
+                .only('score').iterator())
+        ContestScoreCount.objects.bulk_create(
+                ContestScoreCount(contest=contest, score=score, count=count)
+                for score, count in contest_scores.iteritems())
+
+        problem_scores = Counter((result.problem_instance_id,
+                                  int_score(result.score)) for result in
+                UserResultForProblem.objects
+                .filter(problem_instance__contest=contest)
+                .only('problem_instance', 'score').iterator())
+        ProblemScoreCount.objects.bulk_create(
+                ProblemScoreCount(problem_instance_id=pi_id, score=score,
+                                  count=count)
+                for (pi_id, score), count in problem_scores.iteritems())
+
+        SubmissionStatusCount.objects.bulk_create(
+                SubmissionStatusCount(problem_instance_id=
+                                      row['problem_instance'],
+                                      status=row['status'],
+                                      count=row['count'])
+                for row in Submission.objects
+                .filter(problem_instance__contest=contest, kind='NORMAL')
+                .values('problem_instance', 'status')
+                .annotate(count=Count('id')).order_by())
+
+        pi_key = 'submission_report__userresultforproblem__problem_instance'
+        TestStatusCount.objects.bulk_create(
+                TestStatusCount(problem_instance_id=row[pi_key],
+                                test_id=row['test'],
+                                test_name=row['test_name'],
+                                status=row['status'], count=row['count'])
+                for row in TestReport.objects
+                .filter(**{pi_key + '__contest': contest})
+                .values(pi_key, 'test', 'test_name', 'status')
+                .annotate(count=Count('id')).order_by())
+
+        state.is_ready = True
+        state.save()
@@ -1,22 +1,19 @@
 # -*- coding: utf-8 -*-
-from itertools import groupby
 from operator import itemgetter
 from collections import defaultdict
 
 from nose.tools import nottest
 from django.utils.translation import ugettext as _
-from django.db.models import Count
+from django.db.models import Count, Sum
 from django.core.urlresolvers import reverse
 
 from oioioi.contests.utils import is_contest_admin, is_contest_observer
 from oioioi.contests.models import Submission, \
         UserResultForProblem, UserResultForContest, ScoreReport
 from oioioi.programs.models import ProgramSubmission, TestReport
-
-
-def int_score(score, default=0):
-    return score.to_int() if callable(getattr(score, 'to_int', None)) \
-            else default
+from oioioi.statistics.models import int_score, StatisticsAggregatesState, \
+        ContestScoreCount, ProblemScoreCount, SubmissionStatusCount, \
+        TestStatusCount
 
 
 def histogram(values, num_buckets=10, max_result=None):
@@ -29,10 +26,18 @@ def histogram(values, num_buckets=10, max_result=None):
            lower bounds of bucket limits; counts contain the numbers of
            elements going in particular buckets.
     """
+    return histogram_from_counts([(value, 1) for value in values],
+                                 num_buckets, max_result)
+
+
+def histogram_from_counts(value_counts, num_buckets=10, max_result=None):
+    """Like :func:`histogram`, but takes a list of pairs ``(value, count)``
+       instead of the values.
+    """
     assert num_buckets > 0, "Non positive number of buckets for histogram"
 
-    if max_result is None and values:
-        max_result = max(values)
+    if max_result is None and value_counts:
+        max_result = max(value for value, _count in value_counts)
 
     if max_result:
         if max_result < num_buckets:
@@ -47,18 +52,31 @@ def histogram(values, num_buckets=10, max_result=None):
         bucket = 1
         counts = [0]
 
-    for key, group in groupby(values, key=(lambda x: x / bucket)):
-        counts[key] += len(list(group))
+    for value, count in value_counts:
+        counts[value / bucket] += count
 
     return [list(tup) for tup in
             zip(*[[i*bucket, value] for i, value in enumerate(counts)])]
 
 
+def aggregates_ready(contest):
+    """Checks if the aggregates kept in :mod:`oioioi.statistics.models`
+       are complete for the contest, so that they may be used instead of
+       computing the statistics from scratch.
+    """
+    return StatisticsAggregatesState.objects \
+            .filter(contest=contest, is_ready=True).exists()
+
+
 def results_histogram_for_queryset(request, qs, max_score=None):
-    scores = [int_score(r.score) for r in qs]
+    scores = [(int_score(r.score), 1) for r in qs]
+    return results_histogram(request, scores, max_score)
 
+
+def results_histogram(request, score_counts, max_score=None):
     max_score = int_score(max_score, None)
-    keys_left, data = histogram(scores, max_result=max_score)
+    keys_left, data = histogram_from_counts(score_counts,
+                                            max_result=max_score)
 
     keys = ['[%d;%d)' % p for p in zip(keys_left[:-1], keys_left[1:])]
     keys.append('[%d;∞)' % keys_left[-1])
@@ -74,6 +92,12 @@ def results_histogram_for_queryset(request, qs, max_score=None):
 
 
 def points_histogram_contest(request, contest):
+    if aggregates_ready(contest):
+        counts = ContestScoreCount.objects \
+                .filter(contest=contest, count__gt=0) \
+                .values_list('score', 'count')
+        return results_histogram(request, list(counts))
+
     results = UserResultForContest.objects.filter(contest=contest)
     return results_histogram_for_queryset(request, results)
 
@@ -82,12 +106,19 @@ def points_histogram_problem(request, problem):
     results = UserResultForProblem.objects.filter(problem_instance=problem)
 
     # Check if user has any submissions for the specified problem
-    if results and results[0].submission_report is not None:
-        max_score = results[0].submission_report \
+    first_results = list(results.select_related('submission_report')[:1])
+    if first_results and first_results[0].submission_report is not None:
+        max_score = first_results[0].submission_report \
                 .score_report.max_score
     else:
         max_score = None
 
+    if aggregates_ready(problem.contest):
+        counts = ProblemScoreCount.objects \
+                .filter(problem_instance=problem, count__gt=0) \
+                .values_list('score', 'count')
+        return results_histogram(request, list(counts), max_score=max_score)
+
     return results_histogram_for_queryset(request, results,
             max_score=max_score)
 
@@ -95,6 +126,13 @@ def points_histogram_problem(request, problem):
 def submissions_by_problem_histogram_for_queryset(request, qs):
     agg = qs.values('problem_instance', 'problem_instance__short_name',
                     'status').annotate(count=Count('problem_instance'))
+    return submissions_by_problem_histogram(request, agg)
+
+
+def submissions_by_problem_histogram(request, agg):
+    """:param agg: An iterable of dicts with keys ``problem_instance``,
+           ``problem_instance__short_name``, ``status`` and ``count``.
+    """
     agg = sorted(agg, key=itemgetter('status'))
     statuses = list(set(a['status'] for a in agg))
     pis = list(set((a['problem_instance'], a['problem_instance__short_name'])
@@ -115,6 +153,13 @@ def submissions_by_problem_histogram_for_queryset(request, qs):
 
 
 def submissions_histogram_contest(request, contest):
+    if aggregates_ready(contest):
+        agg = SubmissionStatusCount.objects \
+                .filter(problem_instance__contest=contest, count__gt=0) \
+                .values('problem_instance', 'problem_instance__short_name',
+                        'status', 'count')
+        return submissions_by_problem_histogram(request, agg)
+
     subs = Submission.objects.filter(kind='NORMAL') \
             .filter(problem_instance__contest=contest) \
             .prefetch_related('problem_instance')
@@ -184,10 +229,16 @@ def test_scores(request, problem):
     # Why .order_by()? Just in case. More in the following link:
     # https://docs.djangoproject.com/en/dev/topics/db/
     #       aggregation/#interaction-with-default-ordering-or-order-by
-    agg = TestReport.objects.filter(
-        submission_report__userresultforproblem__problem_instance=problem) \
-        .values('test', 'test__order', 'test_name', 'status') \
-        .annotate(status_count=Count('status')).order_by()
+    if aggregates_ready(problem.contest):
+        agg = TestStatusCount.objects \
+            .filter(problem_instance=problem, count__gt=0) \
+            .values('test', 'test__order', 'test_name', 'status') \
+            .annotate(status_count=Sum('count')).order_by()
+    else:
+        agg = TestReport.objects.filter(
+            submission_report__userresultforproblem__problem_instance=problem) \
+            .values('test', 'test__order', 'test_name', 'status') \
+            .annotate(status_count=Count('status')).order_by()
 
     statuses = sorted(set(a['status'] for a in agg))
     tests = set((a['test'], a['test_name'], a['test__order']) for a in agg)
@@ -1,19 +1,27 @@
 # -*- coding: utf-8 -*-
 from datetime import datetime
 
+from django.core.management import call_command
+from django.db.models.signals import post_init, pre_delete, post_delete
 from django.test import RequestFactory
 from django.contrib.auth.models import User
 from django.core.urlresolvers import reverse
 from django.utils.timezone import utc
 
 from oioioi.base.tests import TestCase, fake_time
-from oioioi.contests.models import Contest
+from oioioi.contests.models import Contest, Submission, \
+        UserResultForContest, UserResultForProblem, pre_queryset_update
+from oioioi.contests.scores import IntegerScore
 from oioioi.statistics.plotfunctions import histogram, \
-                points_to_source_length_problem, test_scores
+                points_to_source_length_problem, test_scores, \
+                aggregates_ready, points_histogram_contest, \
+                points_histogram_problem, submissions_histogram_contest
 from oioioi.contests.models import ProblemInstance
+from oioioi.programs.models import ProgramSubmission, TestReport
 from oioioi.statistics.controllers import statistics_categories, \
                                           statistics_plot_kinds
-from oioioi.statistics.models import StatisticsConfig
+from oioioi.statistics.models import StatisticsConfig, \
+        StatisticsAggregatesState
 
 
 class TestStatisticsPlotFunctions(TestCase):
@@ -121,6 +129,93 @@ class TestHighchartsOptions(TestCase):
         self.assertIn('OK', [s['name'] for s in plot['series']])
 
 
+class TestStatisticsAggregates(TestCase):
+    fixtures = ['test_users', 'test_contest', 'test_full_package',
+            'test_problem_instance', 'test_submission', 'test_extra_rounds']
+
+    def setUp(self):
+        self.request = RequestFactory().request()
+        self.request.user = User.objects.get(username='test_admin')
+        self.request.contest = Contest.objects.get()
+        self.request.timestamp = datetime.now().replace(tzinfo=utc)
+
+    def _plots(self):
+        contest = Contest.objects.get()
+        pi = ProblemInstance.objects.get(short_name='zad1')
+        return [points_histogram_contest(self.request, contest),
+                points_histogram_problem(self.request, pi),
+                submissions_histogram_contest(self.request, contest),
+                test_scores(self.request, pi)]
+
+    def _fallback_plots(self):
+        StatisticsAggregatesState.objects.update(is_ready=False)
+        try:
+            return self._plots()
+        finally:
+            StatisticsAggregatesState.objects.update(is_ready=True)
+
+    def test_backfill(self):
+        contest = Contest.objects.get()
+        expected = self._plots()
+        self.assertFalse(aggregates_ready(contest))
+
+        call_command('backfill_statistics', contest.id, verbosity=0)
+        self.assertTrue(aggregates_ready(contest))
+        self.assertEqual(self._plots(), expected)
+
+    def test_updates(self):
+        call_command('backfill_statistics', verbosity=0)
+
+        result = UserResultForContest.objects.all()[0]
+        result.score = IntegerScore(50)
+        result.save()
+        UserResultForProblem.objects.filter(
+                problem_instance__short_name='zad1')[0].delete()
+        submission = Submission.objects.filter(kind='NORMAL')[0]
+        submission.status = 'IGN'
+        submission.save()
+
+        self.assertEqual(self._plots(), self._fallback_plots())
+
+    def test_subclass_updates(self):
+        call_command('backfill_statistics', verbosity=0)
+
+        submission = ProgramSubmission.objects.filter(kind='NORMAL')[0]
+        submission.status = 'IGN'
+        submission.save()
+
+        self.assertEqual(self._plots(), self._fallback_plots())
+
+    def test_bulk_updates(self):
+        call_command('backfill_statistics', verbosity=0)
+
+        contest = Contest.objects.get()
+        UserResultForProblem.objects.all().delete()
+        UserResultForContest.objects.all().delete()
+        contest.controller.update_many_user_results(
+                list(User.objects.all()), list(ProblemInstance.objects.all()))
+        self.assertEqual(self._plots(), self._fallback_plots())
+
+        submissions = Submission.objects.filter(kind='NORMAL', status='OK')
+        pre_queryset_update.send(sender=Submission, queryset=submissions,
+                                 values={'status': 'IGN'})
+        submissions.update(status='IGN')
+        self.assertEqual(self._plots(), self._fallback_plots())
+
+    def test_receivers_scope(self):
+        self.assertTrue(post_delete.has_listeners(ProgramSubmission))
+        self.assertFalse(pre_delete.has_listeners(TestReport))
+        self.assertFalse(post_delete.has_listeners(TestReport))
+        # Loading instances doesn't run any receivers
+        self.assertFalse(post_init.has_listeners(ProgramSubmission))
+        self.assertFalse(post_init.has_listeners(UserResultForProblem))
+
+    def test_new_contest(self):
+        contest = Contest.objects.create(id='new', name='New contest',
+                controller_name=Contest.objects.get().controller_name)
+        self.assertTrue(aggregates_ready(contest))
+
+
 class TestStatisticsViews(TestCase):
     fixtures = ['test_users', 'test_contest', 'test_full_package',
             'test_problem_instance', 'test_submission', 'test_extra_rounds']
@@ -21,8 +21,7 @@ class UserListFilter(SimpleListFilter):
 
     def lookups(self, request, model_admin):
         users = list(set(QueuedSubmit.objects
-                         .filter(submission__problem_instance__contest=
-                                 request.contest)
+                         .filter(contest=request.contest)
                          .values_list('submission__user__id',
                                       'submission__user__username')))
         if (None, None) in users:
@@ -47,8 +46,7 @@ class ProblemNameListFilter(SimpleListFilter):
     def lookups(self, request, model_admin):
         # Unique problem names
         p_names = list(set(QueuedSubmit.objects
-                           .filter(submission__problem_instance__contest=
-                                   request.contest)
+                           .filter(contest=request.contest)
                            .values_list(
                                'submission__problem_instance__problem__name',
                                flat=True)))
@@ -135,9 +133,7 @@ class SystemSubmitsQueueAdmin(admin.ModelAdmin):
 
     @transaction.atomic
     def remove_from_queue(self, request, queryset):
-        for obj in queryset:
-            obj.state = 'CANCELLED'
-            obj.save()
+        queryset.update(state='CANCELLED')
     remove_from_queue.short_description = \
         _("Remove selected submissions from the queue")
 
@@ -184,7 +180,7 @@ class ContestSubmitsQueueAdmin(SystemSubmitsQueueAdmin):
 
     def get_queryset(self, request):
         qs = super(ContestSubmitsQueueAdmin, self).get_queryset(request)
-        return qs.filter(submission__problem_instance__contest=request.contest)
+        return qs.filter(contest=request.contest)
 
 
 contest_site.contest_register(ContestQueuedSubmit, ContestSubmitsQueueAdmin)
@@ -1,5 +1,5 @@
 from oioioi.programs.controllers import ProgrammingContestController
-from oioioi.submitsqueue.models import QueuedSubmit
+from oioioi.submitsqueue.models import QueuedSubmit, remove_from_queue
 
 
 class SubmitsQueueContestControllerMixin(object):
@@ -24,13 +24,15 @@ class SubmitsQueueContestControllerMixin(object):
         super(SubmitsQueueContestControllerMixin, self).\
             submission_queued(submission, async_result)
         QueuedSubmit.objects.get_or_create(submission=submission,
-                                           celery_task_id=async_result.id)
+                celery_task_id=async_result.id,
+                defaults={'contest_id':
+                          submission.problem_instance.contest_id})
 
     def submission_unqueued(self, submission, job_id):
         super(SubmitsQueueContestControllerMixin, self).\
             submission_unqueued(submission, job_id)
-        QueuedSubmit.objects.filter(submission=submission,
-                                    celery_task_id=job_id).delete()
+        remove_from_queue(QueuedSubmit.objects.filter(submission=submission,
+                                                      celery_task_id=job_id))
 
 
 ProgrammingContestController.mix_in(SubmitsQueueContestControllerMixin)
@@ -1,22 +1,36 @@
 from celery.exceptions import Ignore
 from django.db import transaction
+from django.db.models import DateTimeField, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
 
-from oioioi.submitsqueue.models import QueuedSubmit
-from oioioi.contests.models import Submission
+from oioioi.submitsqueue.models import QueuedSubmit, remove_from_queue
 
 
 def mark_submission_state(env, state='PROGRESS', **kwargs):
+    update = {'state': state}
+    if state == 'PROGRESS':
+        update['judging_start_date'] = Coalesce('judging_start_date',
+                Value(timezone.now(), output_field=DateTimeField()))
+    # The entry usually exists already, so it's updated with a single query.
+    if QueuedSubmit.objects.filter(celery_task_id=env['job_id']) \
+            .exclude(state='CANCELLED').update(**update):
+        return env
+
     ignore = False
     with transaction.atomic():
-        submission = Submission.objects.get(id=env['submission_id'])
         qs, _created = QueuedSubmit.objects.get_or_create(
-                submission=submission, celery_task_id=env['job_id'])
+                submission_id=env['submission_id'],
+                celery_task_id=env['job_id'],
+                defaults={'contest_id': env.get('contest_id')})
 
         if qs.state == 'CANCELLED':
             qs.delete()
             ignore = True
         else:
             qs.state = state
+            if state == 'PROGRESS' and qs.judging_start_date is None:
+                qs.judging_start_date = timezone.now()
             qs.save()
     if ignore:
         raise Ignore
@@ -25,16 +39,13 @@ def mark_submission_state(env, state='PROGRESS', **kwargs):
 
 @transaction.atomic
 def update_celery_task_id(env, **kwargs):
-    try:
-        qs = QueuedSubmit.objects.get(celery_task_id=env['job_id'])
-        qs.celery_task_id = kwargs['async_result'].id
-        qs.save()
-    except QueuedSubmit.DoesNotExist:
-        pass    # Submission already judged.
+    QueuedSubmit.objects.filter(celery_task_id=env['job_id']) \
+            .update(celery_task_id=kwargs['async_result'].id)
     return env
 
 
 @transaction.atomic
 def remove_submission_on_error(env, **kwargs):
-    QueuedSubmit.objects.filter(celery_task_id=env['job_id']).delete()
+    remove_from_queue(QueuedSubmit.objects.filter(
+            celery_task_id=env['job_id']))
     return env
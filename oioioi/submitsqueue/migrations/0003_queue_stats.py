@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+def fill_contests(apps, schema_editor):
+    QueuedSubmit = apps.get_model('submitsqueue', 'QueuedSubmit')
+    for qs in QueuedSubmit.objects.select_related(
+            'submission__problem_instance'):
+        qs.contest_id = qs.submission.problem_instance.contest_id
+        qs.save()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contests', '0007_auto_20161214_1411'),
+        ('submitsqueue', '0002_auto_20161214_1411'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='queuedsubmit',
+            name='contest',
+            field=models.ForeignKey(blank=True, to='contests.Contest', null=True),
+        ),
+        migrations.AddField(
+            model_name='queuedsubmit',
+            name='judging_start_date',
+            field=models.DateTimeField(null=True, blank=True),
+        ),
+        migrations.AlterIndexTogether(
+            name='queuedsubmit',
+            index_together=set([('state', 'creation_date'), ('contest', 'state')]),
+        ),
+        migrations.CreateModel(
+            name='JudgedQueuedSubmit',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('creation_date', models.DateTimeField()),
+                ('judging_start_date', models.DateTimeField(null=True, blank=True)),
+                ('finish_date', models.DateTimeField(default=django.utils.timezone.now, db_index=True)),
+                ('contest', models.ForeignKey(blank=True, to='contests.Contest', null=True)),
+            ],
+        ),
+        migrations.RunPython(fill_contests, migrations.RunPython.noop),
+    ]
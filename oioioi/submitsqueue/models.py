@@ -1,8 +1,11 @@
+from datetime import timedelta
+
+from django.conf import settings
 from django.db import models
 from django.utils import timezone
 from django.utils.translation import ugettext_lazy as _
 
-from oioioi.contests.models import Submission
+from oioioi.contests.models import Contest, Submission
 from oioioi.base.fields import EnumRegistry, EnumField
 
 
@@ -16,8 +19,12 @@ submission_states.register('WAITING', _("Waiting"))
 
 class QueuedSubmit(models.Model):
     submission = models.ForeignKey(Submission)
+    # Copied from the submission, so that the queue of a contest may be
+    # filtered and counted without joins.
+    contest = models.ForeignKey(Contest, null=True, blank=True)
     state = EnumField(submission_states, default='QUEUED')
     creation_date = models.DateTimeField(default=timezone.now)
+    judging_start_date = models.DateTimeField(null=True, blank=True)
     celery_task_id = models.CharField(max_length=50, unique=True, null=True,
                                       blank=True)
 
@@ -27,3 +34,34 @@ class QueuedSubmit(models.Model):
         verbose_name = _("Queued submission")
         verbose_name_plural = _("Queued submissions")
         ordering = ['pk']
+        index_together = [('state', 'creation_date'), ('contest', 'state')]
+
+
+class JudgedQueuedSubmit(models.Model):
+    """A submission which has left the evaluation queue. These are kept
+       for the longest of ``settings.SUBMITSQUEUE_STATS_WINDOWS`` to compute
+       the statistics of the queue (see
+       :func:`oioioi.submitsqueue.utils.get_queue_stats`).
+    """
+    contest = models.ForeignKey(Contest, null=True, blank=True)
+    creation_date = models.DateTimeField()
+    judging_start_date = models.DateTimeField(null=True, blank=True)
+    finish_date = models.DateTimeField(default=timezone.now, db_index=True)
+
+
+def remove_from_queue(queryset):
+    """Removes the given :class:`QueuedSubmit` entries, recording them
+       for the statistics.
+    """
+    now = timezone.now()
+    JudgedQueuedSubmit.objects.bulk_create([
+            JudgedQueuedSubmit(contest_id=contest_id,
+                               creation_date=creation_date,
+                               judging_start_date=judging_start_date,
+                               finish_date=now)
+            for contest_id, creation_date, judging_start_date
+            in queryset.values_list('contest_id', 'creation_date',
+                                    'judging_start_date')])
+    queryset.delete()
+    JudgedQueuedSubmit.objects.filter(finish_date__lt=now - timedelta(
+            seconds=max(settings.SUBMITSQUEUE_STATS_WINDOWS))).delete()
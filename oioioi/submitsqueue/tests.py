@@ -1,8 +1,12 @@
+import json
+from datetime import timedelta
+
 from django.core.urlresolvers import reverse
+from django.utils import timezone
 from celery.exceptions import Ignore
 
 from oioioi.base.tests import TestCase
-from oioioi.submitsqueue.models import QueuedSubmit
+from oioioi.submitsqueue.models import QueuedSubmit, JudgedQueuedSubmit
 from oioioi.submitsqueue.handlers import mark_submission_state
 from oioioi.contests.models import Submission, Contest
 from oioioi.programs.controllers import ProgrammingContestController
@@ -99,3 +103,52 @@ class TestEval(TestCase):
 
         with self.assertRaises(Ignore):
             mark_submission_state(env, state='PROGRESS')
+
+    def test_mark_state(self):
+        submission = Submission.objects.get(pk=1)
+        QueuedSubmit(submission=submission, state='QUEUED',
+                     celery_task_id='dummy').save()
+        env = {'job_id': 'dummy', 'submission_id': 1}
+        mark_submission_state(env, state='PROGRESS')
+        qs = QueuedSubmit.objects.get()
+        self.assertEqual(qs.state, 'PROGRESS')
+        self.assertIsNotNone(qs.judging_start_date)
+
+        mark_submission_state(env, state='WAITING')
+        qs = QueuedSubmit.objects.get()
+        self.assertEqual(qs.state, 'WAITING')
+
+    def test_mark_state_without_entry(self):
+        env = {'job_id': 'dummy', 'submission_id': 1, 'contest_id': 'c'}
+        mark_submission_state(env, state='PROGRESS')
+        qs = QueuedSubmit.objects.get()
+        self.assertEqual(qs.state, 'PROGRESS')
+        self.assertEqual(qs.contest_id, 'c')
+
+
+class TestQueueStats(TestCase):
+    fixtures = ['test_users', 'test_contest', 'test_full_package',
+                'test_problem_instance', 'test_submission']
+
+    def test_stats_view(self):
+        now = timezone.now()
+        submission = Submission.objects.get(pk=1)
+        QueuedSubmit(submission=submission, contest_id='c', state='QUEUED',
+                     celery_task_id='dummy').save()
+        JudgedQueuedSubmit(contest_id='c',
+                           creation_date=now - timedelta(seconds=40),
+                           judging_start_date=now - timedelta(seconds=30),
+                           finish_date=now).save()
+
+        url = reverse('submitsqueue_stats')
+        self.client.login(username='test_user')
+        self.assertEqual(self.client.get(url).status_code, 403)
+
+        self.client.login(username='test_admin')
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        stats = json.loads(response.content)
+        self.assertEqual(stats['depth'], {'QUEUED': 1})
+        self.assertEqual(stats['contests'], {'c': {'QUEUED': 1}})
+        self.assertEqual(stats['windows'][0]['judged'], 1)
+        self.assertAlmostEqual(stats['windows'][0]['average_wait'], 10)
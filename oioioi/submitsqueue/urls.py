@@ -0,0 +1,6 @@
+from django.conf.urls import patterns, url
+
+noncontest_patterns = patterns('oioioi.submitsqueue.views',
+    url(r'^submitsqueue/stats/$', 'queue_stats_view',
+        name='submitsqueue_stats'),
+)
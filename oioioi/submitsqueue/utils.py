@@ -0,0 +1,64 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Count, Min
+
+from oioioi.submitsqueue.models import QueuedSubmit, JudgedQueuedSubmit
+
+
+def _average_wait(entries):
+    waits = [(judging_start_date - creation_date).total_seconds()
+             for creation_date, judging_start_date in entries
+             if judging_start_date is not None]
+    if not waits:
+        return None
+    return sum(waits) / len(waits)
+
+
+def get_queue_stats(now):
+    """Returns the current state of the evaluation queue as a dictionary
+       with keys:
+
+         * ``depth``: the number of submissions in every state,
+         * ``contests``: the number of submissions of every contest (``None``
+           for submissions outside contests) in every state,
+         * ``oldest_queued``: age (in seconds) of the oldest submission
+           waiting in the queue, or ``None``,
+         * ``windows``: a list of statistics of the submissions which have
+           left the queue during each of ``settings.SUBMITSQUEUE_STATS_WINDOWS``
+           (the number of such submissions, the throughput per minute and
+           the average time spent in the queue before judging started).
+
+       All these queries use the indexes of the queue tables.
+    """
+    counters = QueuedSubmit.objects.exclude(state='CANCELLED') \
+        .values_list('contest_id', 'state').annotate(count=Count('id')) \
+        .order_by()
+    depth = {}
+    contests = {}
+    for contest_id, state, count in counters:
+        depth[state] = depth.get(state, 0) + count
+        contests.setdefault(contest_id, {})[state] = count
+
+    oldest = QueuedSubmit.objects.filter(state='QUEUED') \
+        .aggregate(oldest=Min('creation_date'))['oldest']
+
+    windows = []
+    for window in sorted(settings.SUBMITSQUEUE_STATS_WINDOWS):
+        judged = list(JudgedQueuedSubmit.objects
+                      .filter(finish_date__gte=now - timedelta(seconds=window))
+                      .values_list('creation_date', 'judging_start_date'))
+        windows.append({
+            'window': window,
+            'judged': len(judged),
+            'throughput': len(judged) * 60. / window,
+            'average_wait': _average_wait(judged),
+        })
+
+    return {
+        'depth': depth,
+        'contests': contests,
+        'oldest_queued':
+            (now - oldest).total_seconds() if oldest is not None else None,
+        'windows': windows,
+    }
@@ -0,0 +1,12 @@
+from oioioi.base.permissions import enforce_condition, is_superuser
+from oioioi.base.utils import jsonify
+from oioioi.submitsqueue.utils import get_queue_stats
+
+
+@enforce_condition(is_superuser)
+@jsonify
+def queue_stats_view(request):
+    """Reports the state of the evaluation queue in JSON, e.g. for
+       scaling the number of judging machines.
+    """
+    return get_queue_stats(request.timestamp)
@@ -1,9 +1,11 @@
 from django.db import models
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
 from django.contrib.auth.models import User
 from django.utils.translation import ugettext_lazy as _
 from oioioi.base.utils.deps import check_django_app_dependencies
 from oioioi.base.utils import generate_key
-from oioioi.contests.models import Contest
+from oioioi.contests.models import Contest, invalidate_visible_contests
 
 check_django_app_dependencies(__name__, ['oioioi.participants'])
 
@@ -33,6 +35,14 @@ class ContestTeacher(models.Model):
         return u'%s/%s' % (self.contest_id, self.teacher.user)
 
 
+@receiver(post_save, sender=Teacher)
+@receiver(post_delete, sender=Teacher)
+@receiver(post_save, sender=ContestTeacher)
+@receiver(post_delete, sender=ContestTeacher)
+def _invalidate_visible_contests(sender, **kwargs):
+    invalidate_visible_contests()
+
+
 class RegistrationConfig(models.Model):
     contest = models.OneToOneField(Contest, primary_key=True)
     is_active_pupil = models.BooleanField(default=True)
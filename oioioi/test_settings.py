@@ -1,5 +1,6 @@
 # pylint: disable=wildcard-import
 from oioioi.default_settings import *
+import tempfile
 
 TIME_ZONE = 'UTC'
 
@@ -92,8 +93,10 @@ COMPRESS_ENABLED = False
 COMPRESS_PRECOMPILERS = ()
 CELERY_ALWAYS_EAGER = True
 SIOWORKERS_BACKEND = 'oioioi.sioworkers.backends.LocalBackend'
-FILETRACKER_CLIENT_FACTORY = 'filetracker.dummy.DummyClient'
+FILETRACKER_CLIENT_FACTORY = 'oioioi.filetracker.client.dummy_factory'
 FILETRACKER_URL = None
+# Files in the dummy Filetracker do not outlive the tests
+STATEMENT_ZIP_CACHE_DIR = tempfile.mkdtemp(prefix='oioioi-statements-')
 USE_UNSAFE_EXEC = True
 USE_LOCAL_COMPILERS = True
 USE_UNSAFE_CHECKER = True